@@ -1,14 +1,18 @@
-import mimeparse
-
 from django.contrib.auth.models import AnonymousUser
 
+from hyperadmin.links import BoundLinkPrototypes
+from hyperadmin.permissions import PermissionCache
 from hyperadmin.states import State
+from hyperadmin.timings import PhaseTimer, NULL_PHASE
 
 
 class APIRequest(object):
     """
     An API Request
     """
+    permission_cache_class = PermissionCache
+    timer_class = PhaseTimer
+
     def __init__(self, site, path, url_args, url_kwargs, global_state=None):
         self.site = site
         self.path = path
@@ -25,6 +29,7 @@ class APIRequest(object):
         self.endpoint_state['link_prototypes'] = dict()
         if global_state is not None:
             self.session_state.update(global_state)
+        self._timer = None
         super(APIRequest, self).__init__()
 
     def get_django_request(self):
@@ -45,10 +50,7 @@ class APIRequest(object):
         :rtype: string
         """
         val = self.META.get('HTTP_ACCEPT', self.META.get('CONTENT_TYPE', ''))
-        media_types = self.media_types.keys()
-        if not media_types:
-            return val
-        return mimeparse.best_match(media_types, val) or val
+        return self.get_site().negotiate_media_type(val) or val
 
     def get_request_type(self):
         """
@@ -57,10 +59,7 @@ class APIRequest(object):
         :rtype: string
         """
         val = self.META.get('CONTENT_TYPE', self.META.get('HTTP_ACCEPT', ''))
-        media_types = self.media_types.keys()
-        if not media_types:
-            return val
-        return mimeparse.best_match(media_types, val) or val
+        return self.get_site().negotiate_media_type(val) or val
 
     def get_request_media_type(self):
         """
@@ -99,11 +98,27 @@ class APIRequest(object):
         """
         if urlname not in self.endpoint_state['endpoints']:
             endpoint = self.site.get_endpoint_from_urlname(urlname)
-            bound_endpoint = endpoint.fork(api_request=self)
+            bound_endpoint = self.bind_endpoint(endpoint)
             if bound_endpoint != self.endpoint_state['endpoints'][urlname]:
                 pass
         return self.endpoint_state['endpoints'][urlname]
 
+    def bind_endpoint(self, endpoint):
+        """
+        Returns a copy of the endpoint bound to this api request.
+        Sites that compile their endpoints bind without reconstructing
+        the endpoint, otherwise the endpoint is forked.
+
+        :param endpoint: Endpoint
+        :rtype: Endpoint
+        """
+        site = self.site.get_unbound_endpoint() or self.site
+        if not site.compile_endpoints:
+            return endpoint.fork(api_request=self)
+        if not site.is_compiled():
+            site.compile()
+        return endpoint.bind(api_request=self)
+
     def record_endpoint(self, endpoint):
         """
         Record the endpoint in our urlname cache
@@ -127,7 +142,11 @@ class APIRequest(object):
         """
         urlname = endpoint.get_url_name()
         if urlname not in self.endpoint_state['link_prototypes']:
-            link_prototypes = endpoint.create_link_prototypes()
+            shared_prototypes = self.site.get_shared_link_prototypes(urlname)
+            if shared_prototypes is None:
+                link_prototypes = endpoint.create_link_prototypes()
+            else:
+                link_prototypes = BoundLinkPrototypes(shared_prototypes, endpoint)
             self.endpoint_state['link_prototypes'][urlname] = link_prototypes
         return self.endpoint_state['link_prototypes'][urlname]
 
@@ -138,7 +157,7 @@ class APIRequest(object):
         :rtype: SiteResource
         """
         if 'site' not in self.endpoint_state:
-            bound_site = self.site.fork(api_request=self)
+            bound_site = self.bind_endpoint(self.site)
             self.endpoint_state['site'] = bound_site
         return self.endpoint_state['site']
 
@@ -152,7 +171,8 @@ class APIRequest(object):
         """
         media_type = self.get_response_media_type()
         response_type = self.get_response_type()
-        return media_type.serialize(content_type=response_type, link=link, state=state)
+        with self.time_phase('serialize'):
+            return media_type.serialize(content_type=response_type, link=link, state=state)
 
     def generate_options_response(self, links, state):
         """
@@ -164,11 +184,54 @@ class APIRequest(object):
         """
         media_type = self.get_response_media_type()
         response_type = self.get_response_type()
-        return media_type.options_serialize(content_type=response_type, links=links, state=state)
+        with self.time_phase('serialize'):
+            return media_type.options_serialize(content_type=response_type, links=links, state=state)
 
     def reverse(self, name, *args, **kwargs):
         return self.get_site().reverse(name, *args, **kwargs)
 
+    def get_permission_cache(self):
+        """
+        Returns the permission cache of the requesting user, a new cache is
+        started whenever the user changes
+
+        :rtype: PermissionCache
+        """
+        user = self.user
+        cache = getattr(self, '_permission_cache', None)
+        if cache is None or cache.user is not user:
+            cache = self._permission_cache = self.permission_cache_class(user)
+        return cache
+
+    def has_perm(self, perm, obj=None):
+        """
+        Returns True if the user has the permission, results are memoized
+        for the lifetime of the request
+        """
+        return self.get_permission_cache().has_perm(perm, obj)
+
+    def start_timer(self):
+        """
+        Starts timing the phases of this request if the site has timing enabled
+
+        :rtype: PhaseTimer or None
+        """
+        if self._timer is None and self.site.is_timing_enabled():
+            self._timer = self.timer_class()
+        return self._timer
+
+    def get_timer(self):
+        return self._timer
+
+    def time_phase(self, name):
+        """
+        Returns a context manager that times the named phase
+        """
+        timer = self.get_timer()
+        if timer is None:
+            return NULL_PHASE
+        return timer.phase(name)
+
 class InternalAPIRequest(APIRequest):
     """
     An Internal API Request
@@ -282,7 +345,7 @@ class NamespaceAPIRequest(InternalAPIRequest):
         kwargs.setdefault('full_path', self.original_api_request.get_full_path())
         kwargs.setdefault('site', api_request.site)
         super(NamespaceAPIRequest, self).__init__(**kwargs)
-        self.site = api_request.site.fork(api_request=self)
+        self.site = self.bind_endpoint(api_request.site)
         self.session_state = State(substates=[api_request.session_state])
 
     @property
@@ -292,6 +355,12 @@ class NamespaceAPIRequest(InternalAPIRequest):
     def get_django_request(self):
         return self.original_api_request.get_django_request()
 
+    def get_permission_cache(self):
+        return self.original_api_request.get_permission_cache()
+
+    def get_timer(self):
+        return self.original_api_request.get_timer()
+
 
 class Namespace(object):
     """
@@ -301,11 +370,12 @@ class Namespace(object):
     """
     def __init__(self, name, endpoint, state_data={}):
         self.name = name
-        self.api_request = NamespaceAPIRequest(endpoint.api_request)
-        self.state_data = state_data
-        self.endpoint = endpoint.fork(api_request=self.api_request)
-        self.endpoint.state.update(state_data)
-        self.api_request.endpoint_state['endpoints'][self.endpoint.get_url_name()] = self.endpoint
+        with endpoint.api_request.time_phase('namespace'):
+            self.api_request = NamespaceAPIRequest(endpoint.api_request)
+            self.state_data = state_data
+            self.endpoint = self.api_request.bind_endpoint(endpoint)
+            self.endpoint.state.update(state_data)
+            self.api_request.endpoint_state['endpoints'][self.endpoint.get_url_name()] = self.endpoint
 
     def get_namespaces(self):
         return dict()
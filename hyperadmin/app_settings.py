@@ -7,3 +7,7 @@ path, classname = path.rsplit('.', 1)
 
 DEFAULT_API_REQUEST_CLASS = getattr(import_module(path), classname)
 
+
+SERVER_TIMING = getattr(settings, 'HYPERADMIN_SERVER_TIMING', False)
+
+TIMING_COLLECTOR = getattr(settings, 'HYPERADMIN_TIMING_COLLECTOR', None)
@@ -0,0 +1,47 @@
+try:
+    from collections import OrderedDict
+except ImportError:
+    #python 2.6
+    from django.utils.datastructures import SortedDict as OrderedDict
+from threading import Lock
+
+
+class LRUCache(object):
+    """
+    A bounded in process cache that evicts the least recently used entry
+    """
+    def __init__(self, max_size=128):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self.entries[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            while len(self.entries) > self.max_size:
+                #SortedDict.popitem does not take last
+                del self.entries[iter(self.entries).next()]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
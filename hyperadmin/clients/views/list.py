@@ -36,7 +36,7 @@ class ListView(MultipleObjectMixin, ClientMixin, TemplateView):
         #TODO absorb in index api
         context = super(ListView, self).get_context_data(**kwargs)
         links = self.get_state().get_index_queries()
-        context['pagination_links'] = [link for link in links if link.rel == 'pagination']
+        context['pagination_links'] = [link for link in links if link.cl_headers.get('group', None) == 'pagination']
         filter_links = dict()
         #TODO ignore filter links for params that are set
         for link in links :
@@ -51,10 +51,16 @@ class ResourceTestCase(unittest.TestCase):
             return ret
         
         self.site.fork = fork
+        self._original_request_reverse = NamespaceAPIRequest.reverse
+        self._original_root_reverse = RootEndpoint.reverse
         NamespaceAPIRequest.reverse = cls_reverse
         RootEndpoint.reverse = cls_reverse
         self.site.reverse = reverse
     
+    def tearDown(self):
+        NamespaceAPIRequest.reverse = self._original_request_reverse
+        RootEndpoint.reverse = self._original_root_reverse
+    
     def get_api_request(self, **kwargs):
         kwargs.setdefault('site', self.site)
         #kwargs.setdefault('user', self.user)
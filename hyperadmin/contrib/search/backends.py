@@ -0,0 +1,63 @@
+from django.db import connections
+from django.db.models.query import QuerySet
+
+from hyperadmin.resources.models.search import IndexedSearchBackend, get_terms
+from hyperadmin.contrib.search.models import SearchTerm
+
+#django < 1.4 creates the terms one at a time
+BULK_CREATE = hasattr(QuerySet, 'bulk_create')
+
+class TableSearchBackend(IndexedSearchBackend):
+    """
+    Searches the words of the objects kept in the `SearchTerm` table, the
+    words of the query match the indexed words starting with them. Existing
+    objects are indexed with `rebuild`, models need integer primary keys.
+    """
+    def get_term_queryset(self, using):
+        return SearchTerm.objects.using(using).filter(index_key=self.get_index_key())
+    
+    def get_term_frequencies(self, instance):
+        max_length = SearchTerm._meta.get_field('term').max_length
+        frequencies = dict()
+        for term in get_terms(self.get_document(instance)):
+            term = term[:max_length]
+            frequencies[term] = frequencies.get(term, 0) + 1
+        return frequencies
+    
+    def index_object(self, instance, using):
+        self.unindex_object(instance.pk, using)
+        index_key = self.get_index_key()
+        terms = [SearchTerm(index_key=index_key, object_id=instance.pk, term=term, frequency=frequency)
+                 for term, frequency in self.get_term_frequencies(instance).iteritems()]
+        if BULK_CREATE:
+            SearchTerm.objects.using(using).bulk_create(terms)
+        else:
+            for term in terms:
+                term.save(using=using)
+    
+    def unindex_object(self, pk, using):
+        self.get_term_queryset(using).filter(object_id=pk).delete()
+    
+    def filter(self, queryset, query):
+        for term in get_terms(query):
+            object_ids = self.get_term_queryset(queryset.db).filter(term__startswith=term).values('object_id')
+            queryset = queryset.filter(pk__in=object_ids)
+        return queryset
+    
+    def escape_like(self, term):
+        return term.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+    
+    def order_by_relevance(self, queryset, query):
+        '''
+        Orders the objects by the number of occurrences of the query words
+        '''
+        terms = get_terms(query)
+        if not terms:
+            return queryset
+        qn = connections[queryset.db].ops.quote_name
+        likes = ' OR '.join(["%s LIKE %%s ESCAPE '!'" % qn('term')] * len(terms))
+        rank = '(SELECT SUM(%s) FROM %s WHERE %s = %%s AND %s = %s AND (%s))' % (
+            qn('frequency'), qn(SearchTerm._meta.db_table), qn('index_key'),
+            qn('object_id'), self.get_pk_column(queryset), likes)
+        params = [self.get_index_key()] + [self.escape_like(term) + '%' for term in terms]
+        return queryset.extra(select={'search_rank': rank}, select_params=params, order_by=['-search_rank'])
@@ -0,0 +1,36 @@
+from optparse import make_option
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.importlib import import_module
+
+from hyperadmin import autodiscover
+from hyperadmin.resources.models.search import get_search_backends
+
+
+class Command(BaseCommand):
+    help = 'Creates and fills the indexes of the search backends used by the registered resources.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--database', action='store', dest='database', default=DEFAULT_DB_ALIAS,
+            help='Nominates the database to index. Defaults to the "default" database.'),
+    )
+
+    def handle(self, **options):
+        using = options.get('database')
+        verbosity = int(options.get('verbosity', 1))
+        #resources are registered by the resources modules and the url conf
+        autodiscover()
+        import_module(settings.ROOT_URLCONF)
+        for backend in get_search_backends():
+            if not backend.indexes_objects:
+                continue
+            try:
+                backend.prepare(using)
+            except ImproperlyConfigured, error:
+                raise CommandError(error)
+            backend.rebuild(using)
+            if verbosity >= 1:
+                self.stdout.write('Indexed %s.%s with %s\n' % (backend.opts.app_label, backend.opts.object_name, type(backend).__name__))
@@ -0,0 +1,23 @@
+from django.db import models
+from django.db.models.options import DEFAULT_NAMES
+
+
+#index_together is available from django 1.5
+INDEX_TOGETHER = 'index_together' in DEFAULT_NAMES
+
+
+class SearchTerm(models.Model):
+    '''
+    A word of the search document of an object
+    '''
+    index_key = models.CharField(max_length=12, db_index=not INDEX_TOGETHER)
+    object_id = models.IntegerField()
+    term = models.CharField(max_length=100)
+    frequency = models.PositiveIntegerField(default=1)
+    
+    class Meta:
+        if INDEX_TOGETHER:
+            index_together = [('index_key', 'term'), ('index_key', 'object_id')]
+    
+    def __unicode__(self):
+        return self.term
@@ -0,0 +1,57 @@
+from django.utils import unittest
+from django.contrib.auth.models import User
+
+from hyperadmin.contrib.search.backends import TableSearchBackend
+from hyperadmin.contrib.search.models import SearchTerm
+
+from mock import patch
+
+
+class TableSearchBackendTestCase(unittest.TestCase):
+    def setUp(self):
+        self.backend = TableSearchBackend(User, ['username', 'last_name'])
+        self.backend.watch()
+        self.first = User.objects.create(username='tablefirst', last_name='Quokka')
+        self.second = User.objects.create(username='tablesecond', last_name='Quokka quokka 100%')
+    
+    def tearDown(self):
+        self.backend.unwatch()
+        User.objects.filter(username__startswith='table').delete()
+        SearchTerm.objects.all().delete()
+    
+    def search(self, query, relevance=False):
+        queryset = self.backend.filter(User.objects.all(), query)
+        if relevance:
+            queryset = self.backend.order_by_relevance(queryset, query)
+        return [user.username for user in queryset]
+    
+    def test_saves_are_indexed(self):
+        terms = SearchTerm.objects.filter(object_id=self.second.pk)
+        self.assertEqual(dict(terms.values_list('term', 'frequency')),
+                         {'tablesecond': 1, 'quokka': 2, '100': 1})
+        self.assertEqual(sorted(self.search('quok')), ['tablefirst', 'tablesecond'])
+        self.assertEqual(self.search('tablef quokka'), ['tablefirst'])
+        self.assertEqual(self.search('okka'), [])
+    
+    def test_saves_are_indexed_without_bulk_create(self):
+        with patch('hyperadmin.contrib.search.backends.BULK_CREATE', False):
+            self.first.last_name = 'Wombat'
+            self.first.save()
+        self.assertEqual(self.search('wombat'), ['tablefirst'])
+        self.assertEqual(self.search('quokka'), ['tablesecond'])
+    
+    def test_deletes_are_unindexed(self):
+        pk = self.second.pk
+        self.second.delete()
+        self.assertFalse(SearchTerm.objects.filter(object_id=pk).exists())
+        self.assertEqual(self.search('quokka'), ['tablefirst'])
+    
+    def test_relevance_ordering(self):
+        self.assertEqual(self.search('quokka', relevance=True), ['tablesecond', 'tablefirst'])
+        self.assertEqual(self.search('100%', relevance=True), ['tablesecond'])
+    
+    def test_rebuild(self):
+        SearchTerm.objects.all().delete()
+        self.assertEqual(self.search('quokka'), [])
+        self.backend.rebuild()
+        self.assertEqual(sorted(self.search('quokka')), ['tablefirst', 'tablesecond'])
@@ -1,8 +1,69 @@
 #from django.core.files import File
+import types
 
 from hyperadmin.links import Link
 
-from datatap.datataps import DataTap
+from datatap.datataps import DataTap, JSONDataTap, ModelDataTap
+from datatap.datataps.model import FileAwareSerializer
+from datatap.encoders import DataTapJSONEncoder, DataTapJSONDecoder
+
+
+JSON_WHITESPACE = ' \t\n\r'
+
+def iter_json_array(stream, decoder, read_size):
+    '''
+    Yields the values of the JSON array read from stream as each one is
+    decoded, only the part of the payload that is not decoded yet is held.
+    A payload that is not an array is decoded whole and yielded.
+    '''
+    buf, pos = '', 0
+    exhausted = False
+    started = False
+    expect_value = True
+    while True:
+        while pos < len(buf) and buf[pos] in JSON_WHITESPACE:
+            pos += 1
+        if pos == len(buf):
+            if exhausted:
+                if pos == len(buf) and not started:
+                    return
+                raise ValueError('Unterminated JSON array at byte %s' % pos)
+            chunk = stream.read(read_size)
+            exhausted = not chunk
+            buf, pos = buf[pos:] + chunk, 0
+            continue
+        if not started:
+            if buf[pos] != '[':
+                value = decoder.decode(buf[pos:] + stream.read())
+                for item in (value if isinstance(value, list) else [value]):
+                    yield item
+                return
+            started = True
+            pos += 1
+            continue
+        if buf[pos] == ']':
+            return
+        if not expect_value:
+            if buf[pos] != ',':
+                raise ValueError('Expected a comma at byte %s' % pos)
+            expect_value = True
+            pos += 1
+            continue
+        try:
+            value, end = decoder.raw_decode(buf, pos)
+        except ValueError:
+            if exhausted:
+                raise
+            value, end = None, len(buf)
+        if end == len(buf) and not exhausted:
+            #decoded values are only trusted once the next character is read
+            chunk = stream.read(read_size)
+            exhausted = not chunk
+            buf, pos = buf[pos:] + chunk, 0
+            continue
+        yield value
+        pos = end
+        expect_value = False
 
 
 class HypermediaFormDataTap(DataTap):
@@ -12,7 +73,7 @@ class HypermediaFormDataTap(DataTap):
     def get_domain(self):
         if self.instream is None: #no instream, I guess we write?
             return 'deserialized_form'
-        if isinstance(self.instream, (list, tuple)):
+        if isinstance(self.instream, (list, tuple, types.GeneratorType)):
             return 'primitive'
         if self.instream.domain == 'primitive':
             return 'deserialized_form'
@@ -21,6 +82,8 @@ class HypermediaFormDataTap(DataTap):
         '''
         Convert forms to primitive objects
         '''
+        if isinstance(instream, types.GeneratorType):
+            return (self.serialize_form(item) for item in instream)
         return self.serialize_forms(instream)
 
     def serialize_forms(self, item_list):
@@ -57,3 +120,36 @@ class HypermediaFormDataTap(DataTap):
         '''
         #TODO
         return instream
+
+class StreamingModelDataTap(ModelDataTap):
+    '''
+    A model datatap that converts its sources to primitives one object at
+    a time instead of serializing every object first
+    '''
+    def get_primitive_stream(self, instream):
+        serializer = FileAwareSerializer()
+        for instance in self.get_instance_stream(instream):
+            for primitive in serializer.serialize([instance], use_natural_keys=self.use_natural_keys):
+                yield primitive
+
+class StreamingJSONDataTap(JSONDataTap):
+    '''
+    A JSON datatap that encodes the primitive stream item by item, the
+    encoder of JSONDataTap collects the stream into a list first. Arrays
+    are decoded as they are read from the instream.
+    '''
+    #bytes read from the instream at a time when decoding
+    read_size = 64 * 1024
+
+    def get_bytes_stream(self, instream):
+        encoder = DataTapJSONEncoder(filetap=self.filetap)
+        yield '['
+        separator = ''
+        for item in instream:
+            yield separator + encoder.encode(item)
+            separator = ', '
+        yield ']'
+
+    def get_primitive_stream(self, instream):
+        decoder = DataTapJSONDecoder(filetap=self.filetap)
+        return iter_json_array(instream, decoder, self.read_size)
@@ -2,18 +2,26 @@ from django.conf.urls.defaults import url, patterns, include
 from django.core.urlresolvers import reverse
 from django.views.generic import View
 from django.utils.datastructures import MultiValueDict
+from django.utils.importlib import import_module
+from django import http
 
 from hyperadmin.links import Link, LinkCollection, LinkCollectorMixin, LinkNotAvailable
-from hyperadmin.app_settings import DEFAULT_API_REQUEST_CLASS
+from hyperadmin.app_settings import DEFAULT_API_REQUEST_CLASS, SERVER_TIMING, TIMING_COLLECTOR
 from hyperadmin.apirequests import InternalAPIRequest
 from hyperadmin.hyperobjects import Item
 from hyperadmin.states import EndpointState
 from hyperadmin.views import EndpointViewMixin
 from hyperadmin.signals import endpoint_event
+from hyperadmin.urltemplates import URLTemplateTable
+from hyperadmin.caches import LRUCache
 
+from copy import copy
+from functools import update_wrapper
 import logging
 import urlparse
 
+import mimeparse
+
 
 class BaseEndpoint(LinkCollectorMixin, View):
     """
@@ -290,6 +298,42 @@ class BaseEndpoint(LinkCollectorMixin, View):
         params.update(kwargs)
         return type(self)(**params)
 
+    def bind(self, api_request):
+        """
+        Returns a copy of the compiled endpoint bound to the api request.
+        Unlike `fork` the endpoint is not reconstructed; registration is
+        skipped and the compiled endpoint graph is shared.
+
+        :rtype: endpoint
+        """
+        unbound = self.get_unbound_endpoint()
+        if unbound is None:
+            return self.fork(api_request=api_request)
+        bound = copy(unbound)
+        bound._unbound_endpoint = unbound
+        bound.api_request = api_request
+        bound.post_bind()
+        return bound
+
+    def get_unbound_endpoint(self):
+        """
+        Returns the compiled endpoint this endpoint was bound from or None
+        if the endpoint was constructed with an api request.
+
+        :rtype: endpoint
+        """
+        if not self.api_request:
+            return self
+        return getattr(self, '_unbound_endpoint', None)
+
+    def post_bind(self):
+        """
+        Called on the bound copy, replaces the per request attributes
+        """
+        self.links = self.get_link_collector()
+        self.api_request.record_endpoint(self)
+        self.register_link_prototypes()
+
     def fork_state(self, **kwargs):
         """
         :rtype: endpoint
@@ -329,6 +373,13 @@ class BaseEndpoint(LinkCollectorMixin, View):
         instances = self.get_instances()
         return [self.get_resource_item(instance) for instance in instances]
 
+    def iter_resource_items(self):
+        '''
+        Returns an iterator over the resource items of this request, media
+        types streaming their responses consume the items one at a time
+        '''
+        return iter(self.get_resource_items())
+
     def get_form_class(self):
         return self.form_class
 
@@ -439,12 +490,12 @@ class BaseEndpoint(LinkCollectorMixin, View):
         '''
         Returns a datatap that can serialize hypermedia items and deserialize to native instances
 
-        :param instream: A list of resource items or a primitive datatap
+        :param instream: A list or iterator of resource items or a primitive datatap
         '''
         if instream is None:
             #open for read; give primitives
             return self.get_native_datatap(**kwargs)
-        elif isinstance(instream, (list, tuple)):
+        elif isinstance(instream, (list, tuple)) or not hasattr(instream, 'domain'):
             #list of resource items; give primitives
             native_instream = self.get_native_datatap_instream_from_items(instream)
             return self.get_native_datatap(instream=native_instream, **kwargs)
@@ -456,6 +507,8 @@ class BaseEndpoint(LinkCollectorMixin, View):
         '''
         Makes an instream of item forms
         '''
+        if not isinstance(items, (list, tuple)):
+            return (item.form for item in items)
         return [item.form for item in items]
 
     def get_native_datatap(self, instream=None, **kwargs):
@@ -526,7 +579,7 @@ class VirtualEndpoint(BaseEndpoint):
         Calls the index endpoint and returns it's api response
         :rtype: Link or HttpResponse
         """
-        endpoint = self.get_index_endpoint().fork(api_request=api_request)
+        endpoint = api_request.bind_endpoint(self.get_index_endpoint())
         return endpoint.generate_api_response(api_request)
 
 class GlobalSiteMixin(object):
@@ -608,6 +661,29 @@ class RootEndpoint(APIRequestBuilder, VirtualEndpoint):
     template_paths = None
     '''List of template paths to use for template name resolution'''
 
+    compile_endpoints = False
+    '''If True, registered endpoints are compiled into a shared graph and
+    api requests bind to them instead of forking'''
+
+    url_templates_class = URLTemplateTable
+    '''The class used for building urls from precompiled url templates.
+    Set to None to always reverse through django.'''
+
+    negotiation_cache_size = 256
+    '''The number of content negotiation results to remember'''
+
+    resolved_urls_size = 1024
+    '''The number of resolved urls remembered for calling their endpoints
+    by url name instead of resolving them again'''
+
+    server_timing = SERVER_TIMING
+    '''If True, responses include a Server-Timing header with the time spent
+    in each phase of the api request'''
+
+    timing_collector = TIMING_COLLECTOR
+    '''A callable or dotted path to a callable that receives the phase
+    timings of every api request'''
+
     base_url_name = ''
     name_suffix = 'virtualroot'
 
@@ -615,7 +691,14 @@ class RootEndpoint(APIRequestBuilder, VirtualEndpoint):
         kwargs.setdefault('media_types', dict())
         kwargs.setdefault('namespace', str(id(self)))
         self.endpoints_by_urlname = dict()
+        self._compiled = False
+        self.url_templates = None
+        self.resolvers = dict()
+        self.negotiation_cache = LRUCache(self.negotiation_cache_size)
+        self.resolved_urls = LRUCache(self.resolved_urls_size)
         super(RootEndpoint, self).__init__(**kwargs)
+        if self.url_templates_class is not None:
+            self.url_templates = self.url_templates_class(self)
 
     @property
     def link_prototypes(self):
@@ -631,6 +714,22 @@ class RootEndpoint(APIRequestBuilder, VirtualEndpoint):
     def post_register(self):
         pass #we wrap other endpoints
 
+    def post_bind(self):
+        self.links = self.get_link_collector()
+
+    def compile(self):
+        '''
+        Freezes the url names of the registered endpoints so that bound
+        endpoints no longer walk their parents to compute them.
+        Recording a new endpoint marks the graph for recompilation.
+        '''
+        for url_name, endpoint in self.endpoints_by_urlname.iteritems():
+            endpoint.url_name = url_name
+        self._compiled = True
+
+    def is_compiled(self):
+        return self._compiled
+
     def get_site(self):
         if self.api_request:
             return self.api_request.get_site()
@@ -641,6 +740,13 @@ class RootEndpoint(APIRequestBuilder, VirtualEndpoint):
     def fork(self, **kwargs):
         ret = super(RootEndpoint, self).fork(**kwargs)
         ret.endpoints_by_urlname.update(self.endpoints_by_urlname)
+        #negotiations are keyed by the registered media types
+        ret.negotiation_cache = self.negotiation_cache
+        if set(kwargs.keys()) <= set(['api_request']):
+            #forks for an api request share our compiled urls
+            ret.url_templates = self.url_templates
+            ret.resolvers = self.resolvers
+            ret.resolved_urls = self.resolved_urls
         return ret
 
     def urls(self):
@@ -648,49 +754,150 @@ class RootEndpoint(APIRequestBuilder, VirtualEndpoint):
     urls = property(urls)
 
     def reverse(self, name, *args, **kwargs):
+        '''
+        Returns the url for the url name, built from the url templates
+        when possible
+        '''
+        url = None
+        if self.url_templates is not None and not args:
+            url = self.url_templates.reverse(name, **kwargs)
+        if url is None:
+            url = self.django_reverse(name, *args, **kwargs)
+        return url
+
+    def django_reverse(self, name, *args, **kwargs):
         return reverse('%s:%s' % (self.namespace, name), args=args, kwargs=kwargs)
 
+    def get_timing_collector(self):
+        collector = self.timing_collector
+        if isinstance(collector, basestring):
+            path, name = collector.rsplit('.', 1)
+            collector = getattr(import_module(path), name)
+        return collector
+
+    def is_timing_enabled(self):
+        return bool(self.server_timing or self.timing_collector)
+
+    def report_timings(self, api_request, endpoint, response):
+        '''
+        Emits the phase timings of the api request as a Server-Timing header
+        and passes them to the timing collector
+        '''
+        timer = api_request.get_timer()
+        if timer is None:
+            return
+        if self.server_timing and isinstance(response, http.HttpResponse):
+            response['Server-Timing'] = timer.get_server_timing()
+        collector = self.get_timing_collector()
+        if collector:
+            collector(timer.get_timings(), api_request=api_request, endpoint=endpoint, response=response)
+
     def get_resolver(self):
-        from django.core.urlresolvers import RegexURLResolver
-        #get our root url
-        starter = self.get_link().get_absolute_url()
-        return RegexURLResolver(r'^%s' % starter, self.urlpatterns)
+        '''
+        Returns the url resolver for internal api requests. Resolvers are
+        cached per script prefix and cleared when endpoints are registered.
+        '''
+        from django.core.urlresolvers import RegexURLResolver, get_script_prefix
+        script_prefix = get_script_prefix()
+        if script_prefix not in self.resolvers:
+            #get our root url
+            starter = self.get_link().get_absolute_url()
+            self.resolvers[script_prefix] = RegexURLResolver(r'^%s' % starter, self.urlpatterns)
+        return self.resolvers[script_prefix]
 
     def call_endpoint(self, url, **request_params):
         '''
-        Looks up the endpoint as an internal api request
+        Looks up the endpoint as an internal api request, urls resolved
+        before are called by their url name instead of being resolved again
         :rtype: Bound Endpoint
         '''
         url_parts = urlparse.urlparse(url)
         path = url_parts.path
+        query_params = MultiValueDict(urlparse.parse_qs(url_parts.query))
+        resolved_url = self.resolved_urls.get(path)
+        if resolved_url is not None:
+            url_name, url_kwargs = resolved_url
+            params = {
+                'path': path,
+                'full_path': url,
+                'params': query_params,
+            }
+            params.update(request_params)
+            return self.call_endpoint_by_urlname(url_name, dict(url_kwargs), **params)
         from django.core.urlresolvers import Resolver404
-        from hyperadmin.apirequests import NamespaceAPIRequest
         try:
             match = self.get_resolver().resolve(path)
         except Resolver404 as notfound:
             self.get_logger().exception('Could not resolve %s' % url)
             assert False, str(notfound)
+        if not match.args:
+            self.resolved_urls.set(path, (match.func.endpoint.get_url_name(), match.kwargs))
         params = {
             'api_request': self.api_request,
             'path': path,
             'full_path': url,
             'url_kwargs': match.kwargs,
             'url_args': match.args,
-            'params': MultiValueDict(urlparse.parse_qs(url_parts.query)),
+            'params': query_params,
         }
         params.update(request_params)
-        api_request = NamespaceAPIRequest(**params)
+        return self.bind_namespace_endpoint(match.func.endpoint, **params)
+
+    def call_endpoint_by_urlname(self, url_name, url_kwargs=None, **request_params):
+        '''
+        Looks up the endpoint registered under the url name as an internal
+        api request without resolving a url
+        :rtype: Bound Endpoint
+        '''
+        url_kwargs = url_kwargs or dict()
+        endpoint = self.get_endpoint_from_urlname(url_name)
+        path = request_params.pop('path', None) or self.reverse(url_name, **url_kwargs)
+        params = {
+            'api_request': self.api_request,
+            'path': path,
+            'full_path': path,
+            'url_kwargs': url_kwargs,
+            'url_args': [],
+            'params': MultiValueDict(),
+        }
+        params.update(request_params)
+        return self.bind_namespace_endpoint(endpoint, **params)
 
-        return match.func.endpoint.fork(api_request=api_request)
+    def bind_namespace_endpoint(self, endpoint, **params):
+        from hyperadmin.apirequests import NamespaceAPIRequest
+        api_request = NamespaceAPIRequest(**params)
+        return api_request.bind_endpoint(endpoint)
 
     def register_media_type(self, media_type, media_type_handler):
         self.media_types[media_type] = media_type_handler
+        self.negotiation_cache.clear()
+
+    def negotiate_media_type(self, header):
+        '''
+        Returns the registered media type best matching the header value or
+        an empty string. Results are memoized by the set of registered media
+        types and the header value.
+        :rtype: string
+        '''
+        if not self.media_types:
+            return ''
+        key = (frozenset(self.media_types), header)
+        match = self.negotiation_cache.get(key)
+        if match is None:
+            match = mimeparse.best_match(self.media_types.keys(), header)
+            self.negotiation_cache.set(key, match)
+        return match
 
     def record_endpoint(self, endpoint, url_name=None):
         if url_name is None:
             url_name = endpoint.get_url_name()
         if url_name not in self.endpoints_by_urlname:
             self.endpoints_by_urlname[url_name] = endpoint
+            self._compiled = False
+            self.resolvers.clear()
+            self.resolved_urls.clear()
+            if self.url_templates is not None:
+                self.url_templates.clear()
         else:
             original = self.endpoints_by_urlname[url_name]
             #self.get_logger().debug('Double registration at site level on %s by %s, original: %s' % (url_name, endpoint, original))
@@ -698,6 +905,15 @@ class RootEndpoint(APIRequestBuilder, VirtualEndpoint):
     def get_endpoint_from_urlname(self, urlname):
         return self.endpoints_by_urlname[urlname]
 
+    def get_shared_link_prototypes(self, urlname):
+        '''
+        Returns the link prototypes built at registration for the url name.
+        These are shared across api requests and bound on use.
+        '''
+        if urlname not in self.endpoints_by_urlname:
+            return None
+        return self.endpoints_by_urlname[urlname].link_prototypes
+
     def api_permission_check(self, api_request, endpoint):
         """
         Return a link describing the authentication failure or return None if the request has sufficient permissions
@@ -779,11 +995,24 @@ class Endpoint(GlobalSiteMixin, EndpointViewMixin, BaseEndpoint):
 
     def get_view(self, **kwargs):
         """
+        Returns a view dispatching to this endpoint. Requests are bound to
+        the registered endpoint instead of constructing a new endpoint per
+        request; passing kwargs builds a view around a new endpoint.
+
         :rtype: view callable
         """
-        #TODO should this be get_endpoint_kwargs?
-        params = self.get_view_kwargs(**kwargs)
-        view = type(self).as_view(**params)
+        if kwargs:
+            #TODO should this be get_endpoint_kwargs?
+            params = self.get_view_kwargs(**kwargs)
+            view = type(self).as_view(**params)
+        else:
+            endpoint = self
+
+            def view(request, *args, **kwargs):
+                return endpoint.dispatch(request, *args, **kwargs)
+
+            #take csrf_exempt and the like from dispatch
+            update_wrapper(view, type(self).dispatch, assigned=())
         #allow for retreiving the endpoint from url patterns
         view.endpoint = self
         #thus allowing us to do: myview.endpoint.get_view(**some_new_kwargs)
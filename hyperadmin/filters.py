@@ -1,3 +1,4 @@
+from django import forms
 from django.core.exceptions import ImproperlyConfigured
 from django.utils.translation import ugettext_lazy as _
 from django.utils.encoding import force_unicode
@@ -52,8 +53,25 @@ class BaseFilter(object):
             vals.append(filter_params.get(param, None))
         return vals
 
+class ChoiceSearchForm(forms.Form):
+    '''
+    A query template for filtering by a value that is typed in instead of
+    picked from the choices
+    '''
+    def __init__(self, parameter, label, **kwargs):
+        super(ChoiceSearchForm, self).__init__(**kwargs)
+        self.fields[parameter] = forms.CharField(label=label, required=False)
+
 class BaseChoicesFilter(BaseFilter):
+    #filters with more choices than this offer a search link instead of a link per choice
+    max_choices = None
+    search_form_class = ChoiceSearchForm
+    #counts of the objects matching each choice, set by indexes that compute facets
+    facet_counts = None
+    
     def get_links(self, **link_kwargs):
+        if self.has_too_many_choices():
+            return self.get_search_links(**link_kwargs)
         links = list()
         for choice in self.choices():
             kwargs = dict(link_kwargs)
@@ -65,11 +83,57 @@ class BaseChoicesFilter(BaseFilter):
             #CONSIDER prompt may want to include group if not supported
             kwargs['prompt'] = force_unicode(choice['display'])
             kwargs['url'] = u'./' + choice['query_string']
+            if choice.get('count', None) is not None:
+                kwargs['descriptors'] = {'count': choice['count']}
             links.append(self.make_link(**kwargs))
         return links
     
     def choices(self):
         return []
+    
+    def has_too_many_choices(self):
+        return False
+    
+    def get_facet_counts(self, queryset):
+        '''
+        Returns the counts of the objects of queryset matching the choices,
+        None if the filter does not count its choices
+        '''
+        return None
+    
+    def get_facet_key(self, value):
+        if value is None:
+            return None
+        return force_unicode(value)
+    
+    def get_facet_count(self, value):
+        '''
+        Returns the count of the choice looking up value, None when facets
+        are not computed
+        '''
+        if self.facet_counts is None:
+            return None
+        return self.facet_counts.get(self.get_facet_key(value), 0)
+    
+    def get_search_parameter(self):
+        '''
+        Returns the parameter filled in by the search link
+        '''
+        raise NotImplementedError
+    
+    def get_search_links(self, **link_kwargs):
+        parameter = self.get_search_parameter()
+        value = self.state.params.get(parameter, None)
+        kwargs = dict(link_kwargs)
+        kwargs['group'] = self.title
+        kwargs['classes'] = list(kwargs.get('classes', [])) + ['search']
+        if value is not None:
+            kwargs['classes'].append('selected')
+        kwargs['prompt'] = force_unicode(self.title)
+        kwargs['url'] = u'./' + self.state.get_query_string({}, self.expected_parameters())
+        kwargs['form'] = self.search_form_class(parameter=parameter, label=self.title,
+                                                initial={parameter: value})
+        return [self.make_link(**kwargs)]
 
 class SimpleFilter(BaseChoicesFilter):
     # The parameter that should be used in the query string for that filter.
@@ -1,3 +1,6 @@
+from django.core.paginator import InvalidPage
+
+
 #TODO pagination should be a mixin
 class Index(object):
     """
@@ -10,19 +13,39 @@ class Index(object):
     """
     paginator_class = None
     page_var = 'p'
+    pagination_window = 3
+    '''The number of page links around the current page, None links every page'''
     
-    def __init__(self, name, resource):
+    def __init__(self, name, resource, filter_specs=None):
         self.name = name
         self.resource = resource
-        self.filters = list()
+        self.filter_specs = list(filter_specs or [])
+        self._filters = None
     
     @property
     def state(self):
         return self.resource.state
     
+    @property
+    def filters(self):
+        '''
+        The filters of the index, they are built from the filter specs on
+        first use
+        '''
+        if self._filters is None:
+            self._filters = list()
+            for a_filter, kwargs in self.filter_specs:
+                spec = a_filter(index=self, **kwargs)
+                if spec:
+                    self._filters.append(spec)
+        return self._filters
+    
     def register_filter(self, a_filter, **kwargs):
-        kwargs['index'] = self
-        self.filters.append(a_filter(**kwargs))
+        if self._filters is None:
+            self.filter_specs.append((a_filter, kwargs))
+        else:
+            kwargs['index'] = self
+            self._filters.append(a_filter(**kwargs))
     
     def populate_state(self):
         for a_filter in self.filters:
@@ -76,23 +99,61 @@ class Index(object):
             return self.paginator_class(index, **kwargs)
         return self.resource.get_paginator(index, **kwargs)
     
+    def get_pagination_link(self, number, rel, prompt=None, classes=None, **link_kwargs):
+        kwargs = {
+            'url': self.state.get_query_string({self.page_var: number}),
+            'prompt': prompt or u"%s" % number,
+            'classes': ["pagination"] + (classes or []),
+            'rel': rel,
+        }
+        kwargs.update(link_kwargs)
+        return self.get_link(**kwargs)
+    
+    def get_page_number(self, paginator):
+        number = self.state.params.get(self.page_var, 1)
+        try:
+            if hasattr(paginator, 'validate_number'):
+                return paginator.validate_number(number)
+            return int(number)
+        except (InvalidPage, TypeError, ValueError):
+            return 1
+    
     def get_pagination_links(self, **link_kwargs):
+        """
+        Returns links to the first, previous, next and last pages and to
+        the pages within `pagination_window` of the current page
+        """
         links = list()
         if 'paginator' in self.state:
             paginator = self.state['paginator']
-            classes = ["pagination"]
-            for page in range(paginator.num_pages):
-                if page == '.':
-                    continue
-                url = self.state.get_query_string({self.page_var: page+1})
-                kwargs = {
-                    'url':url,
-                    'prompt': u"%s" % page,
-                    'classes': classes,
-                    'rel': "pagination",
-                }
-                kwargs.update(link_kwargs)
-                links.append(self.get_link(**kwargs))
+            number = self.get_page_number(paginator)
+            last = paginator.num_pages
+            if last is None:
+                has_next = self.get_page(paginator).has_next()
+            else:
+                has_next = number < last
+            
+            if self.pagination_window is None:
+                window = range(1, (last or number + int(has_next)) + 1)
+            else:
+                upper = number + self.pagination_window
+                if last is not None:
+                    upper = min(upper, last)
+                else:
+                    #without a count only the next page is known to exist
+                    upper = min(upper, number + 1 if has_next else number)
+                window = range(max(1, number - self.pagination_window), max(upper, number) + 1)
+            
+            if number > 1:
+                links.append(self.get_pagination_link(1, rel="first", prompt=u"first", **link_kwargs))
+                links.append(self.get_pagination_link(number - 1, rel="previous", prompt=u"previous", **link_kwargs))
+            for page in window:
+                classes = ["active"] if page == number else []
+                links.append(self.get_pagination_link(page, rel="pagination", classes=classes, **link_kwargs))
+            if has_next:
+                links.append(self.get_pagination_link(number + 1, rel="next", prompt=u"next", **link_kwargs))
+            if last is not None and number < last:
+                links.append(self.get_pagination_link(last, rel="last", prompt=u"last", **link_kwargs))
         return links
     
     def get_advaned_link(self):
@@ -108,8 +169,18 @@ class Index(object):
         #    links += active_section.get_pagination_links()
         return links
     
-    def get_page(self):
-        paginator = self.get_paginator()
+    def get_active_paginator(self):
+        """
+        Returns the paginator of the current request if this index is active
+        otherwise a new paginator
+        """
+        if self.state.get('index', None) is self and 'paginator' in self.state:
+            return self.state['paginator']
+        return self.get_paginator()
+    
+    def get_page(self, paginator=None):
+        if paginator is None:
+            paginator = self.get_active_paginator()
         return paginator.page(self.state.params.get(self.page_var, 1))
 
 class PrimaryIndex(Index):
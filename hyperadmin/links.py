@@ -1,13 +1,18 @@
 from copy import copy
+from functools import partial
 
 from django.http import QueryDict
 from django.template.loader import render_to_string
 
+from hyperadmin.timings import NULL_PHASE
 
-class Link(object):
+
+class BaseLink(object):
     """
-    A link in the broad hypermedia sense
+    The behavior of links, subclasses decide how the attributes are stored
     """
+    __slots__ = ()
+    
     def __init__(self, url, endpoint, method='GET', prompt=None, description=None,
                 form=None, form_class=None, form_kwargs=None, on_submit=None, errors=None,
                 link_factor=None, include_form_params_in_url=False,
@@ -265,6 +270,111 @@ class Link(object):
                                 context,
                                 context_instance=self.get_context_instance())
 
+class Link(BaseLink):
+    """
+    A link in the broad hypermedia sense
+    """
+
+class LinkDefaults(object):
+    """
+    Link attributes shared by the links created from a link prototype
+    """
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+class CompactLink(BaseLink):
+    """
+    A memory efficient link without an attribute dictionary. Attributes
+    equal to the defaults shared by the link prototype are not stored on
+    the link and the absolute url is computed on first use. Shared
+    dictionaries are copied to the link when they are accessed so changes
+    stay on the link.
+    """
+    __slots__ = ('_url', '_method', 'endpoint', '_form', 'form_class',
+                 'form_kwargs', 'link_factor', 'include_form_params_in_url',
+                 'mimetype', 'descriptors', 'cl_headers', 'prompt',
+                 'description', 'template_name', 'cu_headers', 'cr_headers',
+                 'on_submit', '_errors', 'defaults', '_absolute_url',
+                 '__weakref__')
+    
+    shared_attributes = ('_method', 'form_class', 'form_kwargs', 'link_factor',
+                         'include_form_params_in_url', 'mimetype',
+                         'descriptors', 'cl_headers', 'description',
+                         'template_name', 'cu_headers', 'cr_headers')
+    
+    mutable_attributes = ('form_kwargs', 'descriptors', 'cl_headers',
+                          'cu_headers', 'cr_headers')
+    
+    def __init__(self, defaults=None, **kwargs):
+        super(CompactLink, self).__init__(**kwargs)
+        if defaults is None:
+            defaults = self.get_defaults(self)
+        self.defaults = defaults
+        for attr in self.shared_attributes:
+            if getattr(self, attr) == getattr(defaults, attr):
+                delattr(self, attr)
+    
+    @classmethod
+    def get_defaults(cls, link):
+        '''
+        Returns the shared attributes of link
+        '''
+        values = dict([(attr, getattr(link, attr)) for attr in cls.shared_attributes])
+        for attr in cls.mutable_attributes:
+            values[attr] = copy(values[attr])
+        return LinkDefaults(**values)
+    
+    def __getattr__(self, attr):
+        if attr in CompactLink.shared_attributes:
+            value = getattr(self.defaults, attr)
+            if attr in CompactLink.mutable_attributes and value is not None:
+                value = copy(value)
+                setattr(self, attr, value)
+            return value
+        raise AttributeError(attr)
+    
+    def get_shared(self, attr):
+        '''
+        Reads a shared attribute without copying the default to the link
+        '''
+        try:
+            return object.__getattribute__(self, attr)
+        except AttributeError:
+            return getattr(self.defaults, attr)
+    
+    @property
+    def rel(self):
+        return self.get_shared('cl_headers').get('rel', None)
+    
+    @property
+    def classes(self):
+        cl_headers = self.get_shared('cl_headers')
+        if 'classes' in cl_headers:
+            return cl_headers['classes']
+        if 'class' in cl_headers:
+            return cl_headers['class'].split()
+        return []
+    
+    def get_form_kwargs(self, **form_kwargs):
+        kwargs = dict(self.get_shared('form_kwargs') or {})
+        kwargs.update(form_kwargs)
+        return kwargs
+    
+    def get_absolute_url(self):
+        try:
+            return self._absolute_url
+        except AttributeError:
+            self._absolute_url = super(CompactLink, self).get_absolute_url()
+            return self._absolute_url
+    
+    def clone(self, **kwargs):
+        a_clone = super(CompactLink, self).clone(**kwargs)
+        try:
+            del a_clone._absolute_url
+        except AttributeError:
+            pass
+        return a_clone
+
 #CONSIDER: should we sublcass: django.core.urlresolvers.NoReverseMatch
 class LinkNotAvailable(Exception):
     pass
@@ -297,46 +407,65 @@ class LinkCollection(list):
         self.append(link)
         return link
 
-class ChainedLinkCollectionProvider(object):
-    def __init__(self, call_chain, default_kwargs={}):
-        self.call_chain = call_chain
-        self.default_kwargs = default_kwargs
-        
-    def __call__(self, *args, **kwargs):
+class LinkChain(object):
+    """
+    The resolved functions for collecting a link group from a container class.
+    Each function is passed the provider followed by the link arguments.
+    """
+    def __init__(self, steps):
+        self.steps = steps
+    
+    def __call__(self, provider, *args, **kwargs):
         links = None
-        kwargs.update(self.default_kwargs)
-        for subcall in self.call_chain:
+        kwargs.update(provider._get_link_kwargs())
+        for step in self.steps:
             if links is None:
-                links = subcall(*args, **kwargs)
+                links = step(provider, *args, **kwargs)
             else:
-                links.extend(subcall(*args, **kwargs))
+                links.extend(step(provider, *args, **kwargs))
         return links
 
 class LinkCollectionProvider(object):
+    link_chains = dict()
+    '''Link chains resolved per provider class, container class and link group'''
+    
     def __init__(self, container, parent=None):
         self.container = container #resource, endpoint, state
         self.parent = parent #parent container links
     
-    def _get_link_functions(self, attr):
-        functions = list()
-        if self.parent:
-            functions.append( getattr(self.parent, attr) )
+    @classmethod
+    def get_chain_steps(cls, container_class, has_parent, attr):
+        """
+        Returns the functions called in order to collect the link group
+        
+        :rtype: list
+        """
+        steps = list()
+        if has_parent:
+            steps.append(lambda provider, *args, **kwargs: getattr(provider.parent, attr)(*args, **kwargs))
         else:
-            functions.append( lambda *args, **kwargs: self.container.create_link_collection() )
-        if hasattr(self.container, attr):
-            functions.append( getattr(self.container, attr) )
-        return functions
+            steps.append(lambda provider, *args, **kwargs: provider.container.create_link_collection())
+        if hasattr(container_class, attr):
+            steps.append(lambda provider, *args, **kwargs: getattr(provider.container, attr)(*args, **kwargs))
+        return steps
+    
+    def get_link_chain(self, attr):
+        key = (type(self), type(self.container), self.parent is not None, attr)
+        chain = self.link_chains.get(key, None)
+        if chain is None:
+            chain = LinkChain(self.get_chain_steps(*key[1:]))
+            self.link_chains[key] = chain
+        return chain
     
     def _get_link_kwargs(self):
         return {}
     
-    def __getattribute__(self, attr):
+    def __getattr__(self, attr):
         if not attr.startswith('get_'):
-            return object.__getattribute__(self, attr)
-        
-        functions = self._get_link_functions(attr)
-        default_kwargs = self._get_link_kwargs()
-        return ChainedLinkCollectionProvider(functions, default_kwargs)
+            raise AttributeError(attr)
+        collector = partial(self.get_link_chain(attr), self)
+        self.__dict__[attr] = collector
+        return collector
 
 class ItemLinkCollectionProvider(LinkCollectionProvider):
     def __init__(self, container, parent=None):
@@ -360,6 +489,60 @@ class LinkCollectorMixin(object):
     def get_link_collector(self, **kwargs):
         return self.link_collector_class(**self.get_link_collector_kwargs(**kwargs))
 
+class BoundLinkPrototypes(object):
+    """
+    A read only mapping over the link prototypes shared across api requests.
+    Prototypes are bound to the endpoints of the api request on first access.
+    """
+    def __init__(self, prototypes, endpoint):
+        self.prototypes = prototypes
+        self.endpoint = endpoint
+        self.bound_prototypes = dict()
+    
+    @property
+    def api_request(self):
+        return self.endpoint.api_request
+    
+    def bind_prototype(self, proto):
+        url_name = proto.get_url_name()
+        if url_name == self.endpoint.get_url_name():
+            endpoint = self.endpoint
+        else:
+            endpoint = self.api_request.get_endpoint(url_name)
+        return proto.bind(endpoint)
+    
+    def __getitem__(self, name):
+        if name not in self.bound_prototypes:
+            self.bound_prototypes[name] = self.bind_prototype(self.prototypes[name])
+        return self.bound_prototypes[name]
+    
+    def get(self, name, default=None):
+        if name in self.prototypes:
+            return self[name]
+        return default
+    
+    def __contains__(self, name):
+        return name in self.prototypes
+    
+    def __iter__(self):
+        return iter(self.prototypes)
+    
+    def __len__(self):
+        return len(self.prototypes)
+    
+    def keys(self):
+        return self.prototypes.keys()
+    
+    def values(self):
+        return [self[name] for name in self.prototypes]
+    
+    def items(self):
+        return [(name, self[name]) for name in self.prototypes]
+    
+    def iteritems(self):
+        for name in self.prototypes:
+            yield name, self[name]
+
 class LinkPrototype(object):
     """
     Incapsulates logic related to a link. This class is responsible for:
@@ -368,10 +551,32 @@ class LinkPrototype(object):
     * handling link submission
     * controlling link visibility
     """
+    shared = True
+    '''Prototypes are built once per url name and bound to each api request.
+    Set to False if the prototype holds per request data.'''
+    
+    compact_links = False
+    '''If True, links are created as CompactLink instances sharing their
+    defaults with the other links of the prototype'''
+    
     def __init__(self, endpoint, name, link_kwargs={}):
         self.endpoint = endpoint
         self.name = name
         self.link_kwargs = link_kwargs
+        self.link_defaults = dict()
+    
+    def bind(self, endpoint):
+        """
+        Returns a copy of the prototype bound to an endpoint of the active
+        api request. Prototypes that are not shared are constructed again.
+        
+        :rtype: LinkPrototype
+        """
+        if not self.shared:
+            return endpoint.create_link_prototype(type(self), name=self.name, link_kwargs=self.link_kwargs)
+        bound = copy(self)
+        bound.endpoint = endpoint
+        return bound
     
     @property
     def resource(self):
@@ -389,6 +594,11 @@ class LinkPrototype(object):
     def api_request(self):
         return self.endpoint.api_request
     
+    def time_phase(self, name):
+        if self.api_request is None:
+            return NULL_PHASE
+        return self.api_request.time_phase(name)
+    
     def show_link(self, **kwargs):
         """
         Checks the state and returns False if the link is not active.
@@ -423,17 +633,40 @@ class LinkPrototype(object):
         return self.endpoint.get_link_kwargs(**params)
     
     def get_link_class(self):
+        if self.compact_links:
+            return CompactLink
         return Link
     
+    def get_link_defaults(self, link_class):
+        """
+        Returns the attributes shared by the compact links of the prototype,
+        they are built from the link kwargs of the prototype and hold no
+        request data
+        
+        :rtype: LinkDefaults
+        """
+        if link_class not in self.link_defaults:
+            params = dict(self.link_kwargs)
+            params.setdefault('description', self.get_link_description())
+            params.setdefault('form_kwargs', {})
+            params.pop('use_request_url', None)
+            params.update(url=None, endpoint=None)
+            self.link_defaults[link_class] = link_class.get_defaults(Link(**params))
+        return self.link_defaults[link_class]
+    
     def get_link(self, **link_kwargs):
         """
         Creates and returns the link
         
         :rtype: Link
         """
-        link_kwargs = self.get_link_kwargs(**link_kwargs)
-        link_class = self.get_link_class()
-        link = link_class(**link_kwargs)
+        with self.time_phase('link'):
+            link_kwargs = self.get_link_kwargs(**link_kwargs)
+            link_class = self.get_link_class()
+            if issubclass(link_class, CompactLink):
+                link = link_class(defaults=self.get_link_defaults(link_class), **link_kwargs)
+            else:
+                link = link_class(**link_kwargs)
         return link
     
     def handle_submission(self, link, submit_kwargs):
@@ -1,3 +1,5 @@
+import uuid
+
 from django.utils import simplejson as json
 from django import http
 
@@ -6,11 +8,28 @@ from hyperadmin.mediatypes.common import MediaType
 from hyperadmin.links import Link
 
 
+class FieldEntry(dict):
+    '''
+    A converted field that remembers the order its keys were set in. Field
+    plans set the keys of their rows in the same order so the rows encode
+    exactly like converted fields.
+    '''
+    def __init__(self):
+        super(FieldEntry, self).__init__()
+        self.key_order = list()
+    
+    def __setitem__(self, key, value):
+        if key not in self:
+            self.key_order.append(key)
+        super(FieldEntry, self).__setitem__(key, value)
+
 class CollectionJSON(MediaType):
     recognized_media_types = [
         'application/vnd.Collection+JSON',
         'application/vnd.collection+json',
     ]
+    #request parameter asking for a streamed list
+    stream_var = 'stream'
     
     def prepare_field_value(self, val):
         val = super(CollectionJSON, self).prepare_field_value(val)
@@ -19,8 +38,9 @@ class CollectionJSON(MediaType):
         return val
     
     def convert_field(self, field):
-        entry = {"name": force_text(field.name),
-                 "prompt": force_text(field.label)}
+        entry = FieldEntry()
+        entry["name"] = force_text(field.name)
+        entry["prompt"] = force_text(field.label)
         return entry
     
     def links_for_item(self, item):
@@ -34,11 +54,44 @@ class CollectionJSON(MediaType):
     
     def convert_item(self, item):
         result = self.links_for_item(item)
-        form = item.get_form()
-        result['data'] = self.convert_form(form)
+        values = None
+        if hasattr(item, 'get_row_values'):
+            values = item.get_row_values()
+        if values is not None:
+            result['data'] = self.convert_row(item, values)
+        else:
+            form = item.get_form()
+            result['data'] = self.convert_form(form)
         result['prompt'] = item.get_prompt()
         return result
     
+    def get_field_plan(self, item):
+        '''
+        Returns the name and the converted items of each field of the form
+        class of a row item. Fields do not depend on the row so they are
+        converted once per form class and endpoint.
+        '''
+        if not hasattr(self, '_field_plans'):
+            self._field_plans = dict()
+        key = (item.get_form_class(), item.endpoint)
+        if key not in self._field_plans:
+            plan = list()
+            for field in item.get_template_form():
+                entry = self.convert_field(field)
+                plan.append((field.name, [(entry_key, entry[entry_key]) for entry_key in entry.key_order]))
+            self._field_plans[key] = plan
+        return self._field_plans[key]
+    
+    def convert_row(self, item, values=None):
+        if values is None:
+            values = item.get_row_values()
+        data = list()
+        for name, entry_items in self.get_field_plan(item):
+            entry = dict(entry_items)
+            entry['value'] = self.prepare_field_value(values.get(name, None))
+            data.append(entry)
+        return data
+    
     def convert_form(self, form):
         data = list()
         entry_data = self.get_form_instance_values(form)
@@ -57,6 +110,8 @@ class CollectionJSON(MediaType):
                   }
         if link.descriptors and "label" in link.descriptors:
             link_r['prompt'] = link.descriptors['label']
+        if link.descriptors and "count" in link.descriptors:
+            link_r['count'] = link.descriptors['count']
         if link.form:
             link_r['data'] = self.convert_form(link.form)
         return link_r
@@ -70,12 +125,13 @@ class CollectionJSON(MediaType):
     def prepare_collection(self, form_link, state):
         data = self.prepare_link(form_link)
         
-        items = [self.convert_item(item) for item in state.get_resource_items()]
+        items = self.convert_items(state)
         
         #the following maps hfactor to this media type
         links = list()
         links.extend(state.links.get_embedded_links())
         links.extend(state.links.get_outbound_links())
+        links.extend(state.links.get_pagination_links())
         queries = state.links.get_filter_links()
         
         data.update({
@@ -87,6 +143,45 @@ class CollectionJSON(MediaType):
         data.update(meta=state.meta, prompt=state.resource.get_prompt())
         return data
     
+    def convert_items(self, state):
+        if state is getattr(self, '_streamed_state', None):
+            #streamed items are encoded in place of the marker after the envelope
+            return self._stream_marker
+        return [self.convert_item(item) for item in state.get_resource_items()]
+    
+    def should_stream(self, link, state):
+        '''
+        Lists are streamed when the resource sets `stream_collections` or
+        the request asks for a stream, django < 1.5 can not stream responses
+        '''
+        if not hasattr(http, 'StreamingHttpResponse'):
+            return False
+        if state.item is not None or link.form is not None and link.form.errors:
+            return False
+        if getattr(state.resource, 'stream_collections', False):
+            return True
+        return self.api_request.params.get(self.stream_var, '').lower() in ('1', 'true')
+    
+    def stream_collection(self, link, state):
+        '''
+        Yields the encoded collection, the links and queries are written
+        before the items which are converted and encoded one at a time
+        '''
+        self._streamed_state = state
+        self._stream_marker = 'hyperadmin-stream-%s' % uuid.uuid4().hex
+        try:
+            data = self.prepare_collection(link, state)
+        finally:
+            del self._streamed_state
+        content = json.dumps({"collection":data}, cls=HyperadminJSONEncoder)
+        head, tail = content.split(json.dumps(self._stream_marker), 1)
+        yield head + '['
+        separator = ''
+        for item in state.iter_resource_items():
+            yield separator + json.dumps(self.convert_item(item), cls=HyperadminJSONEncoder)
+            separator = ', '
+        yield ']' + tail
+    
     def prepare_link(self, form_link):
         data = {
             'href':form_link.get_absolute_url(),
@@ -102,9 +197,11 @@ class CollectionJSON(MediaType):
     def serialize(self, content_type, link, state):
         if self.detect_redirect(link):
             return self.handle_redirect(link, content_type)
+        assert content_type in self.recognized_media_types, "%s not in %s" % (content_type, self.recognized_media_types)
+        if self.should_stream(link, state):
+            return http.StreamingHttpResponse(self.stream_collection(link, state), content_type)
         data = self.prepare_collection(link, state)
         content = json.dumps({"collection":data}, cls=HyperadminJSONEncoder)
-        assert content_type in self.recognized_media_types, "%s not in %s" % (content_type, self.recognized_media_types)
         return http.HttpResponse(content, content_type)
     
     def options_serialize(self, content_type, links, state):
@@ -5,39 +5,105 @@ import io
 
 from django import http
 
-from datatap.datataps import StreamDataTap
+from datatap.datataps import MemoryDataTap, StreamDataTap
 
 from hyperadmin.mediatypes.common import MediaType
+from hyperadmin.mediatypes.encoders import force_text
 
 
+class DataTapSink(object):
+    '''
+    A writable stream the serialized datatap is sent to. Written chunks
+    are buffered until `chunk_size` characters are held and then drained
+    by the generator feeding the response.
+    '''
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.chunks = list()
+        self.size = 0
+
+    def write(self, chunk):
+        if not isinstance(chunk, basestring):
+            chunk = force_text(chunk)
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+
+    def is_full(self):
+        return self.size >= self.chunk_size
+
+    def drain(self):
+        content = ''.join(self.chunks)
+        self.chunks = list()
+        self.size = 0
+        return content
+
 class DataTap(MediaType):
+    #size of the pieces the streamed content is sent in
+    chunk_size = 64 * 1024
+
     def __init__(self, api_request, datatap_class, **kwargs):
         self.datatap_class = datatap_class
         super(DataTap, self).__init__(api_request, **kwargs)
 
-    def get_content(self, form_link, state):
-        instream = state.get_resource_items()
+    def get_serialized_datatap(self, state):
+        if 'ingest' in state.meta:
+            #the results of an upload are sent in place of the items
+            return self.datatap_class(instream=MemoryDataTap(state.meta['ingest']))
+        instream = state.iter_resource_items()
         datatap = state.endpoint.get_datatap(instream=instream)
-        serialized_dt = self.datatap_class(instream=datatap)
-        payload = io.BytesIO()
-        serialized_dt.send(payload)
-        return payload.getvalue()
+        return self.datatap_class(instream=datatap)
+
+    def iter_content(self, form_link, state):
+        '''
+        Yields the serialized datatap in pieces, items are read and
+        serialized as the response is consumed
+        '''
+        serialized_dt = self.get_serialized_datatap(state)
+        sink = DataTapSink(self.chunk_size)
+        for item in serialized_dt:
+            sink.write(item)
+            if sink.is_full():
+                yield sink.drain()
+        yield sink.drain()
+
+    def get_content(self, form_link, state):
+        return ''.join(self.iter_content(form_link, state))
+
+    def get_page_headers(self, state):
+        '''
+        Returns the urls of the next and previous pages, they are sent as
+        headers since the body is written after the response is returned
+        '''
+        headers = dict()
+        for link in state.links.get_pagination_links():
+            if link.rel == 'next':
+                headers['X-Next-Page'] = link.get_absolute_url()
+            elif link.rel == 'previous':
+                headers['X-Previous-Page'] = link.get_absolute_url()
+        return headers
+
+    def get_streaming_response(self, content, content_type, state):
+        if hasattr(http, 'StreamingHttpResponse'):
+            response = http.StreamingHttpResponse(content, content_type)
+        else:
+            #django < 1.5 can not stream responses
+            response = http.HttpResponse(u''.join(content), content_type)
+        for header, value in self.get_page_headers(state).iteritems():
+            response[header] = value
+        return response
 
     def serialize(self, content_type, link, state):
         if self.detect_redirect(link):
             return self.handle_redirect(link, content_type)
-        content = self.get_content(link, state)
-        response = http.HttpResponse(content, content_type)
-        #TODO response['X-Next-Page'] = state.links(group='pagination', rel='next')[0]
-        #TODO response['X-Previous-Page'] = state.links(group='pagination', rel='previous')[0]
-        return response
+        content = self.iter_content(link, state)
+        return self.get_streaming_response(content, content_type, state)
 
     def get_datatap(self, request):
-        if hasattr(request, 'body'):
-            payload = request.body
-        else:
-            payload = request.raw_post_data
-        return self.datatap_class(StreamDataTap(io.BytesIO(payload)))
+        if not hasattr(request, 'body'):
+            #django < 1.4 requests can not be read as a stream
+            return self.datatap_class(StreamDataTap(io.BytesIO(request.raw_post_data)))
+        #the payload is decoded as it is read from the request
+        return self.datatap_class(StreamDataTap(request))
 
     def deserialize(self, request):
         #CONSIDER: does using a datatap mean you must post as a list?
@@ -1,5 +1,3 @@
-import mimeparse
-
 from django.template.response import TemplateResponse
 from django.middleware.csrf import CsrfViewMiddleware
 
@@ -16,10 +14,7 @@ class IframeMediaType(MediaType):
     def get_response_type(self):
         response_type = self.api_request.META.get('HTTP_ACCEPT', '')
         effective_type = response_type.split(self.recognized_media_types[0], 1)[-1]
-        return mimeparse.best_match(
-            self.site.media_types.keys(),
-            effective_type
-        )
+        return self.site.negotiate_media_type(effective_type)
     
     def get_response_media_type(self):
         content_type = self.get_response_type()
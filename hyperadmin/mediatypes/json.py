@@ -1,9 +1,8 @@
 from __future__ import absolute_import
 
-from django import http
-
-from datatap.datataps import JSONDataTap
+from itertools import chain
 
+from hyperadmin.datataps import StreamingJSONDataTap
 from hyperadmin.mediatypes.datatap import DataTap
 
 
@@ -13,7 +12,7 @@ class JSON(DataTap):
     ]
 
     def __init__(self, api_request, **kwargs):
-        kwargs.setdefault('datatap_class', JSONDataTap)
+        kwargs.setdefault('datatap_class', StreamingJSONDataTap)
         super(JSON, self).__init__(api_request, **kwargs)
 
 JSON.register_with_builtins()
@@ -31,9 +30,9 @@ class JSONP(JSON):
     def serialize(self, content_type, link, state):
         if self.detect_redirect(link):
             return self.handle_redirect(link, content_type)
-        content = self.get_content(link, state)
         callback = self.get_jsonp_callback()
-        return http.HttpResponse(u'%s(%s)' % (callback, content), content_type)
+        content = chain([u'%s(' % callback], self.iter_content(link, state), [u')'])
+        return self.get_streaming_response(content, content_type, state)
 
 JSONP.register_with_builtins()
 
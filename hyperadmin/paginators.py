@@ -0,0 +1,245 @@
+'''
+Counting strategies for paginating resources. A strategy is set on the
+resource with `count_strategy` and builds the paginator of each request.
+'''
+import hashlib
+import urllib
+
+from django.core.cache import cache
+from django.core.paginator import Paginator, Page, PageNotAnInteger, EmptyPage
+from django.db import connections, DatabaseError
+from django.db.models.query import EmptyQuerySet
+
+from hyperadmin.signals import resource_event
+
+
+def validate_page_number(number):
+    try:
+        number = int(number)
+    except (TypeError, ValueError):
+        raise PageNotAnInteger('That page number is not an integer')
+    if number < 1:
+        raise EmptyPage('That page number is less than 1')
+    return number
+
+class CountingPaginator(Paginator):
+    """
+    A paginator that asks its count strategy for the number of objects
+    """
+    def __init__(self, object_list, per_page, count_strategy, **kwargs):
+        self.count_strategy = count_strategy
+        self.count_is_approximate = False
+        super(CountingPaginator, self).__init__(object_list, per_page, **kwargs)
+
+    def _get_count(self):
+        if self._count is None:
+            count, approximate = self.count_strategy.get_count(self.object_list)
+            if count is None:
+                return super(CountingPaginator, self)._get_count()
+            self._count = count
+            self.count_is_approximate = approximate
+        return self._count
+    count = property(_get_count)
+
+    def validate_number(self, number):
+        if self.count is not None and self.count_is_approximate:
+            #an estimate may be short of the real number of pages
+            number = validate_page_number(number)
+            if number > self.num_pages and not self.object_list[(number - 1) * self.per_page:][:1]:
+                raise EmptyPage('That page contains no results')
+            return number
+        return super(CountingPaginator, self).validate_number(number)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if self.count_is_approximate:
+            bottom = (number - 1) * self.per_page
+            return Page(self.object_list[bottom:bottom + self.per_page], number, self)
+        return super(CountingPaginator, self).page(number)
+
+class NextPage(Page):
+    def __init__(self, object_list, number, paginator, has_next):
+        super(NextPage, self).__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+    def end_index(self):
+        return self.start_index() + len(self.object_list) - 1
+
+class NextPagePaginator(Paginator):
+    """
+    A paginator that does not count, it fetches one object past the page
+    to know if there is a next page
+    """
+    count = None
+    num_pages = None
+    count_is_approximate = False
+
+    def __init__(self, object_list, per_page, count_strategy=None, **kwargs):
+        super(NextPagePaginator, self).__init__(object_list, per_page, **kwargs)
+        self.pages = dict()
+
+    def validate_number(self, number):
+        return validate_page_number(number)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if number not in self.pages:
+            bottom = (number - 1) * self.per_page
+            object_list = list(self.object_list[bottom:bottom + self.per_page + 1])
+            if not object_list and number > 1:
+                raise EmptyPage('That page contains no results')
+            has_next = len(object_list) > self.per_page
+            self.pages[number] = NextPage(object_list[:self.per_page], number, self, has_next)
+        return self.pages[number]
+
+class ExactCount(object):
+    """
+    Counts every object of the filtered index
+    """
+    paginator_class = CountingPaginator
+
+    def __init__(self, resource):
+        self.resource = resource
+
+    def get_paginator(self, object_list, **kwargs):
+        return self.paginator_class(object_list, count_strategy=self, **kwargs)
+
+    def count_objects(self, object_list):
+        try:
+            return object_list.count()
+        except (AttributeError, TypeError):
+            return len(object_list)
+
+    def get_count(self, object_list):
+        """
+        Returns the count and whether it is approximate
+        """
+        return self.count_objects(object_list), False
+
+class NextPageCount(ExactCount):
+    """
+    Does not count, pages only report if a next page exists
+    """
+    paginator_class = NextPagePaginator
+
+    def get_count(self, object_list):
+        return None, False
+
+class CachedCount(ExactCount):
+    """
+    Caches the count per resource, url kwargs, query string and user
+    permissions. Cached counts are dropped when the resource emits an event
+    and otherwise expire after `timeout` seconds.
+    """
+    timeout = 300
+    version_timeout = 60 * 60 * 24 * 30
+    ignored_params = ('p', 'after', 'before')
+    key_prefix = 'hyperadmin-count'
+
+    def get_version_key(self):
+        return '%s-version:%s' % (self.key_prefix, self.resource.get_url_name())
+
+    def get_params(self):
+        state_params = self.resource.state.params
+        if hasattr(state_params, 'iterlists'):
+            state_params = state_params.iterlists()
+        else:
+            state_params = [(key, [value]) for key, value in state_params.iteritems()]
+        params = list()
+        for key, values in state_params:
+            if key not in self.ignored_params:
+                for value in values:
+                    params.append((key, unicode(value).encode('utf-8')))
+        return urllib.urlencode(sorted(params))
+
+    def get_url_kwargs(self):
+        url_kwargs = self.resource.api_request.url_kwargs or {}
+        return urllib.urlencode(sorted([(key, unicode(value).encode('utf-8'))
+                                        for key, value in url_kwargs.iteritems()]))
+
+    def get_fingerprint(self):
+        """
+        Returns the permission fingerprint of the requesting user, the
+        listed objects may be scoped to what the user can see
+        """
+        return self.resource.api_request.get_permission_cache().get_fingerprint()
+
+    def get_cache_key(self):
+        version = cache.get(self.get_version_key(), 0)
+        parts = [self.get_url_kwargs(), self.get_params(), self.get_fingerprint()]
+        params_hash = hashlib.md5('|'.join(parts)).hexdigest()
+        return '%s:%s:%s:%s' % (self.key_prefix, self.resource.get_url_name(), version, params_hash)
+
+    def get_count(self, object_list):
+        key = self.get_cache_key()
+        count = cache.get(key)
+        if count is not None:
+            return count, True
+        count = self.count_objects(object_list)
+        cache.set(key, count, self.timeout)
+        return count, False
+
+    @classmethod
+    def invalidate(cls, url_name):
+        key = '%s-version:%s' % (cls.key_prefix, url_name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, cls.version_timeout)
+
+def invalidate_cached_counts(sender, **kwargs):
+    url_name = sender.split('!', 1)[0]
+    CachedCount.invalidate(url_name)
+
+resource_event.connect(invalidate_cached_counts)
+
+class EstimatedCount(ExactCount):
+    """
+    Uses the row estimate kept by the database for unfiltered querysets.
+    Small tables and filtered querysets are counted exactly.
+    """
+    exact_below = 1000
+
+    def is_filtered(self, queryset):
+        if isinstance(queryset, EmptyQuerySet):
+            return True
+        return bool(queryset.query.where) or bool(queryset.query.having)
+
+    def get_estimate(self, queryset):
+        connection = connections[queryset.db]
+        table = queryset.model._meta.db_table
+        if connection.vendor == 'sqlite':
+            sql = 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s'
+        elif connection.vendor == 'postgresql':
+            sql = 'SELECT reltuples FROM pg_class WHERE relname = %s'
+        elif connection.vendor == 'mysql':
+            sql = ('SELECT table_rows FROM information_schema.tables '
+                   'WHERE table_schema = DATABASE() AND table_name = %s')
+        else:
+            return None
+        cursor = connection.cursor()
+        try:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+        except DatabaseError:
+            #statistics have not been gathered
+            return None
+        if row is None or row[0] is None:
+            return None
+        try:
+            estimate = int(float(str(row[0]).split()[0]))
+        except (ValueError, IndexError):
+            return None
+        if estimate < 0:
+            return None
+        return estimate
+
+    def get_count(self, object_list):
+        if hasattr(object_list, 'query') and not self.is_filtered(object_list):
+            estimate = self.get_estimate(object_list)
+            if estimate is not None and estimate >= self.exact_below:
+                return estimate, True
+        return self.count_objects(object_list), False
@@ -0,0 +1,108 @@
+import hashlib
+
+from django.contrib.auth import get_backends
+from django.contrib.auth.models import AnonymousUser
+try:
+    from django.contrib.auth.models import PermissionsMixin
+except ImportError:
+    #django < 1.5 defines the permission methods on User
+    from django.contrib.auth.models import User as PermissionsMixin
+from django.utils.encoding import force_unicode
+
+
+class PermissionCache(object):
+    """
+    Memoizes the permission checks of a user for the lifetime of an api
+    request. Results are keyed by the permission and the identity of the
+    object being checked.
+
+    Authentication backends may answer object level checks in bulk by
+    implementing ``has_perm_for_objects(user, perm, objs)`` which returns
+    a boolean for each object.
+    """
+    bulk_method_name = 'has_perm_for_objects'
+
+    def __init__(self, user):
+        self.user = user
+        self.results = dict()
+
+    def get_object_key(self, obj):
+        """
+        Returns a hashable identity for the object or None if the object
+        cannot be identified
+        """
+        if obj is None:
+            return ()
+        pk = getattr(obj, 'pk', None)
+        if pk is None:
+            return None
+        return (type(obj), pk)
+
+    def has_perm(self, perm, obj=None):
+        obj_key = self.get_object_key(obj)
+        if obj_key is None:
+            return self.user.has_perm(perm, obj)
+        key = (perm, obj_key)
+        if key not in self.results:
+            self.results[key] = self.user.has_perm(perm, obj)
+        return self.results[key]
+
+    def has_perm_for_objects(self, perm, objs):
+        """
+        Evaluates an object level permission for a batch of objects, returns
+        a list of booleans in the order of the objects
+        """
+        pending = list()
+        for obj in objs:
+            obj_key = self.get_object_key(obj)
+            if obj_key is not None and (perm, obj_key) not in self.results:
+                pending.append(obj)
+        if pending:
+            for obj, result in zip(pending, self.check_objects(perm, pending)):
+                self.results[(perm, self.get_object_key(obj))] = result
+        return [self.has_perm(perm, obj) for obj in objs]
+
+    def get_fingerprint(self):
+        """
+        Returns a digest of the user and the user's permissions, it changes
+        when the permissions of the user do
+        """
+        if not hasattr(self, '_fingerprint'):
+            user = self.user
+            permissions = sorted(user.get_all_permissions()) if hasattr(user, 'get_all_permissions') else []
+            parts = [user.pk, user.is_active, getattr(user, 'is_superuser', False)] + permissions
+            self._fingerprint = hashlib.md5(u'|'.join([force_unicode(part) for part in parts]).encode('utf-8')).hexdigest()
+        return self._fingerprint
+
+    def uses_backends(self):
+        """
+        Returns True if the user's has_perm is the one provided by django
+        which only consults the authentication backends
+        """
+        has_perm = getattr(type(self.user).has_perm, 'im_func', None)
+        return has_perm in (PermissionsMixin.has_perm.im_func, AnonymousUser.has_perm.im_func)
+
+    def check_objects(self, perm, objs):
+        backends = get_backends()
+        if (not any(hasattr(backend, self.bulk_method_name) for backend in backends) or
+            not self.uses_backends()):
+            return [self.user.has_perm(perm, obj) for obj in objs]
+
+        user = self.user
+        if user.is_active and user.is_superuser:
+            return [True] * len(objs)
+        results = [False] * len(objs)
+        for backend in backends:
+            remaining = [index for index, result in enumerate(results) if not result]
+            if not remaining:
+                break
+            if hasattr(backend, self.bulk_method_name):
+                answers = getattr(backend, self.bulk_method_name)(user, perm, [objs[index] for index in remaining])
+            elif hasattr(backend, 'has_perm'):
+                answers = [backend.has_perm(user, perm, objs[index]) for index in remaining]
+            else:
+                continue
+            for index, answer in zip(remaining, answers):
+                if answer:
+                    results[index] = True
+        return results
@@ -148,8 +148,9 @@ class ListEndpoint(IndexMixin, ResourceEndpoint):
             #use the request payload as an instream for our resource's datatap
             request = api_request.get_django_request()
             instream = mt.get_datatap(request)
-            datatap = self.get_datatap(instream=instream)
-            datatap.commit()
+            results = self.resource.ingest_datatap(instream)
+            if results is not None:
+                self.state.meta['ingest'] = results
             return self.get_link()
         return self.handle_link_submission(api_request)
 
@@ -170,10 +171,13 @@ class ListEndpoint(IndexMixin, ResourceEndpoint):
         links.extend(index.get_filter_links(rel='filter'))
         return links
 
+    def get_etag_data(self):
+        return self.resource.get_list_version(self.get_index())
+
     def get_pagination_links(self):
         links = self.create_link_collection()
         index = self.get_index()
-        links.extend(index.get_pagination_links(rel='paginate'))
+        links.extend(index.get_pagination_links(group='pagination'))
         return links
 
     def get_instances(self):
@@ -186,6 +190,14 @@ class ListEndpoint(IndexMixin, ResourceEndpoint):
         kwargs.setdefault('endpoint', self)
         return self.resource.get_list_resource_item(instance, **kwargs)
 
+    def get_resource_items(self):
+        items = self.resource.get_list_resource_items(self.get_instances(), endpoint=self)
+        self.resource.check_item_permissions(items)
+        return items
+
+    def iter_resource_items(self):
+        return self.resource.iter_list_resource_items(self.get_instances(), endpoint=self)
+
     def get_meta(self):
         resource_item = self.resource.get_list_resource_item(instance=None)
         form = resource_item.get_form()
@@ -202,8 +214,14 @@ class ListEndpoint(IndexMixin, ResourceEndpoint):
         paginator = index.get_paginator()
         data['paginator'] = paginator
         data['index'] = index
-        self.state.meta['object_count'] = paginator.count
-        self.state.meta['number_of_pages'] = paginator.num_pages
+        if paginator.count is not None:
+            self.state.meta['object_count'] = paginator.count
+            self.state.meta['number_of_pages'] = paginator.num_pages
+            if getattr(paginator, 'count_is_approximate', False):
+                self.state.meta['object_count_approximate'] = True
+        else:
+            #paginators that do not count report if there are more objects
+            self.state.meta['has_next'] = index.get_page(paginator).has_next()
         return data
 
 
@@ -253,6 +271,12 @@ class DetailMixin(IndexMixin):
         data['item'] = self.get_item()
         return data
 
+    def get_etag_data(self):
+        return self.resource.get_item_version(self.state.item)
+
+    def get_last_modified(self):
+        return self.resource.get_item_last_modified(self.state.item)
+
     def get_url_param_map(self):
         return dict(self.url_param_map)
 
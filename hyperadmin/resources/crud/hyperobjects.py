@@ -4,6 +4,29 @@ from django import forms
 from hyperadmin.resources.hyperobjects import ResourceItem
 
 
+def get_display_value(resource, instance, display):
+    '''
+    Returns the value of a list display of an instance as text
+    '''
+    if hasattr(instance, display):
+        try:
+            val = getattr(instance, display)
+        except:
+            val = ''
+    elif hasattr(resource, display):
+        try:
+            val = getattr(resource, display)(instance)
+        except:
+            val = ''
+    else:
+        val = '' #TODO raise ImproperlyConfigured
+    if callable(val):
+        try:
+            val = val()
+        except:
+            val = ''
+    return force_unicode(val)
+
 class ListForm(forms.Form):
     '''
     hyperadmin knows how to serialize forms, not models.
@@ -22,30 +45,16 @@ class ListForm(forms.Form):
                     label = self.resource.resource_name
                 self.fields[display] = forms.CharField(label=label)
                 if self.instance:
-                    if hasattr(self.instance, display):
-                        try:
-                            val = getattr(self.instance, display)
-                        except:
-                            val = ''
-                    elif hasattr(self.resource, display):
-                        try:
-                            val = getattr(self.resource, display)(self.instance)
-                        except:
-                            val = ''
-                    else:
-                        val = '' #TODO raise ImproperlyConfigured
-                    if callable(val):
-                        try:
-                            val = val()
-                        except:
-                            val = ''
-                    self.initial[display] = force_unicode(val)
+                    self.initial[display] = get_display_value(self.resource, self.instance, display)
         else:
             pass
             #TODO support all field listing as default
 
 class ListResourceItem(ResourceItem):
     form_class = ListForm
+    #media types read the display values without building the list form,
+    #set to False when the form kwargs of the item are customized
+    use_row_values = True
     
     def get_form_kwargs(self, **kwargs):
         kwargs = super(ListResourceItem, self).get_form_kwargs(**kwargs)
@@ -58,3 +67,61 @@ class ListResourceItem(ResourceItem):
     
     def get_idempotent_links(self):
         return []
+    
+    def get_row_values(self):
+        '''
+        Returns the values of the list form keyed by field name without
+        building the form, None if the item uses another form or does not
+        use row values
+        '''
+        if not self.use_row_values or self.get_form_class() is not ListForm:
+            return None
+        values = dict()
+        resource = self.resource
+        instance = self.instance
+        for display in resource.list_display:
+            if instance:
+                values[display] = get_display_value(resource, instance, display)
+            else:
+                values[display] = None
+        return values
+    
+    def get_template_form(self):
+        '''
+        Returns an unbound list form without an instance that describes the
+        fields of the row
+        '''
+        return self.get_form_class()(endpoint=self.endpoint)
+
+class ValuesListResourceItem(ListResourceItem):
+    '''
+    A list item backed by a row of values instead of a native object.
+    Media types may serialize the row directly, the native object is only
+    built from the row when it is asked for.
+    '''
+    def __init__(self, endpoint, row, db=None, datatap=None):
+        self.row = row
+        self.db = db
+        super(ValuesListResourceItem, self).__init__(endpoint=endpoint, instance=None, datatap=datatap)
+    
+    def _get_instance(self):
+        if self._instance is None and self.row is not None:
+            self._instance = self.resource.get_instance_from_row(self.row, db=self.db)
+        return self._instance
+    
+    def _set_instance(self, instance):
+        self._instance = instance
+    
+    instance = property(_get_instance, _set_instance)
+    
+    def get_row_values(self):
+        '''
+        Returns the display values of the row keyed by field name,
+        prepared like the values of the list form
+        '''
+        if not self.use_row_values:
+            return None
+        values = dict()
+        for display in self.resource.list_display:
+            values[display] = force_unicode(self.row[display])
+        return values
@@ -13,6 +13,9 @@ class CRUDResource(BaseResource):
     list_display = ('__str__',) #TODO should list all field by default
     list_resource_item_class = ListResourceItem
     paginator_class = Paginator
+    count_strategy = None
+    #stream collection responses, clients may also ask for a stream with a request parameter
+    stream_collections = False
     
     #TODO support the following:
     actions = []
@@ -62,6 +65,42 @@ class CRUDResource(BaseResource):
     def has_delete_permission(self, item=None):
         return True
     
+    def check_item_permissions(self, items):
+        '''
+        Called with a page of items before they are rendered so that object
+        level permissions may be evaluated at once.
+        '''
+        pass
+    
+    def get_list_version(self, index):
+        '''
+        Returns values that change when the objects of the filtered index
+        do, list responses are sent with an etag derived from them. None
+        disables conditional list responses.
+        '''
+        return None
+    
+    def get_item_version(self, item):
+        '''
+        Returns values that change when the item does or None
+        '''
+        return None
+    
+    def get_item_last_modified(self, item):
+        '''
+        Returns the datetime the item last changed or None
+        '''
+        return None
+    
+    def ingest_datatap(self, instream):
+        '''
+        Saves the objects read from a datatap uploaded to the list.
+        Returns the results of the upload or None when there are none to
+        report.
+        '''
+        self.get_datatap(instream=instream).commit()
+        return None
+    
     def on_create_success(self, item):
         '''
         Called when an item has been successfully created.
@@ -105,6 +144,21 @@ class CRUDResource(BaseResource):
         kwargs.setdefault('endpoint', self)
         return self.get_list_resource_item_class()(instance=instance, **kwargs)
     
+    def get_list_resource_items(self, instances, **kwargs):
+        '''
+        Wraps a page of native objects in list resource items
+        '''
+        return [self.get_list_resource_item(instance, **kwargs) for instance in instances]
+    
+    def iter_list_resource_items(self, instances, **kwargs):
+        '''
+        Returns an iterator over the list resource items of a page of
+        native objects, their permissions are checked
+        '''
+        items = self.get_list_resource_items(instances, **kwargs)
+        self.check_item_permissions(items)
+        return iter(items)
+    
     def get_instances(self):
         '''
         Returns a set of native objects for a given state
@@ -118,7 +172,7 @@ class CRUDResource(BaseResource):
     def get_resource_items(self):
         instances = self.get_instances()
         if self.state.has_view_class('change_list'):
-            return [self.get_list_resource_item(instance) for instance in instances]
+            return self.get_list_resource_items(instances)
         return [self.get_resource_item(instance) for instance in instances]
     
     def get_primary_query(self, **kwargs):
@@ -136,7 +190,19 @@ class CRUDResource(BaseResource):
     def get_paginator_kwargs(self):
         return {'per_page':getattr(self, 'list_per_page', 50),}
     
+    def get_count_strategy(self):
+        """
+        Returns the strategy used to count the objects of a list, see
+        `hyperadmin.paginators`. If None the paginator class counts.
+        """
+        if self.count_strategy is None:
+            return None
+        return self.count_strategy(self)
+    
     def get_paginator(self, index, **kwargs):
+        count_strategy = self.get_count_strategy()
+        if count_strategy is not None:
+            return count_strategy.get_paginator(index, **kwargs)
         return self.get_paginator_class()(index, **kwargs)
     
     def get_outbound_links(self):
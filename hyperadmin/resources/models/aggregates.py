@@ -0,0 +1,32 @@
+from django.db import connections
+from django.db.models.query import EmptyQuerySet
+from django.db.models.sql.datastructures import EmptyResultSet
+
+
+def count_ranges(queryset, field, field_path, ranges):
+    """
+    Counts the rows of queryset whose value of field_path falls within each
+    [since, until) range in one query. The bounds are prepared by the field
+    and passed as query parameters.
+    """
+    if not ranges:
+        return []
+    if isinstance(queryset, EmptyQuerySet):
+        return [0 for bounds in ranges]
+    #the primary key keeps distinct querysets from collapsing equal values
+    rows = queryset.order_by().values_list('pk', field_path)
+    connection = connections[rows.db]
+    try:
+        rows_sql, rows_params = rows.query.get_compiler(rows.db).as_sql()
+    except EmptyResultSet:
+        return [0 for bounds in ranges]
+    column = 'facet_rows.%s' % connection.ops.quote_name(field.column)
+    cases, params = list(), list()
+    for since, until in ranges:
+        cases.append('SUM(CASE WHEN %s >= %%s AND %s < %%s THEN 1 ELSE 0 END)' % (column, column))
+        params.append(field.get_db_prep_value(since, connection=connection))
+        params.append(field.get_db_prep_value(until, connection=connection))
+    sql = 'SELECT %s FROM (%s) facet_rows' % (', '.join(cases), rows_sql)
+    cursor = connection.cursor()
+    cursor.execute(sql, params + list(rows_params))
+    return [count or 0 for count in cursor.fetchone()]
@@ -0,0 +1,81 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+
+from hyperadmin.caches import LRUCache
+
+
+class ChoicesCache(object):
+    """
+    Caches the lookup choices of field filters by the filtered model, the
+    field path and the limit_choices_to of the field. Choices are kept in an
+    in process tier in front of the django cache and are dropped when an
+    object of the model providing the choices is saved or deleted.
+    """
+    timeout = 300
+    version_timeout = 60 * 60 * 24 * 30
+    key_prefix = 'hyperadmin-choices'
+
+    def __init__(self, max_size=256):
+        self.local = LRUCache(max_size)
+        self.watched_models = set()
+
+    def get_model_label(self, model):
+        return '%s.%s' % (model._meta.app_label, model._meta.object_name)
+
+    def get_version_key(self, source_model):
+        return '%s-version:%s' % (self.key_prefix, self.get_model_label(source_model))
+
+    def get_cache_key(self, model, field_path, limit_choices_to, source_model, limit=None):
+        version = cache.get(self.get_version_key(source_model), 0)
+        lookup_hash = hashlib.md5('%s:%s:%s' % (field_path, limit_choices_to, limit)).hexdigest()
+        return '%s:%s:%s:%s:%s' % (self.key_prefix, self.get_model_label(model),
+                                   self.get_model_label(source_model), version, lookup_hash)
+
+    def get_choices(self, model, field_path, limit_choices_to, source_model, get_choices, limit=None):
+        """
+        Returns the cached choices, get_choices is called to compute them
+        when neither tier holds them. Choices bounded by limit are cached
+        apart from the complete choices.
+        """
+        source_model = self.get_concrete_model(source_model)
+        self.watch(source_model)
+        key = self.get_cache_key(model, field_path, limit_choices_to, source_model, limit)
+        entry = self.local.get(key)
+        if entry is not None and entry[0] > time.time():
+            return entry[1]
+        choices = cache.get(key)
+        if choices is None:
+            choices = list(get_choices())
+            cache.set(key, choices, self.timeout)
+        self.local.set(key, (time.time() + self.timeout, choices))
+        return choices
+
+    def get_concrete_model(self, model):
+        #deferred and proxy classes send signals as themselves
+        return getattr(model._meta, 'concrete_model', None) or model
+
+    def watch(self, source_model):
+        if not self.watched_models:
+            dispatch_uid = '%s-%s' % (self.key_prefix, id(self))
+            post_save.connect(self.invalidate_sender, weak=False, dispatch_uid=dispatch_uid)
+            post_delete.connect(self.invalidate_sender, weak=False, dispatch_uid=dispatch_uid)
+        self.watched_models.add(self.get_concrete_model(source_model))
+
+    def invalidate_sender(self, sender, **kwargs):
+        model = self.get_concrete_model(sender)
+        if model in self.watched_models:
+            self.invalidate(model)
+
+    def invalidate(self, source_model):
+        key = self.get_version_key(source_model)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, self.version_timeout)
+        #the local tier may not see the new version when the django cache does not store it
+        self.local.clear()
+
+choices_cache = ChoicesCache()
@@ -1,5 +1,4 @@
 import datetime
-import operator
 
 from django.db import models
 from django.utils.encoding import smart_unicode
@@ -11,11 +10,13 @@ except ImportError:
 from django.contrib.admin.util import (get_model_from_relation,
     reverse_field_path, get_limit_choices_to_from_path, )
 try:
-    from django.contrib.admin.util import lookup_needs_distinct, prepare_lookup_value
+    from django.contrib.admin.util import prepare_lookup_value
 except ImportError:
-    from hyperadmin.resources.models.util import lookup_needs_distinct, prepare_lookup_value
+    from hyperadmin.resources.models.util import prepare_lookup_value
 
 from hyperadmin.filters import BaseChoicesFilter, BaseFilter
+from hyperadmin.resources.models.aggregates import count_ranges
+from hyperadmin.resources.models.choices import choices_cache
 
 SEARCH_VAR = 'q'
 
@@ -25,6 +26,7 @@ class SearchFilter(BaseFilter):
     def __init__(self, index, search_fields):
         super(SearchFilter, self).__init__(index)
         self.search_fields = search_fields
+        self.backend = self.resource.get_search_backend(search_fields)
     
     def value(self):
         return self.state.params.get(SEARCH_VAR, '')
@@ -33,38 +35,20 @@ class SearchFilter(BaseFilter):
         return bool(self.value())
     
     def filter_index(self, active_index):
-        use_distinct = False
         query = self.value()
-        
-        def construct_search(field_name):
-            if field_name.startswith('^'):
-                return "%s__istartswith" % field_name[1:]
-            elif field_name.startswith('='):
-                return "%s__iexact" % field_name[1:]
-            elif field_name.startswith('@'):
-                return "%s__search" % field_name[1:]
-            else:
-                return "%s__icontains" % field_name
-
-        if self.search_fields and query:
-            orm_lookups = [construct_search(str(search_field))
-                           for search_field in self.search_fields]
-            for bit in query.split():
-                or_queries = [models.Q(**{orm_lookup: bit})
-                              for orm_lookup in orm_lookups]
-                active_index = active_index.filter(reduce(operator.or_, or_queries))
-            if not use_distinct:
-                for search_spec in orm_lookups:
-                    if lookup_needs_distinct(self.resource.opts, search_spec):
-                        use_distinct = True
-                        break
-        if use_distinct:
-            return active_index.distinct()
+        if not (self.search_fields and query):
+            return active_index
+        active_index = self.backend.filter(active_index, query)
+        if self.resource.search_relevance and self.backend.supports_relevance:
+            active_index = self.backend.order_by_relevance(active_index, query)
         return active_index
 
 class FieldFilter(BaseChoicesFilter):
     _field_list_filters = []
     _take_priority_index = 0
+    
+    #caches lookup choices across requests, set to None to query them every time
+    choices_cache = choices_cache
 
     def __init__(self, field, field_path, index):
         self.field = field
@@ -87,6 +71,68 @@ class FieldFilter(BaseChoicesFilter):
     def filter_index(self, active_index):
         return active_index.filter(**self.used_parameters)
     
+    def get_choices_model(self):
+        '''
+        Returns the model whose objects provide the lookup choices
+        '''
+        return None
+    
+    def get_limit_choices_to(self):
+        return None
+    
+    def get_lookup_choices(self, limit=None):
+        '''
+        Returns the choices of the filter, no more than limit when given
+        '''
+        return []
+    
+    def get_choices_limit(self):
+        '''
+        Returns the number of choices loaded, one more than `max_choices`
+        is enough to tell the filter has too many
+        '''
+        if self.max_choices is None:
+            return None
+        return self.max_choices + 1
+    
+    @property
+    def lookup_choices(self):
+        if not hasattr(self, '_lookup_choices'):
+            choices_model = self.get_choices_model()
+            limit = self.get_choices_limit()
+            if self.choices_cache is None or choices_model is None:
+                self._lookup_choices = list(self.get_lookup_choices(limit))
+            else:
+                self._lookup_choices = self.choices_cache.get_choices(
+                    self.resource.model, self.field_path, self.get_limit_choices_to(),
+                    choices_model, lambda: self.get_lookup_choices(limit), limit=limit)
+        return self._lookup_choices
+    
+    def has_too_many_choices(self):
+        if self.max_choices is None:
+            return False
+        #the choices are bounded by get_choices_limit
+        return len(self.lookup_choices) > self.max_choices
+    
+    def get_search_parameter(self):
+        return self.lookup_kwarg
+    
+    def get_facet_lookup(self):
+        '''
+        Returns the lookup the objects are grouped by to count the choices
+        '''
+        return self.field_path
+    
+    def get_facet_counts(self, queryset):
+        lookup = self.get_facet_lookup()
+        rows = (queryset.order_by()
+                .values(lookup)
+                .annotate(facet_count=models.Count('pk', distinct=True)))
+        counts = dict()
+        for row in rows:
+            counts[self.get_facet_key(row[lookup])] = row['facet_count']
+        return counts
+    
     @classmethod
     def register(cls, test, list_filter_class, take_priority=False):
         if take_priority:
@@ -100,20 +146,29 @@ class FieldFilter(BaseChoicesFilter):
             cls._field_list_filters.append((test, list_filter_class))
 
     @classmethod
-    def create(cls, field, field_path, index):
+    def get_filter_class(cls, field):
         for test, list_filter_class in cls._field_list_filters:
-            if not test(field):
-                continue
+            if test(field):
+                return list_filter_class
+        return None
+
+    @classmethod
+    def create(cls, field, field_path, index):
+        list_filter_class = cls.get_filter_class(field)
+        if list_filter_class is not None:
             return list_filter_class(field, field_path, index)
 
 
 class RelatedFieldFilter(FieldFilter):
+    max_choices = 200
+    
     def __init__(self, field, field_path, index):
         other_model = get_model_from_relation(field)
         rel_name = other_model._meta.pk.name
+        self.other_model = other_model
         self.lookup_kwarg = '%s__%s__exact' % (field_path, rel_name)
         self.lookup_kwarg_isnull = '%s__isnull' % field_path
-        self.lookup_choices = field.get_choices(include_blank=False)
+        self.facet_lookup = '%s__%s' % (field_path, rel_name)
         super(RelatedFieldFilter, self).__init__(
             field, field_path, index)
         if hasattr(field, 'verbose_name'):
@@ -121,6 +176,26 @@ class RelatedFieldFilter(FieldFilter):
         else:
             self.lookup_title = other_model._meta.verbose_name
         self.title = self.lookup_title
+    
+    def get_choices_model(self):
+        return self.other_model
+    
+    def get_limit_choices_to(self):
+        if isinstance(self.field, models.related.RelatedObject):
+            return self.field.field.rel.limit_choices_to
+        return self.field.rel.limit_choices_to
+    
+    def get_lookup_choices(self, limit=None):
+        #field.get_choices loads every object of the related model
+        queryset = self.other_model._default_manager.all()
+        if not isinstance(self.field, models.related.RelatedObject):
+            queryset = queryset.complex_filter(self.field.rel.limit_choices_to)
+        if limit is not None:
+            queryset = queryset[:limit]
+        return [(obj._get_pk_val(), smart_unicode(obj)) for obj in queryset]
+    
+    def get_facet_lookup(self):
+        return self.facet_lookup
 
     def has_output(self):
         if (isinstance(self.field, models.related.RelatedObject)
@@ -155,6 +230,7 @@ class RelatedFieldFilter(FieldFilter):
                     self.lookup_kwarg: pk_val,
                 }, [self.lookup_kwarg_isnull]),
                 'display': val,
+                'count': self.get_facet_count(pk_val),
             }
         if (isinstance(self.field, models.related.RelatedObject)
                 and self.field.field.null or hasattr(self.field, 'rel')
@@ -165,6 +241,7 @@ class RelatedFieldFilter(FieldFilter):
                     self.lookup_kwarg_isnull: 'True',
                 }, [self.lookup_kwarg]),
                 'display': EMPTY_CHANGELIST_VALUE,
+                'count': self.get_facet_count(None),
             }
 
 FieldFilter.register(lambda f: (
@@ -180,6 +257,12 @@ class BooleanFieldFilter(FieldFilter):
 
     def expected_parameters(self):
         return [self.lookup_kwarg, self.lookup_kwarg2]
+    
+    def get_facet_key(self, value):
+        if value is None:
+            return None
+        #databases without a boolean type return integers
+        return bool(int(value))
 
     def choices(self):
         lookup_val, lookup_val2 = self.values()
@@ -193,6 +276,7 @@ class BooleanFieldFilter(FieldFilter):
                         self.lookup_kwarg: lookup,
                     }, [self.lookup_kwarg2]),
                 'display': title,
+                'count': self.get_facet_count(lookup) if lookup is not None else None,
             }
         if isinstance(self.field, models.NullBooleanField):
             yield {
@@ -201,6 +285,7 @@ class BooleanFieldFilter(FieldFilter):
                         self.lookup_kwarg2: 'True',
                     }, [self.lookup_kwarg]),
                 'display': _('Unknown'),
+                'count': self.get_facet_count(None),
             }
 
 FieldFilter.register(lambda f: isinstance(f,
@@ -229,6 +314,7 @@ class ChoicesFieldFilter(FieldFilter):
                 'query_string': self.state.get_query_string({
                                     self.lookup_kwarg: lookup}),
                 'display': title,
+                'count': self.get_facet_count(lookup),
             }
 
 FieldFilter.register(lambda f: bool(f.choices), ChoicesFieldFilter)
@@ -285,14 +371,28 @@ class DateFieldFilter(FieldFilter):
 
     def expected_parameters(self):
         return [self.lookup_kwarg_since, self.lookup_kwarg_until]
+    
+    def get_facet_counts(self, queryset):
+        '''
+        Counts every date range in one query, the counts are keyed by the
+        position of the range in the links
+        '''
+        positions, ranges = list(), list()
+        for position, (title, param_dict) in enumerate(self.links):
+            if param_dict:
+                positions.append(position)
+                ranges.append((param_dict[self.lookup_kwarg_since], param_dict[self.lookup_kwarg_until]))
+        counts = count_ranges(queryset, self.field, self.field_path, ranges)
+        return dict([(self.get_facet_key(position), count) for position, count in zip(positions, counts)])
 
     def choices(self):
-        for title, param_dict in self.links:
+        for position, (title, param_dict) in enumerate(self.links):
             yield {
                 'selected': self.date_params == param_dict,
                 'query_string': self.state.get_query_string(
                                     param_dict, [self.field_generic]),
                 'display': title,
+                'count': self.get_facet_count(position) if param_dict else None,
             }
 
 FieldFilter.register(
@@ -303,6 +403,8 @@ FieldFilter.register(
 # if a field is eligible to use the BooleanFieldFilter, that'd be much
 # more appropriate, and the AllValuesFieldFilter won't get used for it.
 class AllValuesFieldFilter(FieldFilter):
+    max_choices = 200
+    
     def __init__(self, field, field_path, index):
         super(AllValuesFieldFilter, self).__init__(
             field, field_path, index)
@@ -311,19 +413,28 @@ class AllValuesFieldFilter(FieldFilter):
         
         self.lookup_kwarg = field_path
         self.lookup_kwarg_isnull = '%s__isnull' % field_path
-        parent_model, reverse_path = reverse_field_path(model, field_path)
-        queryset = parent_model._default_manager.all()
+        self.parent_model, reverse_path = reverse_field_path(model, field_path)
+        self.limit_choices_to = get_limit_choices_to_from_path(model, field_path)
+    
+    def get_choices_model(self):
+        return self.parent_model
+    
+    def get_limit_choices_to(self):
+        return self.limit_choices_to
+    
+    def get_lookup_choices(self, limit=None):
+        queryset = self.parent_model._default_manager.all()
         # optional feature: limit choices base on existing relationships
         # queryset = queryset.complex_filter(
         #    {'%s__isnull' % reverse_path: False})
-        limit_choices_to = get_limit_choices_to_from_path(model, field_path)
-        queryset = queryset.filter(limit_choices_to)
-
-        self.lookup_choices = (queryset
-                               .distinct()
-                               .order_by(field.name)
-                               .values_list(field.name, flat=True))
-        
+        queryset = queryset.filter(self.limit_choices_to)
+        queryset = (queryset
+                    .distinct()
+                    .order_by(self.field.name)
+                    .values_list(self.field.name, flat=True))
+        if limit is not None:
+            queryset = queryset[:limit]
+        return queryset
 
     def expected_parameters(self):
         return [self.lookup_kwarg, self.lookup_kwarg_isnull]
@@ -350,6 +461,7 @@ class AllValuesFieldFilter(FieldFilter):
                     self.lookup_kwarg: val,
                 }, [self.lookup_kwarg_isnull]),
                 'display': val,
+                'count': self.get_facet_count(val),
             }
         if include_none:
             yield {
@@ -358,6 +470,7 @@ class AllValuesFieldFilter(FieldFilter):
                     self.lookup_kwarg_isnull: 'True',
                 }, [self.lookup_kwarg]),
                 'display': EMPTY_CHANGELIST_VALUE,
+                'count': self.get_facet_count(None),
             }
 
 FieldFilter.register(lambda f: True, AllValuesFieldFilter)
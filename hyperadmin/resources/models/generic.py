@@ -38,6 +38,11 @@ class GenericInlineModelResource(InlineModelResource):
     def get_primary_query(self, **kwargs):
         return self.get_queryset(parent=self.state['parent'].instance)
     
+    def get_url_param_fields(self):
+        names = super(InlineModelResource, self).get_url_param_fields()
+        names.extend([self.ct_field, self.ct_fk_field])
+        return names
+    
     def get_form_class(self):
         if self.form_class:
             return self.form_class
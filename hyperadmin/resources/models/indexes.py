@@ -1,7 +1,157 @@
+import base64
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.utils.encoding import force_unicode
+
 from hyperadmin.indexes import Index
+from hyperadmin.paginators import CachedCount
+
+
+class CursorPage(object):
+    """
+    A page of a cursor paginator
+    """
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+    
+    def __len__(self):
+        return len(self.object_list)
+    
+    def __iter__(self):
+        return iter(self.object_list)
+    
+    def __getitem__(self, index):
+        return self.object_list[index]
+    
+    def has_next(self):
+        return self._has_next
+    
+    def has_previous(self):
+        return self._has_previous
+    
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+    
+    @property
+    def next_cursor(self):
+        if self.has_next() and self.object_list:
+            return self.paginator.encode_cursor(self.object_list[-1])
+        return None
+    
+    @property
+    def previous_cursor(self):
+        if self.has_previous() and self.object_list:
+            return self.paginator.encode_cursor(self.object_list[0])
+        return None
 
+class CursorPaginator(object):
+    """
+    Paginates a queryset by seeking past an indexed field instead of using
+    offsets. Pages are addressed by opaque cursors, ``after`` returns the
+    page following the cursor and ``before`` the page preceding it. Prefix
+    the cursor field with ``-`` for descending order. Objects sharing the
+    value of a field that is not unique are ordered by their primary key.
+    """
+    count = None
+    num_pages = None
+    
+    def __init__(self, queryset, per_page, cursor_field='pk', after=None, before=None):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.descending = cursor_field.startswith('-')
+        self.cursor_field = cursor_field.lstrip('-')
+        self.after = after
+        self.before = before
+        self._page = None
+    
+    def get_field(self):
+        opts = self.queryset.model._meta
+        if self.cursor_field == 'pk':
+            return opts.pk
+        return opts.get_field(self.cursor_field)
+    
+    def get_cursor_fields(self):
+        '''
+        Returns the lookups of the cursor, the primary key breaks ties of
+        fields that are not unique
+        '''
+        field = self.get_field()
+        if field.unique:
+            return [(self.cursor_field, field)]
+        return [(self.cursor_field, field), ('pk', self.queryset.model._meta.pk)]
+    
+    def encode_cursor(self, obj):
+        values = [force_unicode(getattr(obj, field.attname)) for lookup, field in self.get_cursor_fields()]
+        return base64.urlsafe_b64encode(json.dumps(values)).rstrip('=')
+    
+    def decode_cursor(self, cursor):
+        '''
+        Returns the values of the cursor converted by the cursor fields
+        '''
+        fields = self.get_cursor_fields()
+        try:
+            cursor = str(cursor)
+            cursor += '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(cursor))
+            if not isinstance(values, list) or len(values) != len(fields):
+                raise ValueError('Cursor does not match the cursor fields')
+            return [field.to_python(value) for (lookup, field), value in zip(fields, values)]
+        except (TypeError, ValueError, UnicodeError, ValidationError):
+            raise InvalidPage('Invalid cursor')
+    
+    def get_ordering(self, reverse=False):
+        prefix = '-' if self.descending != reverse else ''
+        return ['%s%s' % (prefix, lookup) for lookup, field in self.get_cursor_fields()]
+    
+    def seek(self, cursor, reverse=False):
+        operator = 'lt' if self.descending != reverse else 'gt'
+        values = self.decode_cursor(cursor)
+        lookups = [lookup for lookup, field in self.get_cursor_fields()]
+        #(a, b) > (x, y) is a > x or a = x and b > y
+        seek_q = None
+        for index, lookup in enumerate(lookups):
+            q = Q(**{'%s__%s' % (lookup, operator): values[index]})
+            for previous, value in zip(lookups[:index], values[:index]):
+                q &= Q(**{previous: value})
+            seek_q = q if seek_q is None else seek_q | q
+        return self.queryset.filter(seek_q)
+    
+    def page(self, number=None):
+        """
+        Returns the page addressed by the cursors, the page number is ignored
+        """
+        if self._page is None:
+            self._page = self.get_page()
+        return self._page
+    
+    def get_page(self):
+        if self.before:
+            queryset = self.seek(self.before, reverse=True).order_by(*self.get_ordering(reverse=True))
+            object_list = list(queryset[:self.per_page + 1])
+            has_previous = len(object_list) > self.per_page
+            object_list = object_list[:self.per_page]
+            object_list.reverse()
+            return CursorPage(object_list, self, has_next=True, has_previous=has_previous)
+        if self.after:
+            queryset = self.seek(self.after)
+        else:
+            queryset = self.queryset
+        object_list = list(queryset.order_by(*self.get_ordering())[:self.per_page + 1])
+        has_next = len(object_list) > self.per_page
+        return CursorPage(object_list[:self.per_page], self, has_next=has_next, has_previous=bool(self.after))
 
 class ModelIndex(Index):
+    cursor_paginator_class = CursorPaginator
+    after_var = 'after'
+    before_var = 'before'
+    
     @property
     def model(self):
         return self.resource.model
@@ -9,6 +159,57 @@ class ModelIndex(Index):
     def get_primary_field(self):
         return self.model._meta.pk
     
+    def get_filtered_index(self):
+        active_index = super(ModelIndex, self).get_filtered_index()
+        return self.resource.plan_queryset(active_index, 'list')
+    
+    def get(self, **kwargs):
+        return self.resource.plan_queryset(self.get_index_query(), 'detail').get(**kwargs)
+    
+    def is_faceted(self):
+        return getattr(self.resource, 'list_facets', False)
+    
+    def compute_facet_counts(self):
+        '''
+        Returns the choice counts of the filters keyed by the position of
+        the filter, each filter counts with one aggregate query
+        '''
+        queryset = super(ModelIndex, self).get_filtered_index()
+        counts = dict()
+        for position, a_filter in enumerate(self.filters):
+            if not hasattr(a_filter, 'get_facet_counts') or a_filter.has_too_many_choices():
+                continue
+            filter_counts = a_filter.get_facet_counts(queryset)
+            if filter_counts is not None:
+                counts[position] = filter_counts
+        return counts
+    
+    def get_facet_counts(self):
+        '''
+        Returns the choice counts of the filters, they are cached alongside
+        the count of the list when the resource caches counts
+        '''
+        if not hasattr(self, '_facet_counts'):
+            count_strategy = self.resource.get_count_strategy()
+            if isinstance(count_strategy, CachedCount):
+                key = '%s:facets:%s' % (count_strategy.get_cache_key(), self.name)
+                counts = cache.get(key)
+                if counts is None:
+                    counts = self.compute_facet_counts()
+                    cache.set(key, counts, count_strategy.timeout)
+            else:
+                counts = self.compute_facet_counts()
+            self._facet_counts = counts
+        return self._facet_counts
+    
+    def get_filter_links(self, **link_kwargs):
+        if self.is_faceted():
+            counts = self.get_facet_counts()
+            for position, a_filter in enumerate(self.filters):
+                if position in counts:
+                    a_filter.facet_counts = counts[position]
+        return super(ModelIndex, self).get_filter_links(**link_kwargs)
+    
     def get_url_params(self, param_map={}):
         """
         returns url parts for use in the url regexp for conducting item lookups
@@ -23,7 +224,57 @@ class ModelIndex(Index):
         return [r'(?P<{pk}>[\w\d\-]+)'.format(**param_map)]
     
     def get_paginator_kwargs(self):
-        return {'per_page':self.resource.list_per_page,}
+        kwargs = {'per_page':self.resource.list_per_page,}
+        if self.is_cursor_paginated():
+            kwargs['cursor_field'] = self.resource.get_cursor_field()
+            kwargs['after'] = self.state.params.get(self.after_var, None)
+            kwargs['before'] = self.state.params.get(self.before_var, None)
+        return kwargs
+    
+    def is_cursor_paginated(self):
+        return getattr(self.resource, 'cursor_pagination', False)
+    
+    def get_paginator(self, **kwargs):
+        if self.is_cursor_paginated():
+            index = self.get_filtered_index()
+            kwargs.update(self.get_paginator_kwargs())
+            return self.cursor_paginator_class(index, **kwargs)
+        return super(ModelIndex, self).get_paginator(**kwargs)
+    
+    def get_page(self, paginator=None):
+        if self.is_cursor_paginated():
+            if paginator is None:
+                paginator = self.get_active_paginator()
+            try:
+                return paginator.page()
+            except InvalidPage:
+                #malformed cursors are served the first page
+                paginator.after = paginator.before = None
+                return paginator.page()
+        return super(ModelIndex, self).get_page(paginator)
+    
+    def get_pagination_links(self, **link_kwargs):
+        if not self.is_cursor_paginated():
+            return super(ModelIndex, self).get_pagination_links(**link_kwargs)
+        links = list()
+        if 'paginator' in self.state:
+            page = self.get_page()
+            cursors = [
+                ('previous', {self.before_var: page.previous_cursor, self.after_var: None}),
+                ('next', {self.after_var: page.next_cursor, self.before_var: None}),
+            ]
+            for name, params in cursors:
+                if not (params[self.before_var] or params[self.after_var]):
+                    continue
+                kwargs = {
+                    'url': self.state.get_query_string(params),
+                    'prompt': name,
+                    'classes': ["pagination"],
+                    'rel': name,
+                }
+                kwargs.update(link_kwargs)
+                links.append(self.get_link(**kwargs))
+        return links
     
     def get_links(self):
         links = super(ModelIndex, self).get_links()
@@ -51,5 +302,9 @@ class ModelIndex(Index):
         return links
 
 class InlineIndex(Index):
+    def get_filtered_index(self):
+        active_index = super(InlineIndex, self).get_filtered_index()
+        return self.resource.plan_queryset(active_index, 'list')
+    
     def get(self, **kwargs):
-        return self.get_index_query().get(pk=kwargs['inline_pk'])
+        return self.resource.plan_queryset(self.get_index_query(), 'detail').get(pk=kwargs['inline_pk'])
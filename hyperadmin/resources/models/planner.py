@@ -0,0 +1,204 @@
+from django import forms
+from django.db import models
+from django.db.models.fields import FieldDoesNotExist
+from django.db.models.query import QuerySet
+from django.db.backends.util import truncate_name
+from django.db.models.query_utils import DeferredAttribute
+
+
+class LoggedDeferredAttribute(DeferredAttribute):
+    """
+    A deferred attribute that logs when a pruned column has to be loaded
+    """
+    def __init__(self, field_name, model, logger):
+        super(LoggedDeferredAttribute, self).__init__(field_name, model)
+        self.model = model
+        self.logger = logger
+
+    def __get__(self, instance, owner):
+        if instance is not None and self.field_name not in instance.__dict__:
+            self.logger.warning('Loading deferred field %s.%s of %s, add it to prune_extra_fields' %
+                                (self.model._meta.object_name, self.field_name, instance.pk))
+        return super(LoggedDeferredAttribute, self).__get__(instance, owner)
+
+_logged_classes = dict()
+
+def get_logged_class(deferred_model, logger):
+    """
+    Returns a private subclass of a deferred model class whose deferred
+    attributes log their loads, the deferred classes django shares between
+    querysets are left untouched
+    """
+    key = (deferred_model, logger)
+    if key not in _logged_classes:
+        model = deferred_model._meta.proxy_for_model
+        attrs = dict([(attname, LoggedDeferredAttribute(attname, model, logger))
+                      for attname, value in deferred_model.__dict__.items()
+                      if isinstance(value, DeferredAttribute)])
+
+        class Meta:
+            proxy = True
+            app_label = model._meta.app_label
+
+        attrs.update(Meta=Meta, __module__=model.__module__, _deferred=True)
+        name = truncate_name('%s_Logged' % deferred_model.__name__, 80, 32)
+        _logged_classes[key] = type(name, (deferred_model,), attrs)
+    return _logged_classes[key]
+
+class QueryPlanner(object):
+    """
+    Plans the select_related and prefetch_related lookups of a model
+    resource queryset from the fields that are going to be rendered.
+    List querysets follow the relations in `list_display`, detail querysets
+    follow the relations of the item form's model choice fields.
+
+    When the resource sets `prune_columns` the querysets also load only
+    the columns of the rendered fields, loads of the deferred columns are
+    logged.
+    """
+    #prefetch_related needs Django 1.4, without it plans only select related
+    supports_prefetch = hasattr(QuerySet, 'prefetch_related')
+    
+    def __init__(self, resource):
+        self.resource = resource
+        self.plans = dict()
+        self.columns = dict()
+
+    @property
+    def opts(self):
+        return self.resource.opts
+
+    def get_relation(self, name):
+        """
+        Returns 'select' for forward single valued relations, 'prefetch'
+        for many valued relations and None otherwise
+        """
+        try:
+            field, model, direct, m2m = self.opts.get_field_by_name(name)
+        except FieldDoesNotExist:
+            return None
+        if m2m:
+            return 'prefetch'
+        if direct:
+            if isinstance(field, (models.ForeignKey, models.OneToOneField)):
+                return 'select'
+            return None
+        if field.field.unique:
+            #reverse one to one relations may be missing, leave them lazy
+            return None
+        return 'prefetch'
+
+    def plan_fields(self, names):
+        select_related, prefetch_related = list(), list()
+        for name in names:
+            relation = self.get_relation(name)
+            if relation == 'select':
+                select_related.append(name)
+            elif relation == 'prefetch':
+                prefetch_related.append(name)
+        if not self.supports_prefetch:
+            prefetch_related = list()
+        return select_related, prefetch_related
+
+    def get_columns(self, names, select_related):
+        """
+        Returns the names of the concrete fields among names along with the
+        fields addressing the items, None if every column is needed
+        """
+        field_names = [field.name for field in self.opts.fields]
+        names = list(names) + self.resource.get_url_param_fields() + list(self.resource.prune_extra_fields)
+        if self.resource.version_field:
+            #validators of the responses read the version
+            names.append(self.resource.version_field)
+        if select_related:
+            #relations followed by select_related may not be deferred
+            names.extend([lookup.split('__', 1)[0] for lookup in select_related])
+        columns = list()
+        for name in names:
+            if name in field_names and name not in columns:
+                columns.append(name)
+        if len(columns) == len(field_names):
+            return None
+        return columns
+
+    def get_list_columns(self):
+        return self.get_columns(self.get_list_fields(), self.get_plan('list')[0])
+
+    def get_detail_columns(self):
+        form_class = self.resource.get_form_class()
+        names = list(getattr(form_class, 'base_fields', {}).keys())
+        return self.get_columns(names, self.get_plan('detail')[0])
+
+    def log_deferred_loads(self, instance):
+        """
+        Returns instance with the loads of its deferred columns logged
+        """
+        if getattr(instance, '_deferred', False):
+            instance.__class__ = get_logged_class(type(instance), self.resource.get_logger())
+        return instance
+
+    def get_columns_plan(self, name):
+        if name not in self.columns:
+            columns = None
+            if self.resource.prune_columns:
+                columns = getattr(self, 'get_%s_columns' % name)()
+            self.columns[name] = columns
+        return self.columns[name]
+
+    def apply_columns(self, queryset, columns):
+        if columns is None:
+            return queryset
+        return queryset.only(*columns)
+
+    def get_list_fields(self):
+        return [name for name in self.resource.list_display if isinstance(name, basestring)]
+
+    def get_detail_fields(self):
+        names = list()
+        form_class = self.resource.get_form_class()
+        for name, field in getattr(form_class, 'base_fields', {}).iteritems():
+            if isinstance(field, forms.ModelChoiceField):
+                names.append(name)
+        if self.resource.fields:
+            names = [name for name in names if name in self.resource.fields]
+        return names
+
+    def get_list_plan(self):
+        """
+        Returns the lookups to select and prefetch for list querysets,
+        `list_select_related` and `list_prefetch_related` of the resource
+        take precedence over the planned lookups
+        """
+        select_related, prefetch_related = self.plan_fields(self.get_list_fields())
+        if self.resource.list_select_related is True:
+            select_related = None
+        elif self.resource.list_select_related:
+            select_related = list(self.resource.list_select_related)
+        if self.resource.list_prefetch_related is not None and self.supports_prefetch:
+            prefetch_related = list(self.resource.list_prefetch_related)
+        return select_related, prefetch_related
+
+    def get_detail_plan(self):
+        return self.plan_fields(self.get_detail_fields())
+
+    def apply_plan(self, queryset, select_related, prefetch_related):
+        if select_related is None:
+            queryset = queryset.select_related()
+        elif select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related and hasattr(queryset, 'prefetch_related'):
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+    def get_plan(self, name):
+        if name not in self.plans:
+            self.plans[name] = getattr(self, 'get_%s_plan' % name)()
+        return self.plans[name]
+
+    def plan_list(self, queryset):
+        queryset = self.apply_plan(queryset, *self.get_plan('list'))
+        return self.apply_columns(queryset, self.get_columns_plan('list'))
+
+    def plan_detail(self, queryset):
+        queryset = self.apply_plan(queryset, *self.get_plan('detail'))
+        return self.apply_columns(queryset, self.get_columns_plan('detail'))
@@ -1,9 +1,29 @@
+import datetime
+from itertools import islice
+
 from django.conf.urls.defaults import patterns, url, include
 from django import forms
+from django.core.exceptions import ValidationError
+from django.db import models, router, transaction, DatabaseError
+from django.db.models.fields import FieldDoesNotExist
+from django.db.models.query import QuerySet
+try:
+    from django.db.models.query import prefetch_related_objects
+except ImportError:
+    #django < 1.4 does not prefetch
+    prefetch_related_objects = None
+from django.db.models.query_utils import deferred_class_factory
+
+#django < 1.4 saves uploaded objects one at a time
+BULK_CREATE = hasattr(QuerySet, 'bulk_create')
 
 from hyperadmin.apirequests import Namespace
 from hyperadmin.resources.crud import CRUDResource
+from hyperadmin.resources.crud.hyperobjects import ListResourceItem, ValuesListResourceItem
+from hyperadmin.resources.models.choices import choices_cache
 from hyperadmin.resources.models.indexes import ModelIndex, InlineIndex
+from hyperadmin.resources.models.planner import QueryPlanner
+from hyperadmin.resources.models.search import ContainsSearchBackend, get_search_backend
 from hyperadmin.resources.models.endpoints import ListEndpoint, CreateEndpoint, DetailEndpoint, DeleteEndpoint
 from hyperadmin.resources.models.endpoints import InlineListEndpoint, InlineCreateEndpoint, InlineDetailEndpoint, InlineDeleteEndpoint
 
@@ -31,12 +51,49 @@ class BaseModelResource(CRUDResource):
     list_display_links = ()
     list_filter = ()
     list_select_related = False
+    list_prefetch_related = None
     list_per_page = 100
     list_max_show_all = 200
     list_editable = ()
     search_fields = ()
     date_hierarchy = None
     
+    #searches search_fields, see hyperadmin.resources.models.search
+    search_backend = ContainsSearchBackend
+    #order search results by relevance when the backend ranks its matches
+    search_relevance = False
+    
+    #pages are addressed by cursors over an indexed field instead of page numbers, ties are broken by the primary key
+    cursor_pagination = False
+    cursor_field = 'pk'
+    
+    #get_index builds only the requested index, set to False when get_indexes is overridden
+    build_indexes_by_name = True
+    
+    #plans select_related & prefetch_related from the rendered fields, set to None to disable
+    query_planner_class = QueryPlanner
+    
+    #load only the columns of the rendered fields, loads of the deferred columns are logged
+    prune_columns = False
+    #columns loaded besides the rendered fields, such as those read by the item prompt
+    prune_extra_fields = ()
+    
+    #fetch lists of concrete fields as rows of values, item links, permission checks and prompts
+    #build an instance from the row which loads fields other than the displayed ones and
+    #prune_extra_fields when they are read
+    list_values = False
+    list_values_resource_item_class = ValuesListResourceItem
+    #streamed lists are read from the database, wrapped and checked this many objects at a time
+    stream_chunk_size = 100
+    #objects of a datatap upload are validated and saved this many at a time
+    ingest_batch_size = 500
+    
+    #filter links carry the number of objects of the filtered list matching them
+    list_facets = False
+    
+    #field holding the version or modification time of objects, responses are sent with validators derived from it
+    version_field = None
+    
     @property
     def opts(self):
         return self.resource_adaptor._meta
@@ -50,57 +107,106 @@ class BaseModelResource(CRUDResource):
     def get_primary_query(self, **kwargs):
         return self.get_queryset()
     
-    def get_indexes(self):
-        #from hyperadmin.resources.indexes import Index
+    def get_cursor_field(self):
+        return self.cursor_field
+    
+    def get_search_backend(self, search_fields=None):
+        if search_fields is None:
+            search_fields = self.search_fields
+        if not search_fields or self.search_backend is None:
+            return None
+        return get_search_backend(self.search_backend, self.resource_adaptor, search_fields)
+    
+    def get_url_param_fields(self):
+        '''
+        Returns the names of the fields read for addressing items
+        '''
+        names = [self.opts.pk.name]
+        if self.cursor_pagination:
+            names.append(self.get_cursor_field().lstrip('-'))
+        return names
+    
+    def compile_index_definitions(self):
+        '''
+        Returns a dictionary mapping index names to the index class and the
+        filter specs of the index
+        '''
         from hyperadmin.resources.models.filters import FieldFilter, SearchFilter
 
         from django.db import models
         from django.contrib.admin.util import get_fields_from_path
-        try:
-            from django.contrib.admin.util import lookup_needs_distinct
-        except ImportError:
-            from hyperadmin.resources.models.util import lookup_needs_distinct
         
-        indexes = {'primary': ModelIndex('primary', self)}
-        
-        index = ModelIndex('filter', self)
-        indexes['filter'] = index
+        filter_specs = list()
         
         if self.list_filter:
             for list_filter in self.list_filter:
-                use_distinct = False
                 if callable(list_filter):
                     # This is simply a custom list filter class.
-                    spec = list_filter(index=index)
+                    filter_specs.append((list_filter, {}))
                 else:
                     field_path = None
                     if isinstance(list_filter, (tuple, list)):
                         # This is a custom FieldListFilter class for a given field.
                         field, field_list_filter_class = list_filter
                     else:
-                        # This is simply a field name, so use the default
+                        # This is simply a field name, the default
                         # FieldListFilter class that has been registered for
-                        # the type of the given field.
-                        field, field_list_filter_class = list_filter, FieldFilter.create
+                        # the type of the given field is looked up below.
+                        field, field_list_filter_class = list_filter, None
                     if not isinstance(field, models.Field):
                         field_path = field
                         field = get_fields_from_path(self.model, field_path)[-1]
-                    spec = field_list_filter_class(field, field_path=field_path, index=index)
-                    # Check if we need to use distinct()
-                    use_distinct = (use_distinct or
-                                    lookup_needs_distinct(self.opts,
-                                                          field_path))
-                if spec:
-                    index.filters.append(spec)
+                    if field_list_filter_class is None:
+                        field_list_filter_class = FieldFilter.get_filter_class(field)
+                        if field_list_filter_class is None:
+                            continue
+                    filter_specs.append((field_list_filter_class, {'field':field, 'field_path':field_path}))
         
         if self.search_fields:
-            index.register_filter(SearchFilter, search_fields=self.search_fields)
+            filter_specs.append((SearchFilter, {'search_fields':self.search_fields}))
         '''
         date_section = self.register_section('date', FilterSection)
         if self.date_hierarchy:
             pass
         '''
-        return indexes
+        return {'primary': (ModelIndex, []),
+                'filter': (ModelIndex, filter_specs),}
+    
+    def get_index_definitions(self):
+        '''
+        Returns the compiled index definitions, they are compiled once per
+        resource class and model and recompiled when list_filter or
+        search_fields are replaced
+        '''
+        cls = type(self)
+        if '_index_definitions' not in cls.__dict__:
+            cls._index_definitions = dict()
+        compiled = cls._index_definitions.get(self.resource_adaptor, None)
+        if (compiled is None or compiled[0] is not self.list_filter or
+            compiled[1] is not self.search_fields):
+            compiled = (self.list_filter, self.search_fields, self.compile_index_definitions())
+            cls._index_definitions[self.resource_adaptor] = compiled
+        return compiled[2]
+    
+    def get_index(self, name):
+        '''
+        Returns the named index, only that index is built unless
+        `build_indexes_by_name` is turned off
+        '''
+        if not self.build_indexes_by_name:
+            return self.get_indexes()[name]
+        return self.build_index(name)
+    
+    def build_index(self, name):
+        '''
+        Binds the named index to the resource, the filters of the index are
+        built when they are first used
+        '''
+        index_class, filter_specs = self.get_index_definitions()[name]
+        return index_class(name, self, filter_specs=filter_specs)
+    
+    def get_indexes(self):
+        return dict([(name, self.build_index(name)) for name in self.get_index_definitions()])
     
     def lookup_allowed(self, lookup, value):
         '''Currently unused'''
@@ -112,24 +218,156 @@ class BaseModelResource(CRUDResource):
             queryset = queryset.none()
         return queryset
     
+    def get_query_planner(self):
+        if self.query_planner_class is None:
+            return None
+        if getattr(self, '_query_planner', None) is None:
+            self._query_planner = self.query_planner_class(self)
+        return self._query_planner
+    
+    def plan_queryset(self, queryset, name):
+        """
+        Applies the lookups and columns planned for 'list' or 'detail'
+        querysets, indexes plan their filtered querysets as lists and their
+        item lookups as details
+        """
+        planner = self.get_query_planner()
+        if planner is None:
+            return queryset
+        return getattr(planner, 'plan_%s' % name)(queryset)
+    
+    def log_deferred_loads(self, instance):
+        """
+        Has the planner log the loads of columns pruned from instance
+        """
+        planner = self.get_query_planner()
+        if planner is None or not self.prune_columns:
+            return instance
+        return planner.log_deferred_loads(instance)
+    
+    def get_resource_item(self, instance, **kwargs):
+        return super(BaseModelResource, self).get_resource_item(self.log_deferred_loads(instance), **kwargs)
+    
+    def get_list_resource_item(self, instance, **kwargs):
+        return super(BaseModelResource, self).get_list_resource_item(self.log_deferred_loads(instance), **kwargs)
+    
+    def get_list_values_fields(self):
+        '''
+        Returns the columns to fetch for a list of values, the displayed
+        fields and those addressing the items, or None if the list display
+        requires native objects
+        '''
+        if not self.list_values or self.get_list_resource_item_class() is not ListResourceItem:
+            return None
+        if self.opts.pk.rel is not None:
+            return None
+        columns = [self.opts.pk.attname]
+        for display in self.list_display:
+            try:
+                field = self.opts.get_field(display)
+            except FieldDoesNotExist:
+                return None
+            if field.rel is not None:
+                return None
+            columns.append(field.attname)
+        names = self.get_url_param_fields() + list(self.prune_extra_fields)
+        if self.version_field:
+            names.append(self.version_field)
+        for name in names:
+            try:
+                columns.append(self.opts.get_field(name).attname)
+            except FieldDoesNotExist:
+                pass
+        unique_columns = list()
+        for column in columns:
+            if column not in unique_columns:
+                unique_columns.append(column)
+        return unique_columns
+    
+    def get_instance_from_row(self, row, db=None):
+        '''
+        Builds a native object from a row of values, columns that were not
+        fetched are deferred
+        '''
+        model = self.resource_adaptor
+        attnames = set(field.attname for field in self.opts.fields)
+        skip = attnames.difference(row)
+        if skip:
+            model = deferred_class_factory(model, skip)
+        instance = model(**dict((name, value) for name, value in row.iteritems() if name in attnames))
+        for name, value in row.iteritems():
+            #extra selections are set as attributes like querysets do
+            if name not in attnames:
+                setattr(instance, name, value)
+        instance._state.db = db
+        instance._state.adding = False
+        return instance
+    
+    def get_list_resource_items(self, instances, **kwargs):
+        columns = None
+        if getattr(instances, '_result_cache', True) is None:
+            #only querysets that have not been evaluated are fetched as values
+            columns = self.get_list_values_fields()
+        if columns is None:
+            return super(BaseModelResource, self).get_list_resource_items(instances, **kwargs)
+        kwargs.setdefault('endpoint', self)
+        #extra selections such as the search rank may order the rows
+        columns = columns + list(instances.query.extra_select)
+        if prefetch_related_objects is not None:
+            instances = instances.prefetch_related(None)
+        rows = instances.values(*columns)
+        item_class = self.list_values_resource_item_class
+        return [item_class(row=row, db=rows.db, **kwargs) for row in rows]
+    
+    def iter_list_resource_items(self, instances, **kwargs):
+        '''
+        Reads querysets that have not been evaluated with iterator() so only
+        a chunk of items is held at a time
+        '''
+        if getattr(instances, '_result_cache', True) is not None:
+            return super(BaseModelResource, self).iter_list_resource_items(instances, **kwargs)
+        return self.iter_queryset_resource_items(instances, **kwargs)
+    
+    def iter_queryset_resource_items(self, queryset, **kwargs):
+        kwargs.setdefault('endpoint', self)
+        columns = self.get_list_values_fields()
+        prefetch_lookups = ()
+        if columns is not None:
+            columns = columns + list(queryset.query.extra_select)
+            if prefetch_related_objects is not None:
+                queryset = queryset.prefetch_related(None)
+            rows = queryset.values(*columns)
+            item_class = self.list_values_resource_item_class
+            make_item = lambda row: item_class(row=row, db=rows.db, **kwargs)
+            objects = rows.iterator()
+        else:
+            #iterator() skips prefetching, the lookups are prefetched per chunk
+            prefetch_lookups = getattr(queryset, '_prefetch_related_lookups', ())
+            make_item = lambda instance: self.get_list_resource_item(instance, **kwargs)
+            objects = queryset.iterator()
+        while True:
+            chunk = list(islice(objects, self.stream_chunk_size))
+            if not chunk:
+                break
+            if prefetch_lookups:
+                prefetch_related_objects(chunk, *prefetch_lookups)
+            items = [make_item(obj) for obj in chunk]
+            del chunk
+            self.check_item_permissions(items)
+            for item in items:
+                yield item
+    
     def has_create_permission(self):
-        user = self.api_request.user
         if self.opts.auto_created:
             # We're checking the rights to an auto-created intermediate model,
             # which doesn't have its own individual permissions. The user needs
             # to have the change permission for the related model in order to
             # be able to do anything with the intermediate model.
             return self.has_update_permission()
-        return user.has_perm(
+        return self.api_request.has_perm(
             self.opts.app_label + '.' + self.opts.get_add_permission())
 
-    def has_update_permission(self, item=None):
-        user = self.api_request.user
-        
-        if item:
-            obj = item.instance
-        else:
-            obj = None
+    def get_update_permission(self):
         opts = self.opts
         if opts.auto_created and hasattr(self, 'parent_model'):
             # The model was auto-created as intermediary for a
@@ -138,11 +376,16 @@ class BaseModelResource(CRUDResource):
                 if field.rel and field.rel.to != self.parent_model:
                     opts = field.rel.to._meta
                     break
-        return user.has_perm(
-            opts.app_label + '.' + opts.get_change_permission(), obj)
+        return opts.app_label + '.' + opts.get_change_permission()
+
+    def has_update_permission(self, item=None):
+        if item:
+            obj = item.instance
+        else:
+            obj = None
+        return self.api_request.has_perm(self.get_update_permission(), obj)
 
     def has_delete_permission(self, item=None):
-        user = self.api_request.user
         #obj = item.instance
         if self.opts.auto_created:
             # We're checking the rights to an auto-created intermediate model,
@@ -150,8 +393,14 @@ class BaseModelResource(CRUDResource):
             # to have the change permission for the related model in order to
             # be able to do anything with the intermediate model.
             return self.has_update_permission(item)
-        return user.has_perm(
+        return self.api_request.has_perm(
             self.opts.app_label + '.' + self.opts.get_delete_permission())
+
+    def check_item_permissions(self, items):
+        instances = [item.instance for item in items if item.instance is not None]
+        if instances:
+            permissions = self.api_request.get_permission_cache()
+            permissions.has_perm_for_objects(self.get_update_permission(), instances)
         
     def get_exclude(self):
         return self.exclude or []
@@ -171,16 +420,161 @@ class BaseModelResource(CRUDResource):
         '''
         Makes an instream of model instances
         '''
+        if not isinstance(items, (list, tuple)):
+            #an iterator of items is read as a single lazy source
+            return [(item.instance for item in items)]
         return [item.instance for item in items]
     
     def get_native_datatap(self, instream=None, **kwargs):
         '''
         Returns a ModelDataTap suited for this resource
         '''
-        from datatap.datataps import ModelDataTap
+        from hyperadmin.datataps import StreamingModelDataTap
         if instream is None:
             instream = [self.resource_adaptor]
-        return ModelDataTap(instream, **kwargs)
+        return StreamingModelDataTap(instream, **kwargs)
+    
+    def get_list_version(self, index):
+        '''
+        Returns the latest version and the number of objects of the
+        filtered index, read with one aggregate query
+        '''
+        if not self.version_field:
+            return None
+        queryset = index.get_filtered_index()
+        aggregates = queryset.order_by().aggregate(version=models.Max(self.version_field), count=models.Count('pk'))
+        return (aggregates['version'], aggregates['count'])
+    
+    def get_item_version(self, item):
+        if not self.version_field:
+            return None
+        return (item.instance.pk, getattr(item.instance, self.version_field))
+    
+    def get_item_last_modified(self, item):
+        if not self.version_field:
+            return None
+        value = getattr(item.instance, self.version_field)
+        if isinstance(value, datetime.datetime):
+            return value
+        return None
+    
+    def ingest_datatap(self, instream):
+        '''
+        Reads the primitives of instream in batches of `ingest_batch_size`,
+        each batch is validated with the resource form and saved in its own
+        transaction. New objects are saved with bulk_create and do not send
+        save signals, they are indexed by the search backend of the resource
+        instead. An `ingest` event is emitted for each committed batch.
+        Returns the result of each batch.
+        '''
+        primitives = iter(instream)
+        results = list()
+        offset = 0
+        while True:
+            batch = list(islice(primitives, self.ingest_batch_size))
+            if not batch:
+                break
+            results.append(self.ingest_batch(batch, offset))
+            offset += len(batch)
+        return results
+    
+    def get_ingest_data(self, primitive):
+        '''
+        Returns the form data of a primitive, serialized values are
+        converted by the model fields so forms accept them
+        '''
+        data = dict(primitive.get('fields', primitive))
+        for field in self.opts.fields:
+            if field.rel is None and data.get(field.name, None) is not None:
+                try:
+                    data[field.name] = field.to_python(data[field.name])
+                except ValidationError:
+                    #the form reports the invalid value
+                    pass
+        return data
+    
+    def get_ingest_forms(self, batch, offset):
+        '''
+        Returns the bound forms of the batch and the failures of the forms
+        that did not validate, objects with a primary key update the
+        stored object. Primary keys of objects outside of the primary query
+        of the resource fail.
+        '''
+        model = self.resource_adaptor
+        pk_field = self.opts.pk
+        pks = [pk_field.to_python(primitive['pk']) for primitive in batch if primitive.get('pk', None) is not None]
+        existing, unavailable = {}, set()
+        if pks:
+            existing = self.get_primary_query().in_bulk(pks)
+            missing = [pk for pk in pks if pk not in existing]
+            if missing:
+                unavailable = set(model._default_manager.filter(pk__in=missing).values_list('pk', flat=True))
+        form_class = self.get_form_class()
+        valid_forms, failures = list(), list()
+        for index, primitive in enumerate(batch):
+            instance = None
+            if primitive.get('pk', None) is not None:
+                pk = pk_field.to_python(primitive['pk'])
+                if pk in unavailable:
+                    failures.append({'index': offset + index,
+                                     'errors': {pk_field.name: [u'Object is not available']}})
+                    continue
+                instance = existing.get(pk, None) or model(pk=pk)
+            form = form_class(data=self.get_ingest_data(primitive), instance=instance)
+            if form.is_valid():
+                valid_forms.append(form)
+            else:
+                errors = dict([(name, [unicode(error) for error in field_errors])
+                               for name, field_errors in form.errors.iteritems()])
+                failures.append({'index': offset + index, 'errors': errors})
+        return valid_forms, failures, existing
+    
+    def has_m2m_data(self, form):
+        return any([form.cleaned_data.get(field.name) for field in self.opts.many_to_many])
+    
+    def ingest_batch(self, batch, offset):
+        valid_forms, failures, existing = self.get_ingest_forms(batch, offset)
+        result = {'offset': offset,
+                  'count': len(batch),
+                  'created': 0,
+                  'updated': 0,
+                  'failures': failures,}
+        model = self.resource_adaptor
+        using = router.db_for_write(model)
+        search_backend = self.get_search_backend()
+        index_objects = search_backend is not None and search_backend.indexes_objects
+        try:
+            with transaction.commit_on_success(using=using):
+                bulk_forms = list()
+                for form in valid_forms:
+                    instance = form.save(commit=False)
+                    if instance.pk in existing:
+                        instance.save(using=using)
+                        form.save_m2m()
+                        result['updated'] += 1
+                    elif not BULK_CREATE or (instance.pk is None and (index_objects or self.has_m2m_data(form))):
+                        #bulk created objects without a primary key can not be related or indexed
+                        instance.save(using=using)
+                        form.save_m2m()
+                        result['created'] += 1
+                    else:
+                        bulk_forms.append(form)
+                if bulk_forms:
+                    model._default_manager.db_manager(using).bulk_create([form.instance for form in bulk_forms])
+                    for form in bulk_forms:
+                        if form.instance.pk is not None:
+                            form.save_m2m()
+                    if index_objects:
+                        search_backend.index_objects([form.instance for form in bulk_forms], using)
+                    result['created'] += len(bulk_forms)
+        except DatabaseError as error:
+            result.update(created=0, updated=0, error=unicode(error))
+        else:
+            if valid_forms:
+                item_list = [self.get_resource_item(form.instance) for form in valid_forms]
+                self.emit_event(event='ingest', item_list=item_list)
+        choices_cache.invalidate_sender(model)
+        return result
 
 class ModelResource(BaseModelResource):
     list_endpoint = (ListEndpoint, {'index_name':'filter'})
@@ -191,6 +585,14 @@ class ModelResource(BaseModelResource):
     def post_register(self):
         super(ModelResource, self).post_register()
         self.initialize_inlines()
+        search_backend = self.get_search_backend()
+        if search_backend is not None:
+            search_backend.watch()
+    
+    def post_bind(self):
+        super(ModelResource, self).post_bind()
+        self.inline_instances = [self.api_request.get_endpoint(inline.get_url_name())
+                                 for inline in self.inline_instances]
     
     @property
     def model(self):
@@ -262,8 +664,13 @@ class InlineModelResource(BaseModelResource):
     def get_primary_query(self, **kwargs):
         return self.get_queryset(parent=self.state['parent'].instance)
     
-    def get_indexes(self):
-        return {'primary':InlineIndex('primary', self)}
+    def get_url_param_fields(self):
+        names = super(InlineModelResource, self).get_url_param_fields()
+        names.append(self.fk.name)
+        return names
+    
+    def compile_index_definitions(self):
+        return {'primary': (InlineIndex, [])}
     
     def get_base_url_name_suffix(self):
         assert self.rel_name is not None
@@ -0,0 +1,290 @@
+'''
+Search backends of the model resource search filter. A backend is set on
+the resource with `search_backend` and turns the query of the search
+filter into a filtered queryset.
+'''
+import hashlib
+import operator
+import re
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, models, DatabaseError
+from django.db.models.signals import post_save, post_delete
+try:
+    from django.contrib.admin.util import lookup_needs_distinct
+except ImportError:
+    from hyperadmin.resources.models.util import lookup_needs_distinct
+
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+def get_terms(text):
+    '''
+    Returns the lower cased words of text
+    '''
+    return TERM_RE.findall(text.lower())
+
+_backends = dict()
+
+def get_search_backend(backend_class, model, search_fields):
+    '''
+    Returns the backend searching model by search_fields, backends are
+    shared so their indexes are prepared and watched once
+    '''
+    key = (backend_class, model, tuple(search_fields))
+    if key not in _backends:
+        _backends[key] = backend_class(model, search_fields)
+    return _backends[key]
+
+def get_search_backends():
+    '''
+    Returns the backends of the registered resources
+    '''
+    return _backends.values()
+
+class SearchBackend(object):
+    """
+    Searches the objects of a model by the values of `search_fields`
+    """
+    #backends that rank their matches can order the results by relevance
+    supports_relevance = False
+    #backends keeping an index need objects saved without signals indexed
+    indexes_objects = False
+
+    def __init__(self, model, search_fields):
+        self.model = model
+        self.search_fields = search_fields
+
+    @property
+    def opts(self):
+        return self.model._meta
+
+    def get_field_paths(self):
+        return [str(field_name).lstrip('^=@') for field_name in self.search_fields]
+
+    def get_index_key(self):
+        '''
+        Identifies the search index of the model and search fields
+        '''
+        label = '%s.%s:%s' % (self.opts.app_label, self.opts.object_name, ','.join(self.get_field_paths()))
+        return hashlib.md5(label).hexdigest()[:12]
+
+    def filter(self, queryset, query):
+        '''
+        Returns the objects of queryset matching query
+        '''
+        raise NotImplementedError
+
+    def order_by_relevance(self, queryset, query):
+        return queryset
+
+    def watch(self):
+        '''
+        Keeps the search index current as objects are saved and deleted
+        '''
+        pass
+
+class ContainsSearchBackend(SearchBackend):
+    """
+    Matches the objects containing every word of the query in one of the
+    search fields. Fields may be prefixed with '^' to match the start of
+    the value, '=' to match the whole value or '@' to use the full text
+    search of the database.
+    """
+    def construct_search(self, field_name):
+        if field_name.startswith('^'):
+            return "%s__istartswith" % field_name[1:]
+        elif field_name.startswith('='):
+            return "%s__iexact" % field_name[1:]
+        elif field_name.startswith('@'):
+            return "%s__search" % field_name[1:]
+        else:
+            return "%s__icontains" % field_name
+
+    def filter(self, queryset, query):
+        use_distinct = False
+        orm_lookups = [self.construct_search(str(search_field))
+                       for search_field in self.search_fields]
+        for bit in query.split():
+            or_queries = [models.Q(**{orm_lookup: bit})
+                          for orm_lookup in orm_lookups]
+            queryset = queryset.filter(reduce(operator.or_, or_queries))
+        for search_spec in orm_lookups:
+            if lookup_needs_distinct(self.opts, search_spec):
+                use_distinct = True
+                break
+        if use_distinct:
+            return queryset.distinct()
+        return queryset
+
+class IndexedSearchBackend(SearchBackend):
+    """
+    Base for backends searching a prebuilt index. Documents are built from
+    the search fields and are updated when objects of the model are saved
+    or deleted, changes to related objects are picked up on the next save.
+    """
+    supports_relevance = True
+    indexes_objects = True
+
+    def get_concrete_model(self, model):
+        #deferred and proxy classes send signals as themselves
+        return getattr(model._meta, 'concrete_model', None) or model
+
+    def get_document(self, instance):
+        '''
+        Returns the text indexed for instance
+        '''
+        paths = self.get_field_paths()
+        if any('__' in path for path in paths):
+            rows = self.model._default_manager.using(instance._state.db).filter(pk=instance.pk).values_list(*paths)
+            values = [value for row in rows for value in row]
+        else:
+            values = [getattr(instance, path) for path in paths]
+        return u' '.join([unicode(value) for value in values if value is not None])
+
+    def get_dispatch_uid(self):
+        return 'hyperadmin-search:%s:%s' % (type(self).__name__, self.get_index_key())
+
+    def watch(self):
+        dispatch_uid = self.get_dispatch_uid()
+        post_save.connect(self.index_sender, weak=False, dispatch_uid=dispatch_uid)
+        post_delete.connect(self.unindex_sender, weak=False, dispatch_uid=dispatch_uid)
+
+    def unwatch(self):
+        dispatch_uid = self.get_dispatch_uid()
+        post_save.disconnect(dispatch_uid=dispatch_uid)
+        post_delete.disconnect(dispatch_uid=dispatch_uid)
+
+    def index_sender(self, sender, instance, using=None, raw=False, **kwargs):
+        if not raw and self.get_concrete_model(sender) is self.model:
+            self.index_object(instance, using or instance._state.db)
+
+    def unindex_sender(self, sender, instance, using=None, **kwargs):
+        if self.get_concrete_model(sender) is self.model:
+            self.unindex_object(instance.pk, using or instance._state.db)
+
+    def get_pk_column(self, queryset):
+        qn = connections[queryset.db].ops.quote_name
+        return '%s.%s' % (qn(self.opts.db_table), qn(self.opts.pk.column))
+
+    def index_object(self, instance, using):
+        raise NotImplementedError
+
+    def unindex_object(self, pk, using):
+        raise NotImplementedError
+
+    def index_objects(self, instances, using):
+        '''
+        Indexes objects that were saved without sending signals
+        '''
+        for instance in instances:
+            self.index_object(instance, using)
+
+    def prepare(self, using='default'):
+        '''
+        Creates the storage of the index, called by the
+        `rebuild_search_index` command before rebuilding
+        '''
+        pass
+
+    def rebuild(self, using='default'):
+        '''
+        Indexes every object of the model
+        '''
+        for instance in self.model._default_manager.using(using).iterator():
+            self.index_object(instance, using)
+
+class SQLiteFTSSearchBackend(IndexedSearchBackend):
+    """
+    Searches an SQLite FTS5 table holding a document per object, the words
+    of the query match the words of the document starting with them. The
+    table is created and filled by the `rebuild_search_index` command, until
+    then or without FTS5 the search falls back to `ContainsSearchBackend`.
+    Models need integer primary keys.
+    """
+    fts_module = 'fts5'
+
+    def __init__(self, model, search_fields):
+        super(SQLiteFTSSearchBackend, self).__init__(model, search_fields)
+        self.prepared = set()
+        self.fallback = ContainsSearchBackend(model, search_fields)
+
+    def get_table_name(self):
+        return '%s_fts_%s' % (self.opts.db_table, self.get_index_key()[:8])
+
+    def get_connection(self, using):
+        connection = connections[using]
+        if connection.vendor != 'sqlite':
+            raise ImproperlyConfigured('%s requires an SQLite database' % type(self).__name__)
+        return connection
+
+    def is_prepared(self, using):
+        '''
+        Returns True when the search table exists
+        '''
+        if using not in self.prepared:
+            cursor = self.get_connection(using).cursor()
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [self.get_table_name()])
+            if cursor.fetchone() is None:
+                return False
+            self.prepared.add(using)
+        return True
+
+    def prepare(self, using='default'):
+        '''
+        Creates the search table
+        '''
+        if self.is_prepared(using):
+            return
+        connection = self.get_connection(using)
+        try:
+            connection.cursor().execute('CREATE VIRTUAL TABLE %s USING %s(document)' %
+                                        (connection.ops.quote_name(self.get_table_name()), self.fts_module))
+        except DatabaseError, error:
+            raise ImproperlyConfigured('%s requires the SQLite %s module: %s' % (type(self).__name__, self.fts_module, error))
+        self.prepared.add(using)
+
+    def insert_documents(self, instances, using):
+        connection = self.get_connection(using)
+        connection.cursor().executemany('INSERT INTO %s (rowid, document) VALUES (%%s, %%s)' %
+                                        connection.ops.quote_name(self.get_table_name()),
+                                        [(instance.pk, self.get_document(instance)) for instance in instances])
+
+    def rebuild(self, using='default'):
+        connection = self.get_connection(using)
+        connection.cursor().execute('DELETE FROM %s' % connection.ops.quote_name(self.get_table_name()))
+        self.insert_documents(self.model._default_manager.using(using).iterator(), using)
+
+    def index_object(self, instance, using):
+        if not self.is_prepared(using):
+            return
+        self.unindex_object(instance.pk, using)
+        self.insert_documents([instance], using)
+
+    def unindex_object(self, pk, using):
+        if not self.is_prepared(using):
+            return
+        connection = self.get_connection(using)
+        connection.cursor().execute('DELETE FROM %s WHERE rowid = %%s' %
+                                    connection.ops.quote_name(self.get_table_name()), [pk])
+
+    def get_match(self, query):
+        return u' '.join([u'"%s"*' % term for term in get_terms(query)])
+
+    def filter(self, queryset, query):
+        match = self.get_match(query)
+        if not match:
+            return queryset
+        if not self.is_prepared(queryset.db):
+            return self.fallback.filter(queryset, query)
+        table = connections[queryset.db].ops.quote_name(self.get_table_name())
+        where = '%s IN (SELECT rowid FROM %s WHERE %s MATCH %%s)' % (self.get_pk_column(queryset), table, table)
+        return queryset.extra(where=[where], params=[match])
+
+    def order_by_relevance(self, queryset, query):
+        match = self.get_match(query)
+        if not match or not self.is_prepared(queryset.db):
+            return queryset
+        table = connections[queryset.db].ops.quote_name(self.get_table_name())
+        rank = '(SELECT rank FROM %s WHERE %s MATCH %%s AND rowid = %s)' % (table, table, self.get_pk_column(queryset))
+        return queryset.extra(select={'search_rank': rank}, select_params=[match], order_by=['search_rank'])
@@ -42,6 +42,13 @@ class BaseResource(GlobalSiteMixin, VirtualEndpoint):
         self.register_endpoints()
         super(BaseResource, self).post_register()
     
+    def post_bind(self):
+        #record ourselves first so our children may find us
+        self.links = self.get_link_collector()
+        self.api_request.record_endpoint(self)
+        self.bind_endpoints()
+        self.register_link_prototypes()
+    
     def get_app_name(self):
         """
         Return the application name of this resource.
@@ -105,6 +112,12 @@ class BaseResource(GlobalSiteMixin, VirtualEndpoint):
         for key, endpoint in self._installed_endpoints.iteritems():
             self.endpoints[key] = self.fork(**self.get_endpoint_kwargs())
     
+    def bind_endpoints(self):
+        endpoints = SortedDict()
+        for key, endpoint in self.endpoints.iteritems():
+            endpoints[key] = self.api_request.get_endpoint(endpoint.get_url_name())
+        self.endpoints = endpoints
+    
     def register_endpoint(self, endpoint_cls, **kwargs):
         endpoint = self._register_endpoint(endpoint_cls, **kwargs)
         self._installed_endpoints[endpoint.get_name_suffix()] = endpoint
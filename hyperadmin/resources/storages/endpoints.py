@@ -1,4 +1,4 @@
-from hyperadmin.links import LinkPrototype, Link
+from hyperadmin.links import LinkPrototype, BaseLink
 from hyperadmin.resources.endpoints import ResourceEndpoint
 from hyperadmin.resources.crud.endpoints import ListEndpoint as BaseListEndpoint, CreateEndpoint, DetailEndpoint, DeleteEndpoint
 
@@ -54,7 +54,7 @@ class CreateUploadLinkPrototype(LinkPrototype):
         return link.clone(form=form)
 
     def on_success(self, link):
-        assert isinstance(link, Link)
+        assert isinstance(link, BaseLink)
         return link
 
 
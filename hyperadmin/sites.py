@@ -38,6 +38,10 @@ class BaseResourceSite(RootEndpoint):
         super(BaseResourceSite, self).post_register()
         self.directory_resource = self.create_directory_resource(base_url_name_suffix=self.base_url_name_suffix)
     
+    def post_bind(self):
+        super(BaseResourceSite, self).post_bind()
+        self.directory_resource = self.api_request.get_endpoint(self.directory_resource.get_url_name())
+    
     def get_directory_resource_kwargs(self, **kwargs):
         kwargs.setdefault('resource_name', self.name)
         #kwargs.setdefault('parent', self)
@@ -144,6 +148,10 @@ class ResourceSite(BaseResourceSite):
         super(ResourceSite, self).post_register()
         self.auth_resource = self.register_endpoint(self.auth_resource_class)
     
+    def post_bind(self):
+        super(ResourceSite, self).post_bind()
+        self.auth_resource = self.api_request.get_endpoint(self.auth_resource.get_url_name())
+    
     @property
     def applications(self):
         return self.directory_resource.resource_adaptor
@@ -1,4 +1,5 @@
 from copy import copy
+from weakref import WeakSet
 
 from django.utils.http import urlencode
 from django.utils.datastructures import MergeDict
@@ -7,40 +8,132 @@ from django.http import QueryDict
 from hyperadmin.links import LinkCollectionProvider, LinkCollectorMixin
 
 
+class ActiveDictionary(dict):
+    """
+    The dictionary a state writes to. Copies of the state layer on it
+    directly and are invalidated by the state.
+    """
+    def __init__(self, state):
+        super(ActiveDictionary, self).__init__()
+        self.state = state
+
 class State(MergeDict):
+    """
+    A dictionary layered on top of substates. Writes go to the active
+    dictionary, reads fall through the layers in order.
+    """
+    cache_reads = True
+    '''If True, reads are served from a flattened copy of the layers that is
+    invalidated on writes to any layer. States layered on dictionaries that
+    are not states always read through the layers.'''
+    
     def __init__(self, substates=[], data={}):
-        self.active_dictionary = dict()
+        self.active_dictionary = ActiveDictionary(self)
         self.substates = substates
+        self.version = 0
+        self._flattened = None
+        self._dependents = WeakSet()
+        self._readers = WeakSet()
         dictionaries = self.get_dictionaries()
         super(State, self).__init__(*dictionaries)
+        self._cacheable = self.cache_reads and all([self._watch_layer(layer) for layer in self.dicts])
         self.update(data)
     
     def get_dictionaries(self):
         return [self.active_dictionary] + self.substates
     
+    def _watch_layer(self, layer):
+        if layer is self.active_dictionary:
+            return True
+        if isinstance(layer, ActiveDictionary):
+            layer.state._readers.add(self)
+            return True
+        if isinstance(layer, State) and layer._cacheable:
+            layer._dependents.add(self)
+            return True
+        return False
+    
+    def get_flattened(self):
+        """
+        Returns a dictionary with the merged contents of all the layers
+        """
+        if not self._cacheable:
+            return dict(self.iteritems())
+        if self._flattened is None:
+            flattened = dict()
+            for layer in reversed(self.dicts):
+                if isinstance(layer, ActiveDictionary):
+                    flattened.update(layer)
+                else:
+                    flattened.update(layer.get_flattened())
+            self._flattened = flattened
+        return self._flattened
+    
+    def invalidate(self, updated=None):
+        """
+        Bumps the version and drops the flattened reads of this state and
+        the states layered on it. Writes to the active dictionary are
+        passed as updated and applied in place.
+        """
+        self.version += 1
+        for reader in list(self._readers):
+            reader.invalidate()
+        if self._flattened is None:
+            return
+        if updated is None:
+            self._flattened = None
+        else:
+            self._flattened.update(updated)
+        for dependent in list(self._dependents):
+            dependent.invalidate()
+    
+    def __getitem__(self, key):
+        if self._cacheable:
+            return self.get_flattened()[key]
+        return super(State, self).__getitem__(key)
+    
+    def has_key(self, key):
+        if self._cacheable:
+            return key in self.get_flattened()
+        return super(State, self).has_key(key)
+    
+    __contains__ = has_key
+    
+    def get_copy_substates(self):
+        """
+        Returns the layers of a copy, the copy reads the active dictionary
+        and substates of this state so copies of copies stay flat
+        """
+        return [self.active_dictionary] + self.substates
+    
     def __copy__(self):
-        substates = self.get_dictionaries()
-        ret = self.__class__(substates=substates)
+        ret = self.__class__(substates=self.get_copy_substates())
         return ret
     
     def __setitem__(self, key, value):
         self.active_dictionary[key] = value
+        self.invalidate({key: value})
     
     def __delitem__(self, key):
         del self.active_dictionary[key]
+        self.invalidate()
     
     def pop(self, key, default=None):
-        return self.active_dictionary.pop(key, default)
+        value = self.active_dictionary.pop(key, default)
+        self.invalidate()
+        return value
     
     def update(self, other_dict):
         self.active_dictionary.update(other_dict)
+        self.invalidate(other_dict)
 
 class EndpointStateLinkCollectionProvider(LinkCollectionProvider):
-    def _get_link_functions(self, attr):
-        functions = super(EndpointStateLinkCollectionProvider, self)._get_link_functions(attr)
+    @classmethod
+    def get_chain_steps(cls, container_class, has_parent, attr):
+        steps = super(EndpointStateLinkCollectionProvider, cls).get_chain_steps(container_class, has_parent, attr)
         key_name = attr[len('get_'):]
-        functions.append(lambda *args, **kwargs: self.container['state_links'].get(key_name, []))
-        return functions
+        steps.append(lambda provider, *args, **kwargs: provider.container['state_links'].get(key_name, []))
+        return steps
     
     def add_link(self, key, link):
         self.container['state_links'].setdefault(key, list())
@@ -147,7 +240,16 @@ class EndpointState(LinkCollectorMixin, State):
         """
         if self.item is not None:
             return self.item.get_resource_items()
-        return self.endpoint.get_resource_items()
+        with self.endpoint.api_request.time_phase('items'):
+            return self.endpoint.get_resource_items()
+    
+    def iter_resource_items(self):
+        """
+        Returns an iterator over the resource items of this state.
+        """
+        if self.item is not None:
+            return iter(self.item.get_resource_items())
+        return self.endpoint.iter_resource_items()
     
     def get_query_string(self, new_params=None, remove=None):
         if new_params is None: new_params = {}
@@ -171,7 +273,6 @@ class EndpointState(LinkCollectorMixin, State):
         return self.endpoint.get_namespaces()
     
     def __copy__(self):
-        substates = self.get_dictionaries()
-        ret = self.__class__(self.endpoint, copy(self.meta), substates=substates)
+        ret = self.__class__(self.endpoint, copy(self.meta), substates=self.get_copy_substates())
         return ret
 
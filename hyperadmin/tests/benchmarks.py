@@ -0,0 +1,466 @@
+'''
+Benchmarks of the request hot path. They are left out of the test suite,
+run them with `python -c "from tests.runtests import runbenchmarks; runbenchmarks()"`.
+Work is asserted through counters so the results stay deterministic,
+timings are logged to `hyperadmin.benchmarks` for comparison.
+'''
+import gc
+import logging
+import sys
+import time
+import weakref
+
+import mimeparse
+
+from django.conf.urls.defaults import patterns, url, include
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test.client import Client
+from django.test.utils import override_settings
+from django.utils import simplejson as json
+
+from hyperadmin.endpoints import BaseEndpoint, RootEndpoint
+from hyperadmin.links import LinkPrototype, CompactLink, LinkChain, LinkCollectionProvider
+from hyperadmin.mediatypes.collectionjson import CollectionJSON, CollectionHyperAdminJSON
+from hyperadmin.states import State
+from hyperadmin.apirequests import NamespaceAPIRequest
+from hyperadmin.permissions import PermissionCache
+from hyperadmin.resources.models.indexes import ModelIndex
+from hyperadmin.resources.models.filters import FieldFilter
+from hyperadmin.resources.models.resources import BaseModelResource
+from hyperadmin.resources.crud.hyperobjects import ListResourceItem, ValuesListResourceItem
+
+from test_resources import UserResourceTestCase, UserResource
+from test_urltemplates import MountedRoot
+from test_model_resources import ValuesUserResource
+from test_indexes import ChoicesUserResource
+from test_paginators import PagedUserResource
+from mediatypes.test_collectionjson import PlanUserResource
+
+from mock import patch
+
+
+logger = logging.getLogger('hyperadmin.benchmarks')
+
+class BenchmarkMixin(object):
+    iterations = 20
+
+    def count_calls(self, klass, method_name, func):
+        '''
+        Calls func while counting the calls made to klass.method_name
+        Returns the number of calls and the seconds spent per iteration
+        '''
+        original = getattr(klass, method_name)
+        calls = list()
+
+        def counter(*args, **kwargs):
+            calls.append(args)
+            return original(*args, **kwargs)
+
+        with patch.object(klass, method_name, counter):
+            start = time.time()
+            for i in range(self.iterations):
+                func()
+            elapsed = time.time() - start
+        return len(calls) / self.iterations, elapsed / self.iterations
+
+    def report(self, label, calls, seconds):
+        logger.info('%s.%s %s: %s calls, %.2fms per iteration',
+                    type(self).__name__, self._testMethodName, label, calls, seconds * 1000)
+
+class SiteURLConf(object):
+    def __init__(self, site):
+        self.urlpatterns = patterns('', url(r'^hyper-admin/', include(site.urls)))
+
+class EndpointBindingBenchmark(BenchmarkMixin, UserResourceTestCase):
+    def setUp(self):
+        super(EndpointBindingBenchmark, self).setUp()
+        self.user.set_password('benchmark')
+        self.user.save()
+        self.client = Client(HTTP_ACCEPT=CollectionJSON.recognized_media_types[0])
+        self.client.login(username=self.user.username, password='benchmark')
+
+    def get_list(self):
+        response = self.client.get('/hyper-admin/auth/user/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_benchmark_dispatch(self):
+        with override_settings(ROOT_URLCONF=SiteURLConf(self.site)):
+            self.site.compile_endpoints = False
+            constructed, fork_time = self.count_calls(BaseEndpoint, '__init__', self.get_list)
+            self.report('forked endpoints (%s constructed)' % constructed, constructed, fork_time)
+
+            self.site.compile_endpoints = True
+            constructed, bind_time = self.count_calls(BaseEndpoint, '__init__', self.get_list)
+            self.report('compiled endpoints (%s constructed)' % constructed, constructed, bind_time)
+        self.assertEqual(constructed, 0)
+
+class URLTemplateBenchmark(BenchmarkMixin, UserResourceTestCase):
+    iterations = 500
+
+    def test_benchmark_reverse(self):
+        from hyperadmin.urltemplates import URLTemplateTable
+        table = URLTemplateTable(MountedRoot(self.site, self.resolver, '/hyper-admin/'))
+        root = table.root_endpoint
+        detail_name = self.resource.endpoints['detail'].get_url_name()
+        table.reverse(detail_name, pk=1)
+
+        reverse_calls, reverse_time = self.count_calls(MountedRoot, 'django_reverse',
+            lambda: root.django_reverse(detail_name, pk=1))
+        self.report('django reverse', reverse_calls, reverse_time)
+        template_calls, template_time = self.count_calls(MountedRoot, 'django_reverse',
+            lambda: table.reverse(detail_name, pk=1))
+        self.report('url templates', template_calls, template_time)
+        self.assertEqual(template_calls, 0)
+
+class EndpointResolverBenchmark(BenchmarkMixin, UserResourceTestCase):
+    def call_detail(self):
+        api_request = self.get_api_request()
+        url = self.resource.endpoints['detail'].fork(api_request=api_request).get_url(
+            item=self.resource.get_resource_item(self.user))
+        return api_request.get_site().call_endpoint(url)
+
+    def test_benchmark_resolver(self):
+        def call_uncached():
+            self.site.resolvers.clear()
+            self.call_detail()
+        uncached_calls, uncached = self.count_calls(RootEndpoint, 'get_urls', call_uncached)
+        self.report('uncached resolver url generation', uncached_calls, uncached)
+        calls, cached = self.count_calls(RootEndpoint, 'get_urls', self.call_detail)
+        self.report('cached resolver url generation', calls, cached)
+        self.assertEqual(calls, 0)
+
+class ContentNegotiationBenchmark(BenchmarkMixin, UserResourceTestCase):
+    def negotiate(self):
+        api_request = self.get_api_request()
+        api_request.get_response_media_type()
+        api_request.get_response_type()
+        api_request.get_request_type()
+
+    def test_benchmark_negotiation(self):
+        calls, seconds = self.count_calls(mimeparse, 'best_match', self.negotiate)
+        self.report('content negotiations', calls, seconds)
+        self.assertTrue(calls < 1)
+
+class LargeUserResource(UserResource):
+    list_per_page = 500
+
+def link_size(link):
+    '''
+    Returns the bytes held by a link, its attribute dictionary and the
+    dictionaries stored on it. Defaults shared between links are excluded.
+    '''
+    size = sys.getsizeof(link)
+    for ref in gc.get_referents(link):
+        if isinstance(ref, dict):
+            size += sys.getsizeof(ref)
+            for value in ref.values():
+                if isinstance(value, dict):
+                    size += sys.getsizeof(value)
+    return size
+
+class CompactLinkBenchmark(BenchmarkMixin, UserResourceTestCase):
+    resource_class = LargeUserResource
+    item_count = 500
+
+    def setUp(self):
+        super(CompactLinkBenchmark, self).setUp()
+        User.objects.bulk_create([User(username='compactlink%s' % i) for i in range(self.item_count)])
+
+    def tearDown(self):
+        User.objects.filter(username__startswith='compactlink').delete()
+        super(CompactLinkBenchmark, self).tearDown()
+
+    def serialize_list(self):
+        endpoint = self.get_endpoint(dispatch=False)
+        links = list()
+        original = LinkPrototype.get_link
+
+        def get_link(prototype, **kwargs):
+            link = original(prototype, **kwargs)
+            links.append(link)
+            return link
+
+        with patch.object(LinkPrototype, 'get_link', get_link):
+            start = time.time()
+            response = self.serialize(endpoint, CollectionJSON)
+            #row links as rendered by the clients
+            for item in endpoint.state.get_resource_items():
+                item.get_link().get_absolute_url()
+            elapsed = time.time() - start
+        return response.content, links, elapsed
+
+    def test_compact_links_use_less_memory(self):
+        content, links, elapsed = self.serialize_list()
+        size = sum(map(link_size, links))
+        self.report('links (%s bytes)' % size, len(links), elapsed)
+
+        with patch.object(LinkPrototype, 'compact_links', True):
+            compact_content, compact_links, compact_elapsed = self.serialize_list()
+        compact_size = sum(map(link_size, compact_links))
+        self.report('compact links (%s bytes)' % compact_size, len(compact_links), compact_elapsed)
+
+        self.assertTrue(len(links) > self.item_count)
+        self.assertEqual(len(links), len(compact_links))
+        self.assertTrue(all(isinstance(link, CompactLink) for link in compact_links))
+        self.assertTrue(compact_size * 2 < size)
+        self.assertEqual(content, compact_content)
+
+class LinkChainBenchmark(BenchmarkMixin, UserResourceTestCase):
+    iterations = 5
+
+    def serialize_list(self):
+        self.serialize(self.get_endpoint(dispatch=False), CollectionJSON)
+
+    def test_benchmark_link_chains(self):
+        self.serialize_list()
+        chains, seconds = self.count_calls(LinkChain, '__init__', self.serialize_list)
+        self.report('link chains resolved', chains, seconds)
+        providers, seconds = self.count_calls(LinkCollectionProvider, '__init__', self.serialize_list)
+        self.report('link providers allocated', providers, seconds)
+        self.assertEqual(chains, 0)
+
+class StateLookupBenchmark(BenchmarkMixin, UserResourceTestCase):
+    iterations = 5
+    depth = 10
+    lookups = 1000
+
+    def get_namespace_state(self):
+        api_request = self.get_api_request()
+        api_request.session_state['root_key'] = 'root'
+        for i in range(self.depth):
+            api_request = NamespaceAPIRequest(api_request)
+        endpoint = api_request.get_endpoint(self.resource.endpoints['list'].get_url_name())
+        return endpoint.state
+
+    def lookup(self, state):
+        for i in range(self.lookups):
+            state['root_key']
+            state.get('missing_key')
+            'meta' in state
+
+    def test_deep_namespace_lookups(self):
+        with patch.object(State, 'cache_reads', False):
+            state = self.get_namespace_state()
+            self.assertFalse(state._cacheable)
+            calls, uncached = self.count_calls(State, 'get_flattened', lambda: self.lookup(state))
+        self.report('uncached state lookups (depth %s)' % self.depth, self.lookups * 3, uncached)
+
+        state = self.get_namespace_state()
+        self.assertTrue(state._cacheable)
+        calls, cached = self.count_calls(State, 'get_flattened', lambda: self.lookup(state))
+        self.report('cached state lookups (depth %s)' % self.depth, self.lookups * 3, cached)
+        self.assertTrue(cached < uncached)
+
+class PermissionCacheBenchmark(BenchmarkMixin, UserResourceTestCase):
+    resource_class = LargeUserResource
+    iterations = 5
+    item_count = 50
+
+    def setUp(self):
+        super(PermissionCacheBenchmark, self).setUp()
+        User.objects.bulk_create([User(username='permcache%s' % i) for i in range(self.item_count)])
+
+    def tearDown(self):
+        User.objects.filter(username__startswith='permcache').delete()
+        super(PermissionCacheBenchmark, self).tearDown()
+
+    def serialize_list(self):
+        endpoint = self.get_endpoint(dispatch=False)
+        self.serialize(endpoint, CollectionJSON)
+        for item in endpoint.state.get_resource_items():
+            item.get_link()
+
+    def test_benchmark_permission_checks(self):
+        def uncached_has_perm(cache, perm, obj=None):
+            return cache.user.has_perm(perm, obj)
+
+        with patch.object(PermissionCache, 'has_perm', uncached_has_perm):
+            uncached_calls, uncached = self.count_calls(User, 'has_perm', self.serialize_list)
+        self.report('uncached permission checks', uncached_calls, uncached)
+        calls, cached = self.count_calls(User, 'has_perm', self.serialize_list)
+        self.report('cached permission checks', calls, cached)
+        self.assertTrue(calls < uncached_calls)
+
+class PaginationLinkBenchmark(BenchmarkMixin, UserResourceTestCase):
+    resource_class = PagedUserResource
+    iterations = 3
+    item_count = 500
+
+    def setUp(self):
+        super(PaginationLinkBenchmark, self).setUp()
+        User.objects.bulk_create([User(username='windowpage%s' % i) for i in range(self.item_count)])
+
+    def tearDown(self):
+        User.objects.filter(username__startswith='windowpage').delete()
+        super(PaginationLinkBenchmark, self).tearDown()
+
+    def serialize_list(self, per_page):
+        with patch.object(PagedUserResource, 'list_per_page', per_page):
+            endpoint = self.get_endpoint(params={'q': 'windowpage'})
+            return self.serialize(endpoint, CollectionJSON).content
+
+    def test_benchmark_response_size(self):
+        for per_page in (50, 5, 1):
+            pages = self.item_count / per_page
+            with patch.object(ModelIndex, 'pagination_window', None):
+                content = self.serialize_list(per_page)
+                calls, every_page = self.count_calls(ModelIndex, 'get_pagination_link', lambda: self.serialize_list(per_page))
+            self.report('every page link, %s pages (%s bytes)' % (pages, len(content)), calls, every_page)
+
+            windowed_content = self.serialize_list(per_page)
+            windowed_calls, windowed = self.count_calls(ModelIndex, 'get_pagination_link', lambda: self.serialize_list(per_page))
+            self.report('windowed page links, %s pages (%s bytes)' % (pages, len(windowed_content)), windowed_calls, windowed)
+
+            self.assertTrue(calls >= pages)
+            self.assertTrue(windowed_calls <= 2 * 3 + 3)
+            if pages > 10:
+                self.assertTrue(len(windowed_content) < len(content))
+
+class ValuesListBenchmark(BenchmarkMixin, UserResourceTestCase):
+    resource_class = ValuesUserResource
+    iterations = 5
+    item_count = 100
+
+    def setUp(self):
+        super(ValuesListBenchmark, self).setUp()
+        User.objects.bulk_create([User(username='valuesrow%s' % i, email='row%s@example.com' % i, is_active=bool(i % 2))
+                                  for i in range(self.item_count)])
+
+    def tearDown(self):
+        User.objects.filter(username__startswith='valuesrow').delete()
+        super(ValuesListBenchmark, self).tearDown()
+
+    def get_endpoint(self, **kwargs):
+        kwargs.setdefault('params', {'q': 'valuesrow'})
+        return super(ValuesListBenchmark, self).get_endpoint(**kwargs)
+
+    def serialize_list(self):
+        return self.serialize(self.get_endpoint(), CollectionJSON).content
+
+    def test_benchmark_values_list(self):
+        calls, values = self.count_calls(ValuesListResourceItem, 'get_row_values', self.serialize_list)
+        self.report('values rows (%s items)' % self.item_count, calls, values)
+        with patch.object(ValuesUserResource, 'list_values', False):
+            with patch.object(ListResourceItem, 'get_row_values', lambda item: None):
+                form_calls, forms = self.count_calls(ListResourceItem, 'get_form', self.serialize_list)
+        self.report('list forms (%s items)' % self.item_count, form_calls, forms)
+        self.assertEqual(calls, self.item_count)
+        #list forms are also built for the display fields of the meta data
+        self.assertEqual(form_calls, self.item_count + 1)
+
+    def test_benchmark_item_data(self):
+        endpoint = self.get_endpoint()
+        adaptor = CollectionHyperAdminJSON(endpoint.api_request)
+        items = endpoint.state.get_resource_items()
+        form_items = [ListResourceItem(endpoint=endpoint, instance=item.instance) for item in items]
+
+        def convert_rows():
+            return [adaptor.convert_row(item) for item in items]
+
+        def convert_forms():
+            return [adaptor.convert_form(item.get_form()) for item in form_items]
+
+        self.assertEqual(convert_rows(), convert_forms())
+        calls, rows = self.count_calls(ValuesListResourceItem, 'get_row_values', convert_rows)
+        self.report('item data from rows (%s items)' % self.item_count, calls, rows)
+        calls, forms = self.count_calls(ListResourceItem, 'get_form', convert_forms)
+        self.report('item data from list forms (%s items)' % self.item_count, calls, forms)
+
+class FieldPlanBenchmark(BenchmarkMixin, UserResourceTestCase):
+    resource_class = PlanUserResource
+    iterations = 1
+
+    def test_benchmark_item_data(self):
+        endpoint = self.get_endpoint()
+        for item_count in (100, 1000, 10000):
+            items = [ListResourceItem(endpoint=endpoint, instance=User(pk=i, username='planuser%s' % i, first_name='Plan'))
+                     for i in range(item_count)]
+            adaptor = CollectionHyperAdminJSON(endpoint.api_request)
+
+            def convert_rows():
+                return [adaptor.convert_row(item) for item in items]
+
+            def convert_forms():
+                return [adaptor.convert_form(item.get_form()) for item in items]
+
+            if item_count == 100:
+                self.assertEqual(json.dumps(convert_rows()), json.dumps(convert_forms()))
+            calls, rows = self.count_calls(ListResourceItem, 'get_form', convert_rows)
+            self.report('item data from the field plan (%s items)' % item_count, calls, rows)
+            self.assertEqual(calls, 0)
+            calls, forms = self.count_calls(ListResourceItem, 'get_form', convert_forms)
+            self.report('item data from list forms (%s items)' % item_count, calls, forms)
+            self.assertEqual(calls, item_count)
+
+class IndexConstructionBenchmark(BenchmarkMixin, UserResourceTestCase):
+    resource_class = ChoicesUserResource
+
+    def get_detail(self):
+        self.get_endpoint('detail', url_kwargs={'pk': self.user.pk})
+
+    def test_benchmark_detail_requests(self):
+        self.get_detail()
+        calls, lazy = self.count_calls(FieldFilter, '__init__', self.get_detail)
+        self.report('lazy indexes, detail GET (%s filters built)' % calls, calls, lazy)
+        self.assertEqual(calls, 0)
+
+        def eager_index(resource, name):
+            #the previous behaviour, every index and filter is built for each lookup
+            indexes = dict()
+            for index_name, (index_class, filter_specs) in resource.compile_index_definitions().items():
+                indexes[index_name] = index_class(index_name, resource, filter_specs=filter_specs)
+                indexes[index_name].filters
+            return indexes[name]
+
+        with patch.object(BaseModelResource, 'get_index', eager_index):
+            eager_calls, eager = self.count_calls(FieldFilter, '__init__', self.get_detail)
+        self.report('eager indexes, detail GET (%s filters built)' % eager_calls, eager_calls, eager)
+        self.assertTrue(eager_calls >= 2)
+
+class StreamUserResource(ValuesUserResource):
+    list_per_page = 100000
+
+class StreamingCollectionBenchmark(UserResourceTestCase):
+    resource_class = StreamUserResource
+    row_count = 100000
+
+    def setUp(self):
+        super(StreamingCollectionBenchmark, self).setUp()
+        self.site.compile_endpoints = True
+
+    @classmethod
+    def setUpClass(cls):
+        User.objects.bulk_create([User(username='streamrow%s' % i, email='row%s@example.com' % i)
+                                  for i in range(cls.row_count)], batch_size=500)
+
+    @classmethod
+    def tearDownClass(cls):
+        #the rows have no relations, a plain delete skips collecting them
+        connection.cursor().execute('DELETE FROM auth_user WHERE username LIKE %s', ['streamrow%'])
+        transaction.commit_unless_managed()
+
+    def test_streaming_bounds_peak_memory(self):
+        live_items = weakref.WeakKeyDictionary()
+        original_init = ListResourceItem.__init__
+
+        def tracking_init(item, *args, **kwargs):
+            original_init(item, *args, **kwargs)
+            live_items[item] = True
+
+        chunk_size = StreamUserResource.stream_chunk_size
+        peak, count = 0, 0
+        with patch.object(ListResourceItem, '__init__', tracking_init):
+            api_request = self.get_api_request(params={'stream': 'true'})
+            endpoint = api_request.bind_endpoint(self.resource.endpoints['list'])
+            endpoint.dispatch_api(api_request)
+            start = time.time()
+            response = self.serialize(endpoint, CollectionHyperAdminJSON)
+            for piece in response.streaming_content:
+                count += 1
+                if count % (chunk_size * 50) == 1:
+                    gc.collect()
+                    peak = max(peak, len(live_items))
+            logger.info('streamed %s rows in %.2fs, at most %s items alive', self.row_count, time.time() - start, peak)
+        self.assertEqual(count, self.row_count + 2)
+        self.assertTrue(0 < peak <= chunk_size, peak)
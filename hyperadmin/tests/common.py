@@ -1,9 +1,12 @@
 from django.test.client import RequestFactory
 from django.core.urlresolvers import RegexURLResolver
+from django.db import connection
 
 from hyperadmin.apirequests import NamespaceAPIRequest
 from hyperadmin.endpoints import RootEndpoint
 
+from mock import patch
+
 
 class MockSession(dict):
     def flush(self):
@@ -48,3 +51,50 @@ class URLReverseMixin(object):
     def unpatch_reverse(self):
         NamespaceAPIRequest.reverse = self._orignal_request_reverse
         RootEndpoint.reverse = self._orignal_root_reverse
+
+def count_calls(klass, method_name, func, *args, **kwargs):
+    '''
+    Calls func and returns its result with the arguments of every call made
+    to klass.method_name meanwhile
+    '''
+    original = getattr(klass, method_name)
+    calls = list()
+    
+    def counter(*c_args, **c_kwargs):
+        calls.append(c_args)
+        return original(*c_args, **c_kwargs)
+    
+    with patch.object(klass, method_name, counter):
+        result = func(*args, **kwargs)
+    return result, calls
+
+def capture_queries(func, *args, **kwargs):
+    '''
+    Calls func and returns its result with the sql of the queries it made
+    '''
+    connection.use_debug_cursor = True
+    try:
+        del connection.queries[:]
+        result = func(*args, **kwargs)
+        return result, [query['sql'] for query in connection.queries]
+    finally:
+        connection.use_debug_cursor = None
+
+def get_content(response):
+    '''
+    Returns the body of a response, streamed or not
+    '''
+    if getattr(response, 'streaming', False):
+        return ''.join(response.streaming_content)
+    return response.content
+
+def create_objects(model, objects):
+    '''
+    Saves objects with bulk_create, one at a time on django < 1.4
+    '''
+    manager = model._default_manager
+    if hasattr(manager, 'bulk_create'):
+        return manager.bulk_create(objects)
+    for obj in objects:
+        obj.save()
+    return objects
@@ -1,13 +1,22 @@
+from django import forms, http
+from django.contrib.auth.models import User, Group
 from django.contrib.contenttypes.models import ContentType
 from django.utils import simplejson as json
+from django.utils import unittest
 from django.utils.translation import ugettext_lazy as _
 
-from hyperadmin.mediatypes.collectionjson import CollectionJSON, CollectionNextJSON
+from hyperadmin.mediatypes.collectionjson import CollectionJSON, CollectionNextJSON, CollectionHyperAdminJSON
+from hyperadmin.resources.crud.hyperobjects import ListResourceItem
 from hyperadmin.resources.directory import ResourceDirectory
+from hyperadmin.resources.models.filters import RelatedFieldFilter
 from hyperadmin.sites import site
+from hyperadmin.tests.common import create_objects
+from hyperadmin.tests.test_resources import UserResourceTestCase, UserResource
 
 from common import MediaTypeTestCase
 
+from mock import patch
+
 class CollectionJsonTestCase(MediaTypeTestCase):
     content_type = 'application/vnd.Collection+JSON'
     
@@ -87,3 +96,116 @@ class CollectionNextJsonTestCase(MediaTypeTestCase):
         self.assertEqual(len(error_r['messages']), len(form.errors))
         
 
+
+class ValuesUserResource(UserResource):
+    list_display = ['username', 'email', 'is_active', 'last_login']
+    list_values = True
+    list_per_page = 100
+
+class PlanUserResource(UserResource):
+    #a callable display keeps the list on native objects
+    list_display = ['username', 'email', 'get_full_name', 'is_staff']
+
+class CollectionItemDataTestCase(UserResourceTestCase):
+    resource_class = ValuesUserResource
+    media_type_classes = (CollectionJSON, CollectionNextJSON, CollectionHyperAdminJSON)
+    
+    def setUp(self):
+        super(CollectionItemDataTestCase, self).setUp()
+        create_objects(User, [User(username='itemdata%s' % i, email='row%s@example.com' % i, first_name='Plan', is_active=bool(i % 2))
+                              for i in range(20)])
+    
+    def tearDown(self):
+        User.objects.filter(username__startswith='itemdata').delete()
+        super(CollectionItemDataTestCase, self).tearDown()
+    
+    def serialize_list(self, media_type_class):
+        endpoint = self.get_endpoint(params={'q': 'itemdata'})
+        return self.serialize(endpoint, media_type_class).content
+    
+    def test_values_match_list_forms(self):
+        for media_type_class in self.media_type_classes:
+            values_content = self.serialize_list(media_type_class)
+            with patch.object(ValuesUserResource, 'list_values', False):
+                with patch.object(ListResourceItem, 'get_row_values', lambda item: None):
+                    form_content = self.serialize_list(media_type_class)
+            self.assertEqual(json.loads(values_content), json.loads(form_content))
+            self.assertEqual(values_content, form_content)
+    
+    def test_field_plan_matches_list_forms(self):
+        for media_type_class in self.media_type_classes:
+            with patch.multiple(ValuesUserResource, list_values=False, list_display=PlanUserResource.list_display):
+                content = self.serialize_list(media_type_class)
+                with patch.object(ListResourceItem, 'get_row_values', lambda item: None):
+                    form_content = self.serialize_list(media_type_class)
+            self.assertTrue('Plan' in content)
+            self.assertEqual(content, form_content)
+    
+    def test_custom_forms_are_converted(self):
+        class CustomListResourceItem(ListResourceItem):
+            form_class = forms.Form
+        
+        item = CustomListResourceItem(endpoint=self.get_endpoint(), instance=self.user)
+        self.assertEqual(item.get_row_values(), None)
+    
+    def test_row_values_can_be_turned_off(self):
+        class FormListResourceItem(ListResourceItem):
+            use_row_values = False
+        
+        item = ListResourceItem(endpoint=self.get_endpoint(), instance=self.user)
+        self.assertEqual(item.get_row_values()['username'], self.user.username)
+        item = FormListResourceItem(endpoint=self.get_endpoint(), instance=self.user)
+        self.assertEqual(item.get_row_values(), None)
+    
+    @unittest.skipUnless(hasattr(http, 'StreamingHttpResponse'), 'django < 1.5 does not stream responses')
+    def test_streamed_content_matches(self):
+        for values in (True, False):
+            with patch.multiple(ValuesUserResource, list_values=values, stream_chunk_size=7):
+                params = {'q': 'itemdata1'}
+                content = self.serialize(self.get_endpoint(params=params), CollectionHyperAdminJSON).content
+                response = self.serialize(self.get_endpoint(params=dict(params, stream='1')), CollectionHyperAdminJSON)
+                self.assertTrue(response.streaming)
+                streamed = ''.join(response.streaming_content)
+            collection = json.loads(content)['collection']
+            streamed_collection = json.loads(streamed)['collection']
+            self.assertEqual(len(collection['items']), 11)
+            self.assertEqual(streamed_collection['items'], collection['items'])
+            #links of the streamed list keep the stream parameter
+            self.assertEqual(sorted(streamed_collection.keys()), sorted(collection.keys()))
+            self.assertEqual(len(streamed_collection['queries']), len(collection['queries']))
+    
+    @unittest.skipUnless(hasattr(http, 'StreamingHttpResponse'), 'django < 1.5 does not stream responses')
+    def test_resource_streams_collections(self):
+        with patch.object(ValuesUserResource, 'stream_collections', True):
+            response = self.serialize(self.get_endpoint(params={'q': 'itemdata'}), CollectionJSON)
+        self.assertTrue(response.streaming)
+
+class CollectionFilterLinkTestCase(UserResourceTestCase):
+    def setUp(self):
+        super(CollectionFilterLinkTestCase, self).setUp()
+        self.group = Group.objects.create(name='filterlinkgroup')
+        self.user.groups.add(self.group)
+    
+    def tearDown(self):
+        Group.objects.filter(name='filterlinkgroup').delete()
+        super(CollectionFilterLinkTestCase, self).tearDown()
+    
+    def get_filter_links(self, group):
+        endpoint = self.get_endpoint(params={'q': self.user.username})
+        return [link for link in endpoint.get_filter_links() if link.cl_headers.get('group') == group]
+    
+    def test_facet_counts(self):
+        with patch.object(UserResource, 'list_facets', True):
+            links = self.get_filter_links('staff status')
+        staff_link = [link for link in links if link.prompt == 'Yes'][0]
+        for media_type in (CollectionJSON, CollectionNextJSON, CollectionHyperAdminJSON):
+            adaptor = media_type(self.get_api_request())
+            self.assertEqual(adaptor.convert_link(staff_link)['count'], 1)
+    
+    def test_search_filter_links(self):
+        with patch.multiple(UserResource, list_filter=['groups']):
+            with patch.object(RelatedFieldFilter, 'max_choices', 0):
+                links = self.get_filter_links('groups')
+        adaptor = CollectionJSON(self.get_api_request())
+        query = adaptor.convert_link(links[0])
+        self.assertEqual(query['data'], [{'name': 'groups__id__exact', 'prompt': 'groups', 'value': None}])
@@ -1,10 +1,22 @@
+from io import BytesIO
+
+from datatap.datataps import JSONDataTap, ModelDataTap
+
+from django import http
+from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.utils import simplejson as json
+from django.utils import unittest
 
 from hyperadmin.mediatypes.json import JSON, JSONP
+from hyperadmin.resources.crud.hyperobjects import ListResourceItem
+from hyperadmin.tests.common import get_content
+from hyperadmin.tests.test_resources import UserResourceTestCase, UserResource
 
 from common import MediaTypeTestCase
 
+from mock import patch
+
 
 class JsonTestCase(MediaTypeTestCase):
     def get_adaptor(self):
@@ -19,7 +31,7 @@ class JsonTestCase(MediaTypeTestCase):
         state = endpoint.state
         
         response = self.adaptor.serialize(content_type='application/json', link=link, state=state)
-        data = json.loads(response.content)
+        data = json.loads(get_content(response))
         self.assertEqual(len(data), ContentType.objects.count())
     
     def test_model_instance_serialize(self):
@@ -32,7 +44,7 @@ class JsonTestCase(MediaTypeTestCase):
         state = endpoint.state
         
         response = self.adaptor.serialize(content_type='application/json', link=link, state=state)
-        data = json.loads(response.content)
+        data = json.loads(get_content(response))
         assert data, str(data)
         #self.assertEqual(len(json_items), 1)
 
@@ -50,7 +62,7 @@ class JsonpTestCase(MediaTypeTestCase):
         state = endpoint.state
         
         response = self.adaptor.serialize(content_type='text/javascript', link=link, state=state)
-        self.assertTrue(response.content.startswith('jscallback('))
+        self.assertTrue(get_content(response).startswith('jscallback('))
         #data = json.loads(response.content)
         #self.assertEqual(len(data), len(items))
     
@@ -65,9 +77,72 @@ class JsonpTestCase(MediaTypeTestCase):
         state = endpoint.state
         
         response = self.adaptor.serialize(content_type='text/javascript', link=link, state=state)
-        self.assertTrue(response.content.startswith('jscallback('))
+        self.assertTrue(get_content(response).startswith('jscallback('))
         #data = json.loads(response.content)
         #assert data, str(data)
         #self.assertEqual(len(json_items), 1)
         
 
+
+class PagedUserResource(UserResource):
+    list_per_page = 100
+
+@unittest.skipUnless(hasattr(http, 'StreamingHttpResponse'), 'django < 1.5 does not stream responses')
+class DataTapStreamingTestCase(UserResourceTestCase):
+    resource_class = PagedUserResource
+    
+    def setUp(self):
+        super(DataTapStreamingTestCase, self).setUp()
+        User.objects.bulk_create([User(username='taprow%s' % i, email='tap%s@example.com' % i)
+                                  for i in range(250)])
+    
+    def tearDown(self):
+        User.objects.filter(username__startswith='taprow').delete()
+        super(DataTapStreamingTestCase, self).tearDown()
+    
+    def serialize_list(self, media_type_class, params):
+        return self.serialize(self.get_endpoint(params=params), media_type_class)
+    
+    def test_streamed_json_matches_datatap(self):
+        response = self.serialize_list(JSON, {'q': 'taprow', 'p': '2'})
+        self.assertTrue(response.streaming)
+        data = json.loads(''.join(response.streaming_content))
+        self.assertEqual(len(data), 100)
+        instances = User.objects.filter(pk__in=[entry['pk'] for entry in data])
+        payload = BytesIO()
+        JSONDataTap(instream=ModelDataTap([instances])).send(payload)
+        by_pk = lambda entry: entry['pk']
+        self.assertEqual(sorted(data, key=by_pk), sorted(json.loads(payload.getvalue()), key=by_pk))
+    
+    def test_jsonp_wraps_stream(self):
+        response = self.serialize_list(JSONP, {'q': 'taprow', 'callback': 'jscallback'})
+        content = ''.join(response.streaming_content)
+        self.assertTrue(content.startswith('jscallback(['))
+        self.assertTrue(content.endswith('])'))
+        self.assertEqual(len(json.loads(content[len('jscallback('):-1])), 100)
+    
+    def test_page_headers(self):
+        response = self.serialize_list(JSON, {'q': 'taprow', 'p': '2'})
+        self.assertTrue('p=3' in response['X-Next-Page'], response['X-Next-Page'])
+        self.assertTrue('p=1' in response['X-Previous-Page'], response['X-Previous-Page'])
+        response = self.serialize_list(JSON, {'q': 'taprow', 'p': '3'})
+        self.assertFalse(response.has_header('X-Next-Page'))
+    
+    def test_items_are_read_as_the_response_is_consumed(self):
+        built = list()
+        original_init = ListResourceItem.__init__
+        
+        def tracking_init(item, *args, **kwargs):
+            original_init(item, *args, **kwargs)
+            built.append(1)
+        
+        with patch.object(ListResourceItem, '__init__', tracking_init):
+            with patch.object(PagedUserResource, 'stream_chunk_size', 10):
+                with patch.object(JSON, 'chunk_size', 1024):
+                    response = self.serialize_list(JSON, {'q': 'taprow'})
+                    before = len(built)
+                    content = iter(response.streaming_content)
+                    content.next()
+                    self.assertEqual(len(built) - before, 10)
+                    list(content)
+        self.assertEqual(len(built) - before, 100)
@@ -0,0 +1,352 @@
+import time
+from datetime import timedelta
+
+import mimeparse
+
+from django.contrib.auth.models import User, Group
+from django.core.urlresolvers import RegexURLResolver
+from django.utils.http import http_date
+
+from hyperadmin.endpoints import BaseEndpoint, RootEndpoint
+from hyperadmin.links import LinkPrototype, LinkChain, CompactLink
+from hyperadmin.mediatypes.collectionjson import CollectionJSON
+from hyperadmin.apirequests import NamespaceAPIRequest
+from hyperadmin.resources.models import ModelResource
+from hyperadmin.resources.crud.hyperobjects import ListResourceItem
+
+from common import count_calls, capture_queries
+from test_resources import UserResourceTestCase, UserResource
+
+from mock import patch
+
+
+class EndpointBindingTestCase(UserResourceTestCase):
+    def dispatch_list(self):
+        api_request = self.get_api_request()
+        endpoint = api_request.get_endpoint(self.resource.endpoints['list'].get_url_name())
+        endpoint.dispatch_api(api_request)
+        return api_request
+
+    def test_compiled_site_does_not_fork(self):
+        self.site.compile_endpoints = False
+        forks = count_calls(BaseEndpoint, 'fork', self.dispatch_list)[1]
+        self.assertTrue(forks)
+
+        self.site.compile_endpoints = True
+        forks = count_calls(BaseEndpoint, 'fork', self.dispatch_list)[1]
+        self.assertEqual(forks, [])
+
+    def test_bound_endpoints_share_compiled_graph(self):
+        self.site.compile_endpoints = True
+        api_request = self.dispatch_list()
+        site = api_request.get_site()
+        self.assertTrue(self.site.is_compiled())
+        self.assertEqual(site.endpoints_by_urlname, self.site.endpoints_by_urlname)
+
+        resource = api_request.get_endpoint(self.resource.get_url_name())
+        self.assertEqual(resource.api_request, api_request)
+        self.assertEqual(resource.get_unbound_endpoint(), self.resource)
+        for endpoint in resource.endpoints.values():
+            self.assertEqual(endpoint.api_request, api_request)
+            self.assertEqual(endpoint.parent, resource)
+        self.assertEqual(self.resource.api_request, None)
+
+    def test_view_binds_registered_endpoint(self):
+        self.site.compile_endpoints = True
+        view = self.resource.endpoints['list'].get_view()
+        self.assertTrue(view.csrf_exempt)
+        self.assertEqual(view.endpoint, self.resource.endpoints['list'])
+        request = self.factory.get('/', HTTP_ACCEPT=CollectionJSON.recognized_media_types[0])
+        response, built = count_calls(BaseEndpoint, '__init__', view, request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(built, [])
+
+class LinkPrototypeTestCase(UserResourceTestCase):
+    def dispatch_list(self):
+        api_request = self.get_api_request()
+        endpoint = api_request.get_endpoint(self.resource.endpoints['list'].get_url_name())
+        endpoint.dispatch_api(api_request)
+        return api_request
+
+    def test_prototypes_are_built_once_per_urlname(self):
+        for compile_endpoints in (False, True):
+            self.site.compile_endpoints = compile_endpoints
+            self.dispatch_list()
+            built = count_calls(LinkPrototype, '__init__', self.dispatch_list)[1]
+            self.assertEqual(built, [])
+
+    def test_bound_prototypes_use_request_endpoints(self):
+        api_request = self.dispatch_list()
+        endpoint = api_request.get_endpoint(self.resource.endpoints['list'].get_url_name())
+        shared = self.resource.endpoints['list'].link_prototypes
+        for name in shared.keys():
+            proto = endpoint.link_prototypes[name]
+            self.assertNotEqual(proto, shared[name])
+            self.assertEqual(proto.endpoint.api_request, api_request)
+            self.assertEqual(shared[name].endpoint.api_request, None)
+
+    def test_unshared_prototypes_are_built_per_request(self):
+        proto = self.resource.endpoints['list'].link_prototypes['list']
+        with patch.object(type(proto), 'shared', False):
+            built = count_calls(LinkPrototype, '__init__', self.dispatch_list)[1]
+        self.assertTrue(built)
+
+    def test_compact_links_copy_shared_headers(self):
+        endpoint = self.get_endpoint()
+        with patch.object(LinkPrototype, 'compact_links', True):
+            first = endpoint.link_prototypes['list'].get_link(rel='list')
+            second = endpoint.link_prototypes['list'].get_link(rel='list')
+        self.assertTrue(isinstance(first, CompactLink))
+        self.assertFalse(hasattr(first, '__dict__'))
+        self.assertEqual(first.defaults, second.defaults)
+        first.cl_headers['rel'] = 'other'
+        self.assertEqual(first.rel, 'other')
+        self.assertEqual(second.rel, 'list')
+        self.assertEqual(second.cl_headers, {'rel': 'list'})
+
+    def test_compact_link_defaults_hold_no_request_data(self):
+        prototype = self.resource.endpoints['list'].link_prototypes['list']
+        with patch.object(LinkPrototype, 'compact_links', True):
+            link = self.get_endpoint().link_prototypes['list'].get_link(form_kwargs={'initial': {'username': 'x'}})
+        defaults = prototype.link_defaults[CompactLink]
+        self.assertEqual(link.defaults, defaults)
+        self.assertEqual(defaults.form_kwargs, {})
+        self.assertEqual(defaults.cl_headers, {})
+        self.assertEqual(link.form_kwargs['initial'], {'username': 'x'})
+
+    def test_links_accept_attributes(self):
+        link = self.get_endpoint().link_prototypes['list'].get_link()
+        link.custom = 'value'
+        self.assertEqual(link.custom, 'value')
+
+class EndpointResolverTestCase(UserResourceTestCase):
+    def call_detail(self):
+        api_request = self.get_api_request()
+        site = api_request.get_site()
+        url = self.resource.endpoints['detail'].fork(api_request=api_request).get_url(
+            item=self.resource.get_resource_item(self.user))
+        return site.call_endpoint(url)
+
+    def test_resolver_is_cached(self):
+        endpoint = self.call_detail()
+        self.assertEqual(endpoint.get_url_name(), self.resource.endpoints['detail'].get_url_name())
+        self.assertEqual(endpoint.api_request.url_kwargs, {'pk': str(self.user.pk)})
+
+        #resolved urls are called by url name, forget them to resolve again
+        self.site.resolvers.clear()
+        self.site.resolved_urls.clear()
+        self.assertTrue(count_calls(RootEndpoint, 'get_urls', self.call_detail)[1])
+        self.site.resolved_urls.clear()
+        self.assertEqual(count_calls(RootEndpoint, 'get_urls', self.call_detail)[1], [])
+
+    def test_register_clears_resolver(self):
+        self.call_detail()
+        self.assertTrue(self.site.resolvers)
+        self.site.register(Group, ModelResource, app_name='auth')
+        self.assertFalse(self.site.resolvers)
+
+    def test_call_endpoint_by_urlname(self):
+        api_request = self.get_api_request()
+        site = api_request.get_site()
+        url_name = self.resource.endpoints['detail'].get_url_name()
+        endpoint, calls = count_calls(RootEndpoint, 'get_resolver',
+            site.call_endpoint_by_urlname, url_name, url_kwargs={'pk': self.user.pk})
+        self.assertEqual(calls, [])
+        self.assertEqual(endpoint.get_url_name(), url_name)
+        self.assertEqual(endpoint.api_request.original_api_request, api_request)
+        self.assertEqual(endpoint.api_request.url_kwargs, {'pk': self.user.pk})
+
+    def test_follow_calls_by_urlname(self):
+        endpoint = self.get_endpoint('detail', url_kwargs={'pk': self.user.pk})
+        link = endpoint.get_item().get_link()
+        response, calls = count_calls(RegexURLResolver, 'resolve', link.follow)
+        self.assertTrue(calls)
+
+        #urls resolved before are called by url name
+        response, calls = count_calls(RegexURLResolver, 'resolve', link.follow)
+        self.assertEqual(calls, [])
+        self.assertEqual(response.endpoint.get_url_name(), self.resource.endpoints['detail'].get_url_name())
+        self.assertEqual(response.endpoint.api_request.url_kwargs, {'pk': unicode(self.user.pk)})
+
+        self.site.resolved_urls.clear()
+        response, calls = count_calls(RegexURLResolver, 'resolve', link.follow)
+        self.assertTrue(calls)
+        self.assertEqual(response.endpoint.api_request.url_kwargs, {'pk': unicode(self.user.pk)})
+
+class ContentNegotiationTestCase(UserResourceTestCase):
+    def negotiate(self):
+        api_request = self.get_api_request()
+        api_request.get_response_media_type()
+        api_request.get_response_type()
+        api_request.get_request_type()
+
+    def test_negotiation_is_memoized(self):
+        self.negotiate()
+        self.assertEqual(count_calls(mimeparse, 'best_match', self.negotiate)[1], [])
+        cache = self.site.negotiation_cache
+        self.assertTrue(cache.hits > cache.misses)
+
+    def test_register_media_type_invalidates(self):
+        self.negotiate()
+        self.assertTrue(len(self.site.negotiation_cache))
+        media_type = self.site.media_types['text/html']
+        self.site.register_media_type('text/x-custom', media_type)
+        self.assertEqual(len(self.site.negotiation_cache), 0)
+        self.assertEqual(self.site.negotiate_media_type('text/x-custom'), 'text/x-custom')
+
+    def test_negotiation_cache_is_bounded(self):
+        cache = self.site.negotiation_cache
+        for i in range(cache.max_size + 10):
+            self.site.negotiate_media_type('text/x-%s' % i)
+        self.assertEqual(len(cache), cache.max_size)
+        self.assertFalse((frozenset(self.site.media_types), 'text/x-0') in cache)
+
+class LinkChainTestCase(UserResourceTestCase):
+    def serialize_list(self):
+        return self.serialize(self.get_endpoint(dispatch=False), CollectionJSON)
+
+    def test_link_chains_are_resolved_once(self):
+        self.serialize_list()
+        self.assertEqual(count_calls(LinkChain, '__init__', self.serialize_list)[1], [])
+
+    def test_items_share_link_chains(self):
+        endpoint = self.get_endpoint(dispatch=False)
+        first, second = [endpoint.get_resource_item(self.user) for i in range(2)]
+        collector = first.links.get_item_outbound_links
+        self.assertEqual(collector.func, second.links.get_item_outbound_links.func)
+        self.assertTrue(first.links.get_item_outbound_links is collector)
+        self.assertNotEqual(collector.func, endpoint.links.get_item_outbound_links.func)
+
+class PhaseTimingTestCase(UserResourceTestCase):
+    def dispatch_list(self):
+        api_request = self.get_api_request()
+        #serialize through the response media type
+        del api_request.generate_response
+        endpoint = self.resource.endpoints['list'].fork(api_request=api_request)
+        return endpoint.dispatch_api(api_request)
+
+    def test_timing_is_disabled_by_default(self):
+        response = self.dispatch_list()
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_server_timing_header(self):
+        with patch.object(self.site, 'server_timing', True):
+            response = self.dispatch_list()
+        metrics = dict([metric.split(';', 1) for metric in response['Server-Timing'].split(', ')])
+        for phase in ['state', 'common-state', 'permission', 'items', 'serialize', 'link']:
+            self.assertTrue(phase in metrics, phase)
+
+    def test_timing_collector(self):
+        collected = list()
+
+        def collector(timings, **kwargs):
+            collected.append((timings, kwargs))
+
+        with patch.object(self.site, 'timing_collector', collector):
+            response = self.dispatch_list()
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(len(collected), 1)
+        timings, kwargs = collected[0]
+        self.assertEqual(kwargs['response'], response)
+        phases = dict([(timing['name'], timing) for timing in timings])
+        self.assertEqual(phases['state']['count'], 1)
+        self.assertTrue(phases['link']['count'] > 1)
+        self.assertTrue(all(timing['duration'] >= 0 for timing in timings))
+
+    def test_namespaces_share_timer(self):
+        api_request = self.get_api_request()
+        with patch.object(self.site, 'server_timing', True):
+            timer = api_request.start_timer()
+        self.assertTrue(timer is not None)
+        self.assertTrue(NamespaceAPIRequest(api_request).get_timer() is timer)
+        with api_request.time_phase('namespace'):
+            with api_request.time_phase('namespace'):
+                pass
+        self.assertEqual(timer.phases['namespace'][0], 1)
+
+class VersionedUserResource(UserResource):
+    version_field = 'last_login'
+
+class ConditionalResponseTestCase(UserResourceTestCase):
+    resource_class = VersionedUserResource
+
+    def setUp(self):
+        super(ConditionalResponseTestCase, self).setUp()
+        User.objects.bulk_create([User(username='etagrow%s' % i, email='etag%s@example.com' % i)
+                                  for i in range(20)])
+        self.instance = User.objects.get(username='etagrow0')
+
+    def tearDown(self):
+        User.objects.filter(username__startswith='etagrow').delete()
+        super(ConditionalResponseTestCase, self).tearDown()
+
+    def dispatch(self, name, meta=None, **kwargs):
+        api_request = self.get_api_request(**kwargs)
+        api_request.META.update(meta or {})
+        endpoint = self.resource.endpoints[name].fork(api_request=api_request)
+        return endpoint.dispatch_api(api_request), api_request
+
+    def get_list(self, meta=None, **kwargs):
+        kwargs.setdefault('params', {'q': 'etagrow'})
+        return self.dispatch('list', meta, **kwargs)
+
+    def get_detail(self, meta=None):
+        return self.dispatch('detail', meta, url_kwargs={'pk': self.instance.pk})
+
+    def test_detail_validators(self):
+        response, api_request = self.get_detail()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(api_request.generate_response.called)
+        etag = response['ETag']
+        self.assertEqual(response['Last-Modified'], http_date(time.mktime(self.instance.last_login.timetuple())))
+
+        response, api_request = self.get_detail({'HTTP_IF_NONE_MATCH': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(api_request.generate_response.called)
+
+        response, api_request = self.get_detail({'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']})
+        self.assertEqual(response.status_code, 304)
+
+        self.instance.last_login = self.instance.last_login + timedelta(minutes=5)
+        self.instance.save()
+        response, api_request = self.get_detail({'HTTP_IF_NONE_MATCH': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_not_modified_before_items_are_built(self):
+        response, api_request = self.get_list()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        (result, built), queries = capture_queries(count_calls, ListResourceItem, '__init__',
+            self.get_list, {'HTTP_IF_NONE_MATCH': '"other", %s' % etag})
+        response, api_request = result
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(api_request.generate_response.called)
+        #only the template item of the list is built
+        self.assertEqual(len(built), 1)
+        #the count of the paginator, the version aggregate and the permissions of the user
+        self.assertTrue(len(queries) <= 5, queries)
+
+    def test_list_etag_changes(self):
+        etag = self.get_list()[0]['ETag']
+        self.assertEqual(self.get_list()[0]['ETag'], etag)
+        #the query, the media type and the permissions are part of the etag
+        self.assertNotEqual(self.get_list(params={'q': 'etagrow1'})[0]['ETag'], etag)
+        self.assertNotEqual(self.get_list({'HTTP_ACCEPT': 'application/json'})[0]['ETag'], etag)
+        other_user = User.objects.create(username='etagrowother', is_staff=True, is_superuser=True)
+        self.assertNotEqual(self.get_list(user=other_user)[0]['ETag'], etag)
+        #changes and additions change the etag
+        self.instance.last_login = self.instance.last_login + timedelta(minutes=5)
+        self.instance.save()
+        changed_etag = self.get_list()[0]['ETag']
+        self.assertNotEqual(changed_etag, etag)
+        User.objects.create(username='etagrowadded', last_login=self.instance.last_login - timedelta(days=1))
+        self.assertNotEqual(self.get_list()[0]['ETag'], changed_etag)
+
+    def test_resources_without_version_field(self):
+        with patch.object(VersionedUserResource, 'version_field', None):
+            response = self.get_list({'HTTP_IF_NONE_MATCH': '*'})[0]
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
@@ -0,0 +1,271 @@
+import datetime
+
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db.backends.util import CursorDebugWrapper
+
+from hyperadmin.paginators import CachedCount
+from hyperadmin.resources.models.choices import choices_cache
+from hyperadmin.resources.models.filters import FieldFilter, RelatedFieldFilter
+from hyperadmin.resources.models.indexes import ModelIndex
+from hyperadmin.resources.models.resources import BaseModelResource
+from hyperadmin.resources.models.search import SQLiteFTSSearchBackend
+
+from common import count_calls, capture_queries
+from test_resources import UserResourceTestCase, UserResource
+
+from mock import patch
+
+
+class ChoicesUserResource(UserResource):
+    list_filter = ['groups', 'last_name']
+
+class ChoicesCacheTestCase(UserResourceTestCase):
+    resource_class = ChoicesUserResource
+
+    def setUp(self):
+        super(ChoicesCacheTestCase, self).setUp()
+        self.group = Group.objects.create(name='choicesgroup')
+        User.objects.create(username='choicesuser', last_name='Choicesname')
+        cache.clear()
+        choices_cache.local.clear()
+
+    def tearDown(self):
+        Group.objects.filter(name__startswith='choicesgroup').delete()
+        User.objects.filter(username='choicesuser').delete()
+        cache.clear()
+        super(ChoicesCacheTestCase, self).tearDown()
+
+    def get_filter_links(self):
+        links, queries = capture_queries(lambda: list(self.get_endpoint().get_filter_links()))
+        return links, len([sql for sql in queries if 'auth_group' in sql or 'DISTINCT' in sql])
+
+    def get_prompts(self, links, group):
+        return [link.prompt for link in links if link.cl_headers.get('group') == group]
+
+    def test_choices_are_cached(self):
+        links, queries = self.get_filter_links()
+        self.assertTrue('choicesgroup' in self.get_prompts(links, 'groups'))
+        self.assertTrue('Choicesname' in self.get_prompts(links, 'last name'))
+        self.assertEqual(queries, 2)
+
+        cached_links, cached_queries = self.get_filter_links()
+        self.assertEqual(cached_queries, 0)
+        self.assertEqual([link.prompt for link in cached_links], [link.prompt for link in links])
+
+        #the in process tier answers without the django cache
+        cache.clear()
+        self.assertEqual(self.get_filter_links()[1], 0)
+
+    def test_saves_and_deletes_invalidate(self):
+        self.get_filter_links()
+        Group.objects.create(name='choicesgroup2')
+        links, queries = self.get_filter_links()
+        self.assertTrue('choicesgroup2' in self.get_prompts(links, 'groups'))
+        self.assertEqual(queries, 1)
+
+        Group.objects.filter(name='choicesgroup2').delete()
+        links, queries = self.get_filter_links()
+        self.assertFalse('choicesgroup2' in self.get_prompts(links, 'groups'))
+
+    def test_large_choice_sets_become_searches(self):
+        Group.objects.bulk_create([Group(name='choicesgroup%s' % i) for i in range(5)])
+        with patch.object(RelatedFieldFilter, 'max_choices', 2):
+            links, queries = capture_queries(lambda: list(self.get_endpoint().get_filter_links()))
+        #the cardinality is tested with a bounded query and no more choices are cached
+        group_queries = [sql for sql in queries if 'FROM "auth_group"' in sql]
+        self.assertEqual(len(group_queries), 1)
+        self.assertTrue('LIMIT 3' in group_queries[0])
+        self.assertTrue(all(len(choices) <= 3 for expires, choices in choices_cache.local.entries.values()))
+        group_links = [link for link in links if link.cl_headers.get('group') == 'groups']
+        self.assertEqual(len(group_links), 1)
+        self.assertTrue('search' in group_links[0].classes)
+        self.assertEqual(list(group_links[0].form.fields.keys()), ['groups__id__exact'])
+
+class IndexConstructionTestCase(UserResourceTestCase):
+    resource_class = ChoicesUserResource
+
+    def get_detail(self):
+        return self.get_endpoint('detail', url_kwargs={'pk': self.user.pk})
+
+    def get_list(self):
+        return self.get_endpoint(params={'q': self.user.username})
+
+    def test_definitions_are_compiled_once(self):
+        self.get_list()
+        self.assertEqual(count_calls(BaseModelResource, 'compile_index_definitions', self.get_list)[1], [])
+        definitions = self.resource.get_index_definitions()
+        self.assertEqual(sorted(definitions.keys()), ['filter', 'primary'])
+        self.assertEqual([spec[0].__name__ for spec in definitions['filter'][1]],
+                         ['RelatedFieldFilter', 'AllValuesFieldFilter', 'SearchFilter'])
+
+        with patch.object(ChoicesUserResource, 'list_filter', ['is_staff']):
+            definitions = self.resource.get_index_definitions()
+        self.assertEqual([spec[0].__name__ for spec in definitions['filter'][1]],
+                         ['BooleanFieldFilter', 'SearchFilter'])
+
+    def test_filters_are_built_when_used(self):
+        index = self.resource.get_index('filter')
+        self.assertEqual(index._filters, None)
+        self.assertEqual(len(index.filters), 3)
+
+        endpoint = self.get_list()
+        self.assertEqual(len(endpoint.state['index'].filters), 3)
+        self.assertEqual(len(endpoint.state.get_resource_items()), 1)
+
+    def test_detail_requests_build_no_filters(self):
+        self.get_detail()
+        self.assertEqual(count_calls(FieldFilter, '__init__', self.get_detail)[1], [])
+
+    def test_get_indexes_overrides_are_used(self):
+        class StaffIndex(ModelIndex):
+            pass
+
+        def get_indexes(resource):
+            indexes = BaseModelResource.get_indexes(resource)
+            indexes['staff'] = StaffIndex('staff', resource)
+            return indexes
+
+        with patch.multiple(ChoicesUserResource, get_indexes=get_indexes, build_indexes_by_name=False):
+            index = self.resource.get_index('staff')
+            self.assertTrue(isinstance(index, StaffIndex))
+            self.assertEqual(len(self.resource.get_index('filter').filters), 3)
+        self.assertEqual(count_calls(BaseModelResource, 'get_indexes', self.resource.get_index, 'filter')[1], [])
+
+class FacetUserResource(UserResource):
+    list_filter = ['is_staff', 'groups', 'date_joined', 'last_name']
+    list_facets = True
+
+class FacetCountsTestCase(UserResourceTestCase):
+    resource_class = FacetUserResource
+
+    def setUp(self):
+        super(FacetCountsTestCase, self).setUp()
+        cache.clear()
+        choices_cache.local.clear()
+        self.group = Group.objects.create(name='facetgroup')
+        staff = User.objects.create(username='facetuser1', last_name='Facetname', is_staff=True)
+        staff.groups.add(self.group)
+        User.objects.create(username='facetuser2', last_name='Facetname')
+
+    def tearDown(self):
+        Group.objects.filter(name='facetgroup').delete()
+        User.objects.filter(username__startswith='facetuser').delete()
+        cache.clear()
+        super(FacetCountsTestCase, self).tearDown()
+
+    def get_filter_links(self, **params):
+        params.setdefault('q', 'facetuser')
+        endpoint = self.get_endpoint(params=params)
+        links, queries = capture_queries(lambda: list(endpoint.get_filter_links()))
+        return links, len([sql for sql in queries if 'COUNT(DISTINCT' in sql or 'SUM(CASE' in sql])
+
+    def get_counts(self, links, group):
+        return dict([(link.prompt, (link.descriptors or {}).get('count'))
+                     for link in links if link.cl_headers.get('group') == group])
+
+    def test_counts_filtered_list(self):
+        links, queries = self.get_filter_links()
+        self.assertEqual(queries, 4)
+        self.assertEqual(self.get_counts(links, 'staff status'), {'All': None, 'Yes': 1, 'No': 1})
+        self.assertEqual(self.get_counts(links, 'groups')['facetgroup'], 1)
+        self.assertEqual(self.get_counts(links, 'last name')['Facetname'], 2)
+        date_counts = self.get_counts(links, 'date joined')
+        self.assertEqual(date_counts['Any date'], None)
+        self.assertEqual(date_counts['Today'], 2)
+        self.assertEqual(date_counts['This year'], 2)
+
+        links = self.get_filter_links(is_staff__exact='1')[0]
+        self.assertEqual(self.get_counts(links, 'staff status'), {'All': None, 'Yes': 1, 'No': 0})
+        self.assertEqual(self.get_counts(links, 'last name')['Facetname'], 1)
+
+    def test_date_bounds_are_query_params(self):
+        links, calls = count_calls(CursorDebugWrapper, 'execute', self.get_filter_links)
+        sql, params = [call[1:3] for call in calls if 'SUM(CASE' in call[1]][0]
+        today = str(datetime.date.today())
+        self.assertFalse(today in sql)
+        self.assertTrue([param for param in params if str(param).startswith(today)])
+
+    def test_counts_are_optional(self):
+        with patch.object(FacetUserResource, 'list_facets', False):
+            links, queries = self.get_filter_links()
+        self.assertEqual(queries, 0)
+        self.assertEqual(set(self.get_counts(links, 'staff status').values()), set([None]))
+
+    def test_counts_are_cached_with_the_list_count(self):
+        with patch.object(FacetUserResource, 'count_strategy', CachedCount):
+            links, queries = self.get_filter_links()
+            self.assertEqual(queries, 4)
+            cached_links, cached_queries = self.get_filter_links()
+            self.assertEqual(cached_queries, 0)
+            self.assertEqual(self.get_counts(cached_links, 'staff status'),
+                             self.get_counts(links, 'staff status'))
+            self.assertEqual(self.get_filter_links(is_staff__exact='1')[1], 4)
+
+class SearchUserResource(UserResource):
+    search_fields = ['username', 'last_name']
+    search_backend = SQLiteFTSSearchBackend
+
+class FTSSearchTestCase(UserResourceTestCase):
+    resource_class = SearchUserResource
+
+    def setUp(self):
+        super(FTSSearchTestCase, self).setUp()
+        self.first = User.objects.create(username='searchfirst', last_name='Quokka')
+        self.second = User.objects.create(username='searchsecond', last_name='Quokka quokka')
+        call_command('rebuild_search_index', verbosity=0)
+
+    def tearDown(self):
+        User.objects.filter(username__startswith='search').delete()
+        super(FTSSearchTestCase, self).tearDown()
+
+    def search(self, query):
+        def get_items():
+            endpoint = self.get_endpoint(params={'q': query})
+            return endpoint.state.get_resource_items()
+
+        items, queries = capture_queries(get_items)
+        self.assertFalse([sql for sql in queries if 'LIKE' in sql])
+        return [item.instance.username for item in items]
+
+    def test_search_matches_prefixes(self):
+        self.assertEqual(sorted(self.search('quok')), ['searchfirst', 'searchsecond'])
+        self.assertEqual(self.search('searchf quokka'), ['searchfirst'])
+        self.assertEqual(self.search('okka'), [])
+
+    def test_saves_and_deletes_update_the_index(self):
+        self.first.last_name = 'Wombat'
+        self.first.save()
+        self.assertEqual(self.search('quokka'), ['searchsecond'])
+        self.assertEqual(self.search('wombat'), ['searchfirst'])
+        self.second.delete()
+        self.assertEqual(self.search('quokka'), [])
+
+    def test_relevance_ordering(self):
+        with patch.object(SearchUserResource, 'search_relevance', True):
+            self.assertEqual(self.search('quokka'), ['searchsecond', 'searchfirst'])
+            self.assertEqual(self.search('searchfirst'), ['searchfirst'])
+
+    def test_contains_backend_is_the_default(self):
+        with patch.object(SearchUserResource, 'search_backend', UserResource.search_backend):
+            endpoint = self.get_endpoint(params={'q': 'okka'})
+            usernames = [item.instance.username for item in endpoint.state.get_resource_items()]
+        self.assertEqual(sorted(usernames), ['searchfirst', 'searchsecond'])
+
+    def test_unprepared_backends_fall_back(self):
+        backend = SQLiteFTSSearchBackend(User, ['username', 'first_name', 'last_name'])
+        self.assertFalse(backend.is_prepared('default'))
+        backend.index_object(self.first, 'default')
+        self.assertFalse(backend.is_prepared('default'))
+        queryset, queries = capture_queries(lambda: list(backend.filter(User.objects.all(), 'okka')))
+        self.assertEqual(sorted(user.username for user in queryset), ['searchfirst', 'searchsecond'])
+        self.assertTrue([sql for sql in queries if 'LIKE' in sql])
+
+    def test_missing_fts_module(self):
+        backend = SQLiteFTSSearchBackend(User, ['username', 'first_name', 'last_name'])
+        with patch.object(backend, 'fts_module', 'nofts'):
+            self.assertRaises(ImproperlyConfigured, backend.prepare, 'default')
+        self.assertFalse(backend.is_prepared('default'))
+        self.assertEqual(backend.filter(User.objects.all(), 'searchfirst').get(), self.first)
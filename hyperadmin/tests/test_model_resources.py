@@ -0,0 +1,294 @@
+import logging
+from io import BytesIO
+
+from django import forms
+from django.contrib.auth.models import User, Permission
+from django.utils import simplejson as json
+
+from hyperadmin.mediatypes.json import JSON
+from hyperadmin.resources.models import ModelResource
+from hyperadmin.resources.crud.hyperobjects import ListResourceItem, ValuesListResourceItem
+from hyperadmin.resources.models.search import SQLiteFTSSearchBackend
+from hyperadmin.signals import resource_event
+
+from common import capture_queries, get_content
+from test_resources import ResourceTestCase, UserResourceTestCase, UserResource
+
+from mock import patch, MagicMock
+
+
+class PermissionResource(ModelResource):
+    list_display = ['name', 'content_type']
+    list_per_page = 2
+
+class PermissionResourceTestCase(ResourceTestCase):
+    def register_resource(self):
+        self.site.register(Permission, PermissionResource, app_name='auth')
+        return self.site.registry[Permission]
+
+    def get_endpoint(self, name, **kwargs):
+        api_request = self.get_api_request()
+        endpoint = self.resource.endpoints[name].fork(api_request=api_request)
+        endpoint.kwargs = kwargs
+        return endpoint
+
+    def get_list(self):
+        endpoint = self.get_endpoint('list')
+        endpoint.dispatch_api(endpoint.api_request)
+        return endpoint
+
+class QueryPlannerTestCase(PermissionResourceTestCase):
+    def count_list_queries(self, per_page, **overrides):
+        with patch.multiple(PermissionResource, list_per_page=per_page, **overrides):
+            endpoint = self.get_list()
+            forms, queries = capture_queries(lambda: [item.form for item in endpoint.state.get_resource_items()])
+        self.assertEqual(len(forms), per_page)
+        self.assertTrue(all(form.initial['content_type'] for form in forms))
+        return len(queries)
+
+    def test_list_queries_stay_flat(self):
+        self.assertTrue(Permission.objects.count() >= 10)
+        small, large = self.count_list_queries(2), self.count_list_queries(10)
+        self.assertEqual(small, large)
+
+        unplanned_small = self.count_list_queries(2, query_planner_class=None)
+        unplanned_large = self.count_list_queries(10, query_planner_class=None)
+        self.assertEqual(unplanned_large - unplanned_small, 8)
+
+    def test_resource_overrides(self):
+        planner = self.resource.get_query_planner()
+        self.assertEqual(planner.get_list_plan(), (['content_type'], []))
+        with patch.object(PermissionResource, 'list_select_related', True):
+            self.assertEqual(planner.get_list_plan(), (None, []))
+        with patch.multiple(PermissionResource, list_select_related=['content_type'], list_prefetch_related=['group_set']):
+            self.assertEqual(planner.get_list_plan(), (['content_type'], ['group_set']))
+        self.assertEqual(planner.get_detail_plan(), (['content_type'], []))
+
+    def test_detail_plan_follows_form(self):
+        self.site.register(User, UserResource, app_name='auth')
+        user_resource = self.site.registry[User]
+        select_related, prefetch_related = user_resource.get_query_planner().get_detail_plan()
+        self.assertEqual(select_related, [])
+        self.assertEqual(sorted(prefetch_related), ['groups', 'user_permissions'])
+
+    def test_plans_select_only_without_prefetch(self):
+        self.site.register(User, UserResource, app_name='auth')
+        planner = self.site.registry[User].get_query_planner()
+        with patch.object(type(planner), 'supports_prefetch', False):
+            self.assertEqual(planner.get_detail_plan(), ([], []))
+            with patch.object(PermissionResource, 'list_prefetch_related', ['group_set']):
+                self.assertEqual(self.resource.get_query_planner().get_list_plan(), (['content_type'], []))
+        queryset = MagicMock(spec=['select_related'])
+        planner.apply_plan(queryset, ['content_type'], ['groups'])
+        queryset.select_related.assert_called_once_with('content_type')
+
+class ColumnPruningTestCase(PermissionResourceTestCase):
+    def get_list_sql(self):
+        sql = str(self.get_list().get_index().get_page().object_list.query)
+        return sql.split(' FROM ', 1)[0]
+
+    def test_list_loads_rendered_columns(self):
+        self.assertTrue('"auth_permission"."codename"' in self.get_list_sql())
+        with patch.object(PermissionResource, 'prune_columns', True):
+            sql = self.get_list_sql()
+            planner = self.get_endpoint('list').resource.get_query_planner()
+            self.assertEqual(planner.get_columns_plan('list'), ['name', 'content_type', 'id'])
+        self.assertFalse('"auth_permission"."codename"' in sql)
+        self.assertTrue('"auth_permission"."name"' in sql)
+
+    def render_list(self):
+        items = self.get_list().state.get_resource_items()
+        return [item.form for item in items], [item.get_prompt() for item in items]
+
+    def test_pruned_list_renders_without_loads(self):
+        with patch.object(PermissionResource, 'prune_columns', True):
+            pruned_queries = capture_queries(self.render_list)[1]
+        queries = capture_queries(self.render_list)[1]
+        self.assertEqual(len(pruned_queries), len(queries))
+
+    def test_deferred_loads_are_logged(self):
+        permission = Permission.objects.all()[0]
+
+        class CodenameForm(forms.ModelForm):
+            class Meta:
+                model = Permission
+                fields = ['codename']
+
+        with patch.multiple(PermissionResource, prune_columns=True, form_class=CodenameForm):
+            with patch.object(logging.getLogger('hyperadmin.endpoints'), 'warning') as warning:
+                endpoint = self.get_endpoint('detail', pk=permission.pk)
+                item = endpoint.get_item()
+                self.assertEqual(item.instance.codename, permission.codename)
+                self.assertFalse(warning.called)
+                self.assertEqual(item.instance.name, permission.name)
+        self.assertEqual(warning.call_count, 1)
+        self.assertTrue('Permission.name' in warning.call_args[0][0])
+
+        #the deferred classes django shares between querysets log nothing
+        with patch.object(logging.getLogger('hyperadmin.endpoints'), 'warning') as warning:
+            other = Permission.objects.only('codename').get(pk=permission.pk)
+            self.assertEqual(other.name, permission.name)
+        self.assertFalse(warning.called)
+
+    def test_prune_extra_fields(self):
+        with patch.multiple(PermissionResource, prune_columns=True, prune_extra_fields=['codename']):
+            planner = self.get_endpoint('list').resource.get_query_planner()
+            self.assertEqual(planner.get_columns_plan('list'), None)
+        with patch.multiple(PermissionResource, prune_columns=True, list_display=['name'], prune_extra_fields=['codename']):
+            planner = self.get_endpoint('list').resource.get_query_planner()
+            self.assertEqual(planner.get_columns_plan('list'), ['name', 'id', 'codename'])
+
+class ValuesUserResource(UserResource):
+    list_display = ['username', 'email', 'is_active', 'last_login']
+    list_values = True
+    list_per_page = 100
+
+class ValuesListTestCase(UserResourceTestCase):
+    resource_class = ValuesUserResource
+    item_count = 20
+
+    def setUp(self):
+        super(ValuesListTestCase, self).setUp()
+        User.objects.bulk_create([User(username='valuesrow%s' % i, email='row%s@example.com' % i, is_active=bool(i % 2))
+                                  for i in range(self.item_count)])
+
+    def tearDown(self):
+        User.objects.filter(username__startswith='valuesrow').delete()
+        super(ValuesListTestCase, self).tearDown()
+
+    def get_items(self):
+        return self.get_endpoint(params={'q': 'valuesrow'}).state.get_resource_items()
+
+    def test_concrete_fields_are_fetched_as_values(self):
+        items = self.get_items()
+        self.assertEqual(len(items), self.item_count)
+        self.assertTrue(all(isinstance(item, ValuesListResourceItem) for item in items))
+        self.assertEqual(items[0].instance.username, items[0].row['username'])
+
+        with patch.object(ValuesUserResource, 'list_display', ['username', '__str__']):
+            items = self.get_items()
+        self.assertFalse(any(isinstance(item, ValuesListResourceItem) for item in items))
+
+        with patch.object(ValuesUserResource, 'list_values', False):
+            items = self.get_items()
+        self.assertEqual(type(items[0]), ListResourceItem)
+
+    def test_values_are_opt_in(self):
+        with patch.object(ValuesUserResource, 'list_values', UserResource.list_values):
+            items = self.get_items()
+        self.assertEqual(type(items[0]), ListResourceItem)
+
+    def test_restricted_columns_defer_the_rest(self):
+        endpoint = self.get_endpoint(params={'q': 'valuesrow'})
+
+        def get_prompts():
+            items = endpoint.state.get_resource_items()
+            return items, [item.get_prompt() for item in items]
+
+        (items, prompts), queries = capture_queries(get_prompts)
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(prompts[0].startswith('valuesrow'))
+        self.assertEqual(sorted(items[0].row.keys()), ['email', 'id', 'is_active', 'last_login', 'username'])
+
+class DataTapIngestTestCase(UserResourceTestCase):
+    def tearDown(self):
+        User.objects.filter(username__startswith='ingestrow').delete()
+        super(DataTapIngestTestCase, self).tearDown()
+
+    def get_primitive(self, index, **fields):
+        fields.setdefault('username', 'ingestrow%s' % index)
+        fields.setdefault('email', 'ingest%s@example.com' % index)
+        fields.setdefault('password', 'unusable')
+        fields.setdefault('date_joined', '2013-01-01T00:00:00')
+        fields.setdefault('last_login', '2013-01-01T00:00:00')
+        return {'model': 'auth.user', 'fields': fields}
+
+    def post(self, primitives):
+        payload = json.dumps(primitives)
+        request = self.factory.post('/', payload, content_type='application/json')
+        endpoint = self.get_endpoint(dispatch=False, method='POST', request=request)
+        endpoint.api_request.META['CONTENT_TYPE'] = 'application/json'
+        endpoint.post(endpoint.api_request)
+        return endpoint
+
+    def test_batches_are_bulk_created(self):
+        existing = User.objects.create(username='ingestrowexisting')
+        primitives = [self.get_primitive(i) for i in range(1200)]
+        primitives[3]['fields']['username'] = 'ingestrow' * 10
+        primitives[700]['fields']['email'] = 'not an email'
+        primitives[1100] = self.get_primitive('existing', email='updated@example.com')
+        primitives[1100]['pk'] = existing.pk
+        endpoint, queries = capture_queries(self.post, primitives)
+        inserts = [sql for sql in queries if sql.startswith('INSERT')]
+        results = endpoint.state.meta['ingest']
+        self.assertEqual([result['count'] for result in results], [500, 500, 200])
+        self.assertEqual([result['created'] for result in results], [499, 499, 199])
+        self.assertEqual([result['updated'] for result in results], [0, 0, 1])
+        self.assertEqual([failure['index'] for result in results for failure in result['failures']], [3, 700])
+        self.assertEqual(results[1]['failures'][0]['errors'].keys(), ['email'])
+        self.assertEqual(User.objects.filter(username__startswith='ingestrow').count(), 1198)
+        self.assertEqual(User.objects.get(pk=existing.pk).email, 'updated@example.com')
+        self.assertTrue(len(inserts) < 40, len(inserts))
+
+        adaptor = JSON(endpoint.api_request)
+        adaptor.detect_redirect = lambda link: False
+        response = adaptor.serialize(content_type='application/json', link=endpoint.get_link(), state=endpoint.state)
+        self.assertEqual(json.loads(get_content(response)), results)
+
+    def test_batches_emit_events(self):
+        events = list()
+        listener = lambda sender, **kwargs: events.append((sender, len(kwargs['item_list'])))
+        resource_event.connect(listener)
+        try:
+            self.post([self.get_primitive(i) for i in range(700)])
+        finally:
+            resource_event.disconnect(listener)
+        sender = '%s!ingest' % self.resource.get_url_name()
+        self.assertEqual(events, [(sender, 500), (sender, 200)])
+
+    def test_objects_are_saved_without_bulk_create(self):
+        with patch('hyperadmin.resources.models.resources.BULK_CREATE', False):
+            results = self.post([self.get_primitive(i) for i in range(5)]).state.meta['ingest']
+        self.assertEqual(results[0]['created'], 5)
+        self.assertEqual(User.objects.filter(username__startswith='ingestrow').count(), 5)
+
+    def test_failed_batch_is_rolled_back(self):
+        primitives = [self.get_primitive(i) for i in range(800)]
+        #duplicates within a batch pass the form and fail in the database
+        primitives[600]['fields']['username'] = 'ingestrow550'
+        results = self.post(primitives).state.meta['ingest']
+        self.assertEqual(results[0]['created'], 500)
+        self.assertEqual(results[1]['created'], 0)
+        self.assertTrue(results[1]['error'])
+        self.assertEqual(User.objects.filter(username__startswith='ingestrow').count(), 500)
+
+    def test_updates_are_scoped_to_the_primary_query(self):
+        hidden = User.objects.create(username='ingestrowhidden', email='hidden@example.com')
+        primitives = [self.get_primitive(0), self.get_primitive('hidden', email='taken@example.com')]
+        primitives[1]['pk'] = hidden.pk
+        queryset = lambda resource: User.objects.exclude(pk=hidden.pk)
+        with patch.object(UserResource, 'get_queryset', queryset):
+            results = self.post(primitives).state.meta['ingest']
+        self.assertEqual(results[0]['created'], 1)
+        self.assertEqual([failure['index'] for failure in results[0]['failures']], [1])
+        self.assertEqual(User.objects.get(pk=hidden.pk).email, 'hidden@example.com')
+
+    def test_created_objects_are_indexed(self):
+        with patch.multiple(UserResource, search_backend=SQLiteFTSSearchBackend, search_fields=['username']):
+            backend = self.resource.get_search_backend()
+            backend.prepare('default')
+            results = self.post([self.get_primitive(i) for i in range(5)]).state.meta['ingest']
+            endpoint = self.get_endpoint(params={'q': 'ingestrow3'})
+            usernames = [item.instance.username for item in endpoint.state.get_resource_items()]
+        self.assertEqual(results[0]['created'], 5)
+        self.assertEqual(usernames, ['ingestrow3'])
+
+    def test_payload_is_decoded_as_it_is_read(self):
+        from hyperadmin.datataps import iter_json_array
+        from datatap.encoders import DataTapJSONDecoder
+        primitives = [self.get_primitive(i) for i in range(100)]
+        stream = BytesIO(json.dumps(primitives))
+        values = iter_json_array(stream, DataTapJSONDecoder(), 1024)
+        self.assertEqual(values.next(), primitives[0])
+        self.assertTrue(stream.tell() <= 2048, stream.tell())
+        self.assertEqual(list(values), primitives[1:])
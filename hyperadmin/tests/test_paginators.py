@@ -0,0 +1,237 @@
+import base64
+import json
+import urlparse
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.paginator import InvalidPage
+from django.db import connection
+
+from hyperadmin.paginators import ExactCount, NextPageCount, CachedCount, EstimatedCount
+from hyperadmin.resources.models.indexes import CursorPaginator
+
+from common import capture_queries
+from test_resources import UserResourceTestCase, UserResource
+
+from mock import patch
+
+
+class PagedUserResource(UserResource):
+    list_per_page = 10
+
+class CursorUserResource(PagedUserResource):
+    cursor_pagination = True
+
+def get_page_params(link):
+    query = urlparse.parse_qs(link.get_absolute_url().split('?', 1)[1])
+    return dict([(key, value[0]) for key, value in query.items()])
+
+class CursorPaginationTestCase(UserResourceTestCase):
+    resource_class = CursorUserResource
+    item_count = 25
+
+    def setUp(self):
+        super(CursorPaginationTestCase, self).setUp()
+        User.objects.bulk_create([User(username='cursorpage%s' % i, is_active=bool(i % 2)) for i in range(self.item_count)])
+        self.users = User.objects.filter(username__startswith='cursorpage').order_by('pk')
+
+    def tearDown(self):
+        User.objects.filter(username__startswith='cursorpage').delete()
+        super(CursorPaginationTestCase, self).tearDown()
+
+    def get_page(self, params):
+        params = dict(params)
+        params.setdefault('q', 'cursorpage')
+        endpoint = self.get_endpoint(params=params)
+        usernames = [item.instance.username for item in endpoint.state.get_resource_items()]
+        cursors = dict([(link.prompt, get_page_params(link)) for link in endpoint.get_pagination_links()])
+        return endpoint, usernames, cursors
+
+    def walk(self, params):
+        pages = list()
+        endpoint, usernames, cursors = self.get_page(params)
+        pages.append(usernames)
+        while 'next' in cursors:
+            endpoint, usernames, cursors = self.get_page(cursors['next'])
+            pages.append(usernames)
+        return pages, cursors
+
+    def test_pages_follow_cursor_links(self):
+        pages, cursors = self.walk({})
+        self.assertEqual(map(len, pages), [10, 10, 5])
+        self.assertEqual(sum(pages, []), [user.username for user in self.users])
+
+        endpoint, usernames, cursors = self.get_page(cursors['previous'])
+        self.assertEqual(usernames, pages[1])
+        endpoint, usernames, cursors = self.get_page(cursors['previous'])
+        self.assertEqual(usernames, pages[0])
+        self.assertFalse('previous' in cursors)
+
+    def test_cursors_respect_filters(self):
+        pages, cursors = self.walk({'is_active__exact': '1'})
+        expected = [user.username for user in self.users.filter(is_active=True)]
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual(cursors['previous']['is_active__exact'], '1')
+
+    def test_descending_cursor_field(self):
+        with patch.object(CursorUserResource, 'cursor_field', '-pk'):
+            pages, cursors = self.walk({})
+        self.assertEqual(sum(pages, []), [user.username for user in self.users.reverse()])
+
+    def test_ties_are_broken_by_pk(self):
+        with patch.object(CursorUserResource, 'cursor_field', 'is_active'):
+            pages, cursors = self.walk({})
+            endpoint, usernames, cursors = self.get_page(cursors['previous'])
+        self.assertEqual(map(len, pages), [10, 10, 5])
+        self.assertEqual(sum(pages, []), [user.username for user in self.users.order_by('is_active', 'pk')])
+        self.assertEqual(usernames, pages[1])
+
+    def test_invalid_cursors(self):
+        paginator = CursorPaginator(self.users, 10, after=CursorPaginator(self.users, 10).encode_cursor(self.users[0]))
+        self.assertEqual(len(paginator.page()), 10)
+        for values in (['abc'], [1, 2], 'abc'):
+            cursor = base64.urlsafe_b64encode(json.dumps(values))
+            self.assertRaises(InvalidPage, CursorPaginator(self.users, 10, after=cursor).page)
+        self.assertRaises(InvalidPage, CursorPaginator(self.users, 10, before='not a cursor').page)
+
+    def test_invalid_cursor_params_serve_the_first_page(self):
+        first_page = self.get_page({})[1]
+        for name in ('after', 'before'):
+            endpoint, usernames, cursors = self.get_page({name: 'not a cursor'})
+            self.assertEqual(usernames, first_page)
+            self.assertEqual(sorted(cursors.keys()), ['next'])
+
+    def test_no_count_query(self):
+        (endpoint, usernames, cursors), queries = capture_queries(self.get_page, {})
+        self.assertFalse(any('COUNT(' in sql for sql in queries))
+        self.assertFalse('object_count' in endpoint.state.meta)
+
+class CountStrategyTestCase(UserResourceTestCase):
+    resource_class = PagedUserResource
+    item_count = 25
+
+    def setUp(self):
+        super(CountStrategyTestCase, self).setUp()
+        User.objects.bulk_create([User(username='countpage%s' % i) for i in range(self.item_count)])
+        cache.clear()
+
+    def tearDown(self):
+        User.objects.filter(username__startswith='countpage').delete()
+        super(CountStrategyTestCase, self).tearDown()
+
+    def get_list(self, params=None, count_strategy=None, **kwargs):
+        with patch.object(PagedUserResource, 'count_strategy', count_strategy):
+            endpoint, queries = capture_queries(self.get_endpoint, params=params or {}, **kwargs)
+            items = endpoint.state.get_resource_items()
+        counts = [sql for sql in queries if 'COUNT(' in sql]
+        return endpoint.state.meta, items, len(counts)
+
+    def test_exact_count(self):
+        meta, items, counts = self.get_list(count_strategy=ExactCount)
+        self.assertEqual(meta['object_count'], User.objects.count())
+        self.assertFalse('object_count_approximate' in meta)
+        self.assertEqual(counts, 1)
+
+        default_meta, default_items, default_counts = self.get_list()
+        self.assertEqual(default_meta['object_count'], meta['object_count'])
+        self.assertEqual(default_counts, 1)
+
+    def test_next_page_count(self):
+        meta, items, counts = self.get_list({'q': 'countpage'}, count_strategy=NextPageCount)
+        self.assertEqual(counts, 0)
+        self.assertEqual(len(items), 10)
+        self.assertTrue(meta['has_next'])
+        self.assertFalse('object_count' in meta)
+
+        meta, items, counts = self.get_list({'q': 'countpage', 'p': '3'}, count_strategy=NextPageCount)
+        self.assertEqual(len(items), 5)
+        self.assertFalse(meta['has_next'])
+
+    def test_cached_count(self):
+        params = {'q': 'countpage'}
+        meta, items, counts = self.get_list(params, count_strategy=CachedCount)
+        self.assertEqual(counts, 1)
+        self.assertEqual(meta['object_count'], self.item_count)
+        self.assertFalse('object_count_approximate' in meta)
+
+        meta, items, counts = self.get_list(dict(params, p='2'), count_strategy=CachedCount)
+        self.assertEqual(counts, 0)
+        self.assertEqual(meta['object_count'], self.item_count)
+        self.assertTrue(meta['object_count_approximate'])
+
+        meta, items, counts = self.get_list({'q': 'countpage1'}, count_strategy=CachedCount)
+        self.assertEqual(counts, 1)
+
+        self.resource.emit_event('update', item_list=[])
+        meta, items, counts = self.get_list(params, count_strategy=CachedCount)
+        self.assertEqual(counts, 1)
+
+    def test_cached_count_is_scoped_to_request(self):
+        params = {'q': 'countpage'}
+        self.assertEqual(self.get_list(params, count_strategy=CachedCount)[2], 1)
+        self.assertEqual(self.get_list(params, count_strategy=CachedCount)[2], 0)
+
+        #inline lists of different parents are counted apart
+        meta, items, counts = self.get_list(params, count_strategy=CachedCount, url_kwargs={'pk': self.user.pk})
+        self.assertEqual(counts, 1)
+
+        #as are lists requested by users with different permissions
+        other = User.objects.create(username='countpageuser', is_staff=True, is_superuser=True)
+        meta, items, counts = self.get_list(params, count_strategy=CachedCount, user=other)
+        self.assertEqual(counts, 1)
+
+    def test_estimated_count(self):
+        connection.cursor().execute('ANALYZE')
+        total = User.objects.count()
+        with patch.object(EstimatedCount, 'exact_below', 0):
+            meta, items, counts = self.get_list(count_strategy=EstimatedCount)
+            self.assertEqual(counts, 0)
+            self.assertEqual(meta['object_count'], total)
+            self.assertTrue(meta['object_count_approximate'])
+
+            meta, items, counts = self.get_list({'q': 'countpage'}, count_strategy=EstimatedCount)
+            self.assertEqual(counts, 1)
+            self.assertFalse('object_count_approximate' in meta)
+
+        meta, items, counts = self.get_list(count_strategy=EstimatedCount)
+        self.assertEqual(counts, 1)
+        self.assertFalse('object_count_approximate' in meta)
+
+class PaginationWindowTestCase(UserResourceTestCase):
+    resource_class = PagedUserResource
+    item_count = 500
+
+    def setUp(self):
+        super(PaginationWindowTestCase, self).setUp()
+        User.objects.bulk_create([User(username='windowpage%s' % i) for i in range(self.item_count)])
+
+    def tearDown(self):
+        User.objects.filter(username__startswith='windowpage').delete()
+        super(PaginationWindowTestCase, self).tearDown()
+
+    def get_pagination(self, **params):
+        params.setdefault('q', 'windowpage')
+        links = self.get_endpoint(params=params).get_pagination_links()
+        return [(link.rel, get_page_params(link)['p']) for link in links]
+
+    def test_window_around_current_page(self):
+        self.assertEqual(self.get_pagination(p='5'), [
+            ('first', '1'), ('previous', '4'),
+            ('pagination', '2'), ('pagination', '3'), ('pagination', '4'), ('pagination', '5'),
+            ('pagination', '6'), ('pagination', '7'), ('pagination', '8'),
+            ('next', '6'), ('last', '50'),
+        ])
+        self.assertEqual(self.get_pagination(), [
+            ('pagination', '1'), ('pagination', '2'), ('pagination', '3'), ('pagination', '4'),
+            ('next', '2'), ('last', '50'),
+        ])
+        self.assertEqual(self.get_pagination(p='50')[-2:], [('pagination', '49'), ('pagination', '50')])
+
+    def test_window_without_count(self):
+        with patch.object(PagedUserResource, 'count_strategy', NextPageCount):
+            pagination = self.get_pagination(p='2')
+        self.assertEqual(pagination, [
+            ('first', '1'), ('previous', '1'),
+            ('pagination', '1'), ('pagination', '2'), ('pagination', '3'),
+            ('next', '3'),
+        ])
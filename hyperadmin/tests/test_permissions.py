@@ -0,0 +1,80 @@
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.test.utils import override_settings
+
+from hyperadmin.apirequests import NamespaceAPIRequest
+from hyperadmin.mediatypes.collectionjson import CollectionJSON
+from hyperadmin.permissions import PermissionCache
+
+from common import count_calls
+from test_resources import UserResourceTestCase, UserResource
+
+from mock import patch
+
+
+class BulkPermissionBackend(ModelBackend):
+    checked = list()
+
+    def has_perm_for_objects(self, user, perm, objs):
+        self.checked.append(len(objs))
+        return [obj.pk % 2 == 0 for obj in objs]
+
+class PagedUserResource(UserResource):
+    list_per_page = 50
+
+class PermissionCacheTestCase(UserResourceTestCase):
+    resource_class = PagedUserResource
+    item_count = 20
+
+    def setUp(self):
+        super(PermissionCacheTestCase, self).setUp()
+        User.objects.bulk_create([User(username='permcache%s' % i) for i in range(self.item_count)])
+        self.normal_user = User.objects.create(username='permcachenormal')
+
+    def tearDown(self):
+        User.objects.filter(username__startswith='permcache').delete()
+        BulkPermissionBackend.checked[:] = []
+        super(PermissionCacheTestCase, self).tearDown()
+
+    def serialize_list(self):
+        endpoint = self.get_endpoint(dispatch=False, params={'q': 'permcache'})
+        self.serialize(endpoint, CollectionJSON)
+        for item in endpoint.state.get_resource_items():
+            item.get_link()
+
+    def test_permission_checks_are_memoized(self):
+        def uncached_has_perm(cache, perm, obj=None):
+            return cache.user.has_perm(perm, obj)
+
+        with patch.object(PermissionCache, 'has_perm', uncached_has_perm):
+            uncached_calls = count_calls(User, 'has_perm', self.serialize_list)[1]
+        calls = count_calls(User, 'has_perm', self.serialize_list)[1]
+        self.assertTrue(len(calls) < len(uncached_calls))
+        #one check per row and a handful of model level checks
+        self.assertTrue(len(calls) < self.item_count + 12, len(calls))
+
+    def test_cache_follows_user(self):
+        api_request = self.get_api_request()
+        cache = api_request.get_permission_cache()
+        self.assertTrue(api_request.has_perm('auth.change_user'))
+        self.assertTrue(api_request.get_permission_cache() is cache)
+        namespace_request = NamespaceAPIRequest(api_request)
+        self.assertTrue(namespace_request.get_permission_cache() is cache)
+
+        api_request.user = self.normal_user
+        self.assertFalse(api_request.has_perm('auth.change_user'))
+        self.assertFalse(api_request.get_permission_cache() is cache)
+
+    @override_settings(AUTHENTICATION_BACKENDS=['hyperadmin.tests.test_permissions.BulkPermissionBackend'])
+    def test_bulk_backend(self):
+        users = list(User.objects.filter(username__startswith='permcache'))
+        cache = PermissionCache(self.normal_user)
+        results = cache.has_perm_for_objects('auth.change_user', users)
+        self.assertEqual(results, [user.pk % 2 == 0 for user in users])
+        self.assertEqual(BulkPermissionBackend.checked, [len(users)])
+
+        calls = count_calls(User, 'has_perm', cache.has_perm, 'auth.change_user', users[0])[1]
+        self.assertEqual(calls, [])
+        cache.has_perm_for_objects('auth.change_user', users)
+        self.assertEqual(BulkPermissionBackend.checked, [len(users)])
+
@@ -60,11 +60,35 @@ class ResourceTestCase(URLReverseMixin, unittest.TestCase):
     def register_resource(self):
         raise NotImplementedError
 
-class ModelResourceTestCase(ResourceTestCase):
+class UserResourceTestCase(ResourceTestCase):
+    '''
+    Registers `resource_class` for the user model
+    '''
+    resource_class = UserResource
+    
     def register_resource(self):
-        self.site.register(User, UserResource, app_name='auth')
+        self.site.register(User, self.resource_class, app_name='auth')
         return self.site.registry[User]
     
+    def get_endpoint(self, name='list', dispatch=True, **kwargs):
+        '''
+        Returns the named endpoint bound to a new api request, dispatched
+        unless told otherwise
+        '''
+        api_request = self.get_api_request(**kwargs)
+        endpoint = self.resource.endpoints[name].fork(api_request=api_request)
+        if dispatch:
+            endpoint.dispatch_api(api_request)
+        return endpoint
+    
+    def serialize(self, endpoint, media_type_class, link=None):
+        adaptor = media_type_class(endpoint.api_request)
+        adaptor.detect_redirect = lambda link: False
+        if link is None:
+            link = endpoint.link_prototypes['list'].get_link()
+        return adaptor.serialize(content_type=media_type_class.recognized_media_types[0], link=link, state=endpoint.state)
+
+class ModelResourceTestCase(UserResourceTestCase):
     def test_get_url_name(self):
         urlname = self.resource.get_url_name()
         self.assertEqual(urlname, 'admin_auth_user_resource')
@@ -430,3 +454,18 @@ class AuthenticationResourceTestCase(ResourceTestCase):
         #with state.push_session(self.popped_states):
         #    self.assertFalse(state['authenticated'])
 
+class CompiledModelResourceTestCase(ModelResourceTestCase):
+    def setUp(self):
+        super(CompiledModelResourceTestCase, self).setUp()
+        self.site.compile_endpoints = True
+    
+    def test_negative_primary_key(self):
+        try:
+            super(CompiledModelResourceTestCase, self).test_negative_primary_key()
+        finally:
+            User.objects.filter(pk=-1).delete()
+
+class CompiledInlineModelResourceTestCase(InlineModelResourceTestCase):
+    def setUp(self):
+        super(CompiledInlineModelResourceTestCase, self).setUp()
+        self.site.compile_endpoints = True
@@ -0,0 +1,64 @@
+from copy import copy
+
+from hyperadmin.apirequests import NamespaceAPIRequest
+
+from test_resources import UserResourceTestCase
+
+
+class StateLookupTestCase(UserResourceTestCase):
+    depth = 10
+
+    def get_namespace_state(self):
+        api_request = self.get_api_request()
+        api_request.session_state['root_key'] = 'root'
+        for i in range(self.depth):
+            api_request = NamespaceAPIRequest(api_request)
+        endpoint = api_request.get_endpoint(self.resource.endpoints['list'].get_url_name())
+        return endpoint.state
+
+    def test_writes_to_any_layer_invalidate(self):
+        state = self.get_namespace_state()
+        session_state = state.endpoint.api_request.session_state
+        root_state = session_state
+        while root_state.substates:
+            root_state = root_state.substates[0]
+        self.assertEqual(state['root_key'], 'root')
+
+        root_state['root_key'] = 'changed'
+        self.assertEqual(state['root_key'], 'changed')
+        session_state['root_key'] = 'shadowed'
+        self.assertEqual(state['root_key'], 'shadowed')
+        del session_state['root_key']
+        self.assertEqual(state['root_key'], 'changed')
+        root_state.pop('root_key')
+        self.assertFalse('root_key' in state)
+
+        version = state.version
+        state.update({'root_key': 'active'})
+        self.assertEqual(state['root_key'], 'active')
+        self.assertTrue(state.version > version)
+
+    def test_copies_read_through(self):
+        state = self.get_namespace_state()
+        state_copy = copy(state)
+        self.assertTrue(state_copy._cacheable)
+        state['copied_key'] = 1
+        self.assertEqual(state_copy['copied_key'], 1)
+        state_copy['copied_key'] = 2
+        self.assertEqual(state['copied_key'], 1)
+        self.assertEqual(state_copy.get('missing_key', 3), 3)
+
+    def test_copies_are_flat(self):
+        state = self.get_namespace_state()
+        state['copied_key'] = 1
+        state_copy = state
+        for i in range(self.depth):
+            state_copy = copy(state_copy)
+        self.assertTrue(state_copy._cacheable)
+        self.assertEqual(len(state_copy.substates), len(state.substates) + self.depth)
+        self.assertEqual(state_copy.substates[self.depth:], state.substates)
+        self.assertEqual(state_copy['copied_key'], 1)
+        state['copied_key'] = 2
+        self.assertEqual(state_copy['copied_key'], 2)
+        del state['copied_key']
+        self.assertFalse('copied_key' in state_copy)
@@ -0,0 +1,92 @@
+from django.core.urlresolvers import RegexURLResolver
+from django.utils.datastructures import MultiValueDict
+
+from hyperadmin.endpoints import RootEndpoint
+from hyperadmin.urltemplates import URLTemplateTable
+
+from common import count_calls
+from test_resources import UserResourceTestCase
+
+from mock import patch
+
+
+class MountedRoot(object):
+    '''
+    Stands in for a root endpoint whose urls are included under prefix
+    '''
+    def __init__(self, site, resolver, prefix):
+        self.urlpatterns = site.get_urls()
+        self.resolver = resolver
+        self.prefix = prefix
+
+    def django_reverse(self, name, *args, **kwargs):
+        return self.prefix + self.resolver.reverse(name, *args, **kwargs)
+
+class URLTemplateTestCase(UserResourceTestCase):
+    def get_table(self, prefix='/hyper-admin/'):
+        return URLTemplateTable(MountedRoot(self.site, self.resolver, prefix))
+
+    def test_templates_match_reverse(self):
+        table = self.get_table()
+        root = table.root_endpoint
+        detail_name = self.resource.endpoints['detail'].get_url_name()
+        list_name = self.resource.endpoints['list'].get_url_name()
+        for i in range(2):
+            self.assertEqual(table.reverse(list_name), root.django_reverse(list_name))
+            for pk in (1, 25, -1):
+                self.assertEqual(table.reverse(detail_name, pk=pk), root.django_reverse(detail_name, pk=pk))
+        self.assertEqual(table.prefix, 'hyper-admin/')
+        self.assertTrue(detail_name in table.verified)
+
+    def test_inline_templates_match_reverse(self):
+        table = self.get_table()
+        root = table.root_endpoint
+        inline = self.resource.inline_instances[0]
+        list_name = inline.endpoints['list'].get_url_name()
+        for pk in (1, 25, -1):
+            self.assertEqual(table.reverse(list_name, pk=pk), root.django_reverse(list_name, pk=pk))
+            for name in ('detail', 'delete'):
+                url_name = inline.endpoints[name].get_url_name()
+                for inline_pk in (1, 30):
+                    self.assertEqual(table.reverse(url_name, pk=pk, inline_pk=inline_pk),
+                                     root.django_reverse(url_name, pk=pk, inline_pk=inline_pk))
+        self.assertEqual(table.reverse(inline.endpoints['detail'].get_url_name(), pk=1), None)
+        self.assertEqual(table.reverse(inline.endpoints['detail'].get_url_name(), pk=1, inline_pk=-1), None)
+        self.assertTrue(list_name in table.verified)
+
+    def test_unmatched_kwargs_fall_back(self):
+        table = self.get_table()
+        detail_name = self.resource.endpoints['detail'].get_url_name()
+        self.assertEqual(table.reverse(detail_name, pk='abc'), None)
+        self.assertEqual(table.reverse(detail_name), None)
+        self.assertEqual(table.reverse('unknown_url_name'), None)
+
+    def test_entries_without_defaults_fall_back(self):
+        table = self.get_table()
+        detail_name = self.resource.endpoints['detail'].get_url_name()
+        lookups = MultiValueDict()
+        resolver = RegexURLResolver(r'^', self.site.get_urls())
+        for name in resolver.reverse_dict.keys():
+            for entry in resolver.reverse_dict.getlist(name):
+                lookups.appendlist(name, entry[:2])
+        #reverse_dict entries of django 1.3
+        with patch.object(RegexURLResolver, 'reverse_dict', lookups):
+            self.assertEqual(table.reverse(detail_name, pk=1), None)
+        self.assertEqual(table.templates[detail_name], None)
+
+    def test_mismatched_templates_are_disabled(self):
+        table = self.get_table()
+        detail_name = self.resource.endpoints['detail'].get_url_name()
+        table.root_endpoint.django_reverse = lambda name, **kwargs: '/elsewhere/'
+        self.assertEqual(table.reverse(detail_name, pk=1), '/elsewhere/')
+        self.assertEqual(table.reverse(detail_name, pk=1), None)
+
+    def test_site_reverse_uses_templates(self):
+        root = self.get_table().root_endpoint
+        detail_name = self.resource.endpoints['detail'].get_url_name()
+        reverse = self._orignal_root_reverse
+        django_reverse = lambda site, name, *args, **kwargs: root.django_reverse(name, *args, **kwargs)
+        with patch.object(RootEndpoint, 'django_reverse', django_reverse):
+            self.assertEqual(reverse(self.site, detail_name, pk=1), '/hyper-admin/auth/user/1/')
+            calls = count_calls(RootEndpoint, 'django_reverse', reverse, self.site, detail_name, pk=1)[1]
+        self.assertEqual(calls, [])
@@ -0,0 +1,84 @@
+import time
+try:
+    from collections import OrderedDict
+except ImportError:
+    #python 2.6
+    from django.utils.datastructures import SortedDict as OrderedDict
+
+
+class Phase(object):
+    """
+    Context manager that adds the time spent in its block to a phase of a
+    timer. Reentering a phase that is already being timed is not counted
+    twice.
+    """
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        if self.name not in self.timer.active:
+            self.timer.active.add(self.name)
+            self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.start is not None:
+            self.timer.active.discard(self.name)
+            self.timer.record(self.name, time.time() - self.start)
+            self.start = None
+        return False
+
+class NullPhase(object):
+    """
+    Context manager used when timing is disabled
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+NULL_PHASE = NullPhase()
+
+class PhaseTimer(object):
+    """
+    Accumulates the time spent in the named phases of an api request
+    """
+    phase_class = Phase
+
+    def __init__(self):
+        self.phases = OrderedDict()
+        self.active = set()
+
+    def phase(self, name):
+        return self.phase_class(self, name)
+
+    def record(self, name, seconds):
+        count, total = self.phases.get(name, (0, 0.0))
+        self.phases[name] = (count + 1, total + seconds)
+
+    def get_timings(self):
+        """
+        Returns a list of dictionaries with the name, duration in
+        milliseconds and number of calls of each phase
+        """
+        timings = list()
+        for name, (count, seconds) in self.phases.iteritems():
+            timings.append({'name': name,
+                            'duration': seconds * 1000,
+                            'count': count,})
+        return timings
+
+    def get_server_timing(self):
+        """
+        Returns the value of a Server-Timing header
+        """
+        metrics = list()
+        for timing in self.get_timings():
+            metric = '%s;dur=%.3f' % (timing['name'], timing['duration'])
+            if timing['count'] > 1:
+                metric += ';desc="%s calls"' % timing['count']
+            metrics.append(metric)
+        return ', '.join(metrics)
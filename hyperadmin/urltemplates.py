@@ -0,0 +1,106 @@
+import re
+
+from django.core.urlresolvers import RegexURLResolver, get_script_prefix
+from django.utils.encoding import force_unicode, iri_to_uri
+
+
+class URLTemplate(object):
+    """
+    A url pattern normalized into a format string and the names of its params
+    """
+    def __init__(self, template, params, pattern):
+        self.template = template
+        self.params = frozenset(params)
+        self.regex = re.compile(u'^%s' % pattern, re.UNICODE)
+
+    def expand(self, kwargs):
+        """
+        Returns the path relative to the root endpoint or None if the
+        kwargs do not satisfy the pattern
+        """
+        if self.params != frozenset(kwargs):
+            return None
+        path = self.template % dict([(key, force_unicode(val)) for key, val in kwargs.iteritems()])
+        if not self.regex.search(path):
+            return None
+        return path
+
+class URLTemplateTable(object):
+    """
+    Maps the url names of a root endpoint to precompiled url templates so
+    that urls are built by string formatting instead of django's reverse.
+    The first url built for each url name is checked against reverse, names
+    that do not match fall back to reverse.
+    """
+    def __init__(self, root_endpoint):
+        self.root_endpoint = root_endpoint
+        self.clear()
+
+    def clear(self):
+        self.templates = None
+        self.prefix = None
+        self.verified = set()
+
+    def compile_templates(self):
+        """
+        Returns a dictionary mapping url names to a list of url templates
+        """
+        resolver = RegexURLResolver(r'^', self.root_endpoint.urlpatterns)
+        lookups = resolver.reverse_dict
+        templates = dict()
+        for name in lookups.keys():
+            if not isinstance(name, basestring):
+                continue
+            entries = list()
+            for entry in lookups.getlist(name):
+                #django 1.3 leaves the defaults out, those names use reverse
+                if len(entry) < 3 or entry[2]:
+                    entries = None
+                    break
+                possibilities, pattern = entry[:2]
+                for template, params in possibilities:
+                    entries.append(URLTemplate(template, params, pattern))
+            templates[name] = entries
+        return templates
+
+    def get_templates(self):
+        if self.templates is None:
+            self.templates = self.compile_templates()
+        return self.templates
+
+    def build_url(self, path):
+        return iri_to_uri(get_script_prefix() + self.prefix + path)
+
+    def verify(self, name, kwargs, path):
+        """
+        Compares the templated url with django's reverse, the mount prefix
+        of the root endpoint is learned from the first comparison
+        """
+        url = self.root_endpoint.django_reverse(name, **kwargs)
+        if self.prefix is None:
+            script_prefix = get_script_prefix()
+            local_url = iri_to_uri(path)
+            if url.startswith(script_prefix) and url.endswith(local_url):
+                self.prefix = url[len(script_prefix):len(url)-len(local_url)]
+        if self.prefix is not None and self.build_url(path) == url:
+            self.verified.add(name)
+        else:
+            self.templates[name] = None
+        return url
+
+    def reverse(self, name, **kwargs):
+        """
+        Returns the url for the url name or None if no template applies
+        """
+        templates = self.get_templates().get(name)
+        if not templates:
+            return None
+        for template in templates:
+            path = template.expand(kwargs)
+            if path is not None:
+                break
+        else:
+            return None
+        if name not in self.verified:
+            return self.verify(name, kwargs, path)
+        return self.build_url(path)
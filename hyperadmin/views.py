@@ -1,24 +1,110 @@
+import calendar
+import hashlib
+import time
+
 from django import http
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from django.utils.cache import add_never_cache_headers
+from django.utils.cache import add_never_cache_headers, patch_cache_control
+from django.utils.encoding import force_unicode
+from django.utils.http import http_date, parse_http_date_safe, parse_etags, quote_etag
 from django.utils.translation import ugettext_lazy as _
+try:
+    from django.utils.timezone import is_aware
+except ImportError:
+    #django < 1.4
+    def is_aware(value):
+        return value.tzinfo is not None and value.tzinfo.utcoffset(value) is not None
 
-from hyperadmin.links import Link
+from hyperadmin.links import BaseLink
 
 
 class ConditionalAccessMixin(object):
     etag_function = None
+    conditional_methods = ['GET', 'HEAD']
     
     def check_etag(self, data):
         new_etag = self.etag_function and self.etag_function(data)
         if not new_etag:
             return
         if self.request.META.get('HTTP_IF_NONE_MATCH', None) == new_etag:
-            raise http.HttpResponseNotModified()
+            return http.HttpResponseNotModified()
         if self.request.META.get('HTTP_IF_MATCH', new_etag) != new_etag:
-            raise http.HttpResponse(status=412) # Precondition Failed
-        
+            return http.HttpResponse(status=412) # Precondition Failed
+    
+    def get_etag_data(self):
+        """
+        Returns the values identifying the version of the response, None if
+        the response is not versioned
+        """
+        return None
+    
+    def get_etag(self):
+        """
+        Returns the entity tag of the response. The tag covers the version
+        data, the full path, the response media type and the permissions of
+        the user.
+        """
+        data = self.get_etag_data()
+        if data is None:
+            return None
+        if self.etag_function:
+            return self.etag_function(data)
+        api_request = self.api_request
+        parts = [api_request.get_full_path(), api_request.get_response_type(),
+                 api_request.get_permission_cache().get_fingerprint()] + list(data)
+        return hashlib.md5(u'|'.join([force_unicode(part) for part in parts]).encode('utf-8')).hexdigest()
+    
+    def get_last_modified(self):
+        """
+        Returns the datetime the response last changed or None
+        """
+        return None
+    
+    def get_validator_headers(self):
+        headers = dict()
+        etag = self.get_etag()
+        if etag:
+            headers['ETag'] = quote_etag(etag)
+        last_modified = self.get_last_modified()
+        if last_modified is not None:
+            if is_aware(last_modified):
+                seconds = calendar.timegm(last_modified.utctimetuple())
+            else:
+                seconds = time.mktime(last_modified.timetuple())
+            headers['Last-Modified'] = http_date(seconds)
+        return headers
+    
+    def is_not_modified(self, api_request, headers):
+        if_none_match = api_request.META.get('HTTP_IF_NONE_MATCH', None)
+        if if_none_match is not None:
+            #the etag takes precedence over the modification time
+            etags = parse_etags(if_none_match)
+            return 'ETag' in headers and ('*' in etags or headers['ETag'].strip('"') in etags)
+        if_modified_since = parse_http_date_safe(api_request.META.get('HTTP_IF_MODIFIED_SINCE', None) or '')
+        if if_modified_since is None or 'Last-Modified' not in headers:
+            return False
+        return parse_http_date_safe(headers['Last-Modified']) <= if_modified_since
+    
+    def get_conditional_response(self, api_request):
+        """
+        Returns a not modified response when the validators of the request
+        match the current version, before any items are built. The
+        validators are sent with the response otherwise.
+        """
+        if api_request.method not in self.conditional_methods:
+            return None
+        headers = self.get_validator_headers()
+        if not headers:
+            return None
+        self.state['validator_headers'] = headers
+        if self.is_not_modified(api_request, headers):
+            response = http.HttpResponseNotModified()
+            for header, value in headers.iteritems():
+                response[header] = value
+            return response
+        return None
+    
 class EndpointViewMixin(ConditionalAccessMixin):
     #state = None
     global_state = None
@@ -67,8 +153,12 @@ class EndpointViewMixin(ConditionalAccessMixin):
         Execute the api request
         :rtype: HttpResponse
         '''
+        timer = api_request.start_timer()
         response = self.generate_api_response(api_request)
-        return self.normalize_response(response)
+        response = self.normalize_response(response)
+        if timer is not None:
+            api_request.site.report_timings(api_request, self, response)
+        return response
     
     def generate_api_response(self, api_request):
         '''
@@ -83,30 +173,47 @@ class EndpointViewMixin(ConditionalAccessMixin):
         self.args = api_request.url_args
         self.kwargs = api_request.url_kwargs
         
-        self.initialize_state()
+        with api_request.time_phase('state'):
+            self.initialize_state()
         
         assert self.state is not None
         
-        self.common_state.update(self.get_common_state_data())
+        with api_request.time_phase('common-state'):
+            self.common_state.update(self.get_common_state_data())
         
-        permission_response = self.api_permission_check(api_request, self)
+        with api_request.time_phase('permission'):
+            permission_response = self.api_permission_check(api_request, self)
         if permission_response is not None:
             return permission_response
-        else:
-            return handler(api_request)
+        
+        with api_request.time_phase('conditional'):
+            not_modified_response = self.get_conditional_response(api_request)
+        if not_modified_response is not None:
+            return not_modified_response
+        return handler(api_request)
     
     def normalize_response(self, response_or_link):
         '''
         Converts a link response to an HttpResponse
         :rtype: HttpResponse
         '''
-        if isinstance(response_or_link, Link):
+        if isinstance(response_or_link, BaseLink):
             #TODO TemplateResponse with a link
             response = self.generate_response(response_or_link)
         else:
             response = response_or_link
+        validator_headers = self.state.get('validator_headers', None) if self.state is not None else None
+        if validator_headers and response.status_code == 200:
+            for header, value in validator_headers.iteritems():
+                response[header] = value
         if not self.cacheable and isinstance(response, http.HttpResponse):
             add_never_cache_headers(response)
+        elif not self.cacheable and getattr(response, 'streaming', False):
+            #the etag of add_never_cache_headers needs the whole content
+            response['Expires'] = http_date()
+            if not response.has_header('Last-Modified'):
+                response['Last-Modified'] = response['Expires']
+            patch_cache_control(response, max_age=0)
         return response
     
     def get_common_state_data(self):
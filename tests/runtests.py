@@ -32,3 +32,13 @@ def runtests():
     sys.exitfunc = lambda: 0
 
     sys.exit(failures)
+
+def runbenchmarks():
+    """Runs the benchmarks of hyperadmin.tests.benchmarks, they are not part of the test suite."""
+    import logging
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    import django.test.utils
+    runner_class = django.test.utils.get_runner(settings)
+    test_runner = runner_class(verbosity=1, interactive=True)
+    failures = test_runner.run_tests(['hyperadmin.tests.benchmarks'])
+    sys.exit(failures)
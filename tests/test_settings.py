@@ -120,6 +120,7 @@ INSTALLED_APPS = [
     
     'hyperadmin',
     'hyperadmin.contrib.apikey',
+    'hyperadmin.contrib.search',
     # Uncomment the next line to enable the admin:
     'django.contrib.admin',
     # Uncomment the next line to enable admin documentation: